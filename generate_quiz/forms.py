@@ -13,10 +13,15 @@ class QuizCreationForm(forms.ModelForm):
         initial=10,
         help_text="How many questions should the AI generate?"
     )
+    use_question_bank = forms.BooleanField(
+        required=False,
+        initial=True,
+        help_text="Reuse questions generated earlier from similar notes; only the rest are generated."
+    )
 
     class Meta:
         model = Quiz
-        fields = ['title', 'difficulty', 'duration', 'topic_focus', 'num_questions']
+        fields = ['title', 'difficulty', 'duration', 'topic_focus', 'num_questions', 'use_question_bank']
         # no custom save() here — room_code is set in the view
 
 class ParticipantForm(forms.ModelForm):
@@ -45,5 +50,5 @@ class QuestionForm(forms.ModelForm):
 class QuizResultForm(forms.ModelForm):
     class Meta:
         model = QuizResult
-        fields = ['score', 'time_taken', 'rank']
+        fields = ['score', 'time_taken']
 
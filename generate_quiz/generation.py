@@ -0,0 +1,296 @@
+"""
+Parallel, batched question generation.
+
+One prompt asking Gemini for up to 100 questions is slow, often hits output
+limits, and a single bad JSON item throws the whole quiz away. Instead the
+planner here:
+
+  - splits the N requested questions into batches of QUIZ_GENERATION_BATCH_SIZE,
+    each tied to its own contiguous section of the notes,
+  - runs the batches concurrently, at most QUIZ_GENERATION_CONCURRENCY at a time,
+  - streams each batch and parses it incrementally, so every question is
+    validated and handed off for storage as soon as its JSON object closes,
+  - retries only what a failed batch did not deliver (timeout, cut-off or
+    malformed output), keeping the questions it did produce,
+  - drops near-duplicate questions across batches.
+
+With enough concurrency, wall-clock time is set by one batch, not by N.
+"""
+import asyncio
+import json
+import logging
+import math
+import re
+from contextlib import aclosing
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 10
+CONCURRENCY = 5
+MAX_ATTEMPTS = 3
+DUPLICATE_RATIO = 0.85
+FLUSH_EVERY = 5           # questions handed to on_questions per call
+
+
+@dataclass
+class Batch:
+    index: int
+    section: str
+    count: int
+
+
+class QuestionStreamParser:
+    """
+    Incremental, fault-tolerant scanner for a streamed JSON array of objects.
+
+    feed() accepts arbitrary text chunks and returns every top-level {...}
+    object that closed within them. Anything between objects (the array
+    brackets, commas, markdown fences, chatter) is ignored. An object that does
+    not parse, even after dropping trailing commas, is counted in `malformed`
+    and skipped; it does not affect the others.
+    """
+
+    def __init__(self):
+        self.malformed = 0
+        self._buf = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text):
+        objects = []
+        for ch in text:
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth, self._buf = 1, [ch]
+                continue
+            self._buf.append(ch)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    obj = self._load("".join(self._buf))
+                    if obj is not None:
+                        objects.append(obj)
+        return objects
+
+    def _load(self, raw):
+        for candidate in (raw, re.sub(r",\s*([}\]])", r"\1", raw)):
+            try:
+                return json.loads(candidate)
+            except ValueError:
+                continue
+        self.malformed += 1
+        return None
+
+
+def normalize_question(item):
+    """
+    Coerce a model-produced item into {"question", "options"[4], "answer_index"},
+    or None if it can't be salvaged. Accepts the answer as an index, the option
+    text, a digit string or a letter, and trims extra options down to four
+    while keeping the correct one.
+    """
+    if not isinstance(item, dict):
+        return None
+    question = str(item.get("question") or "").strip()
+    options = [str(o).strip() for o in (item.get("options") or []) if str(o).strip()]
+    answer = item.get("answer_index", item.get("answer"))
+
+    idx = None
+    if isinstance(answer, int) and not isinstance(answer, bool):
+        idx = answer
+    elif isinstance(answer, str):
+        a = answer.strip()
+        lowered = [o.lower() for o in options]
+        if a.lower() in lowered:
+            idx = lowered.index(a.lower())
+        elif a.isdigit():
+            idx = int(a)
+        elif len(a) == 1 and a.isalpha():
+            idx = ord(a.upper()) - ord("A")
+
+    if not question or idx is None or len(options) < 4 or not 0 <= idx < len(options):
+        return None
+    if len(options) > 4:
+        correct = options[idx]
+        distractors = [o for i, o in enumerate(options) if i != idx][:3]
+        idx = min(idx, 3)
+        options = distractors[:idx] + [correct] + distractors[idx:]
+    return {"question": question, "options": options, "answer_index": idx}
+
+
+def is_valid_question(item):
+    if not isinstance(item, dict):
+        return False
+    q = str(item.get("question", "")).strip()
+    opts = item.get("options", [])
+    ans_idx = item.get("answer_index", None)
+    return bool(q and isinstance(opts, list) and len(opts) == 4
+                and isinstance(ans_idx, int) and 0 <= ans_idx <= 3)
+
+
+def split_sections(notes_text, parts):
+    """Split notes into `parts` contiguous, roughly equal-sized sections on paragraph breaks."""
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", notes_text) if p.strip()]
+    if len(paragraphs) < parts:
+        # Too few paragraphs to go around: fall back to fixed-size slices of the text.
+        size = max(1, math.ceil(len(notes_text) / parts))
+        paragraphs = [notes_text[i:i + size] for i in range(0, len(notes_text), size)]
+    target = sum(len(p) for p in paragraphs) / parts
+    sections, current, current_len = [], [], 0
+    for p in paragraphs:
+        current.append(p)
+        current_len += len(p)
+        if current_len >= target and len(sections) < parts - 1:
+            sections.append("\n\n".join(current))
+            current, current_len = [], 0
+    if current:
+        sections.append("\n\n".join(current))
+    # Fewer sections than batches (tiny notes): batches share sections round-robin.
+    return [sections[i % len(sections)] for i in range(parts)]
+
+
+def plan_batches(notes_text, num_questions, batch_size=None):
+    batch_size = batch_size or getattr(settings, "QUIZ_GENERATION_BATCH_SIZE", BATCH_SIZE)
+    n = max(1, math.ceil(num_questions / batch_size))
+    sections = split_sections(notes_text, n)
+    base, extra = divmod(num_questions, n)
+    return [Batch(i, sections[i], base + (1 if i < extra else 0)) for i in range(n)]
+
+
+def _normalize(text):
+    return re.sub(r"[^\w\s]", " ", str(text).lower()).split()
+
+
+def _is_duplicate(norm, seen, ratio):
+    return any(norm == s or SequenceMatcher(None, norm, s).ratio() >= ratio for s in seen)
+
+
+def dedupe_questions(items, ratio=DUPLICATE_RATIO):
+    """
+    Keep the first of any group of near-identical questions. Similarity is
+    measured on words, so "What is X?" and "What is Y?" stay distinct.
+    """
+    kept, seen = [], []
+    for item in items:
+        norm = _normalize(item.get("question", ""))
+        if _is_duplicate(norm, seen, ratio):
+            continue
+        seen.append(norm)
+        kept.append(item)
+    return kept
+
+
+async def generate_questions(
+    notes_text,
+    num_questions,
+    *,
+    build_prompt,
+    stream_model,
+    on_questions,
+    concurrency=None,
+    max_attempts=MAX_ATTEMPTS,
+    exclude=(),
+):
+    """
+    Generate up to `num_questions` validated, de-duplicated questions, handing
+    them to `on_questions` in small groups as they stream in. Returns the
+    number of questions `on_questions` accepted; if it raises, generation
+    stops and the error reaches the caller.
+
+    build_prompt(section, count) -> str
+    stream_model(prompt)         -> async iterator of response text chunks
+    on_questions(items)          -> awaitable, called with lists of question dicts
+    exclude                      -> question texts already in the quiz (e.g. from the bank);
+                                    near-duplicates of them are dropped
+    """
+    concurrency = concurrency or getattr(settings, "QUIZ_GENERATION_CONCURRENCY", CONCURRENCY)
+    limit = asyncio.Semaphore(concurrency)
+    seen, pending = [_normalize(q) for q in exclude], []
+    accepted = delivered = 0      # queued towards the quota / handed over to on_questions
+    delivery_error = None
+    flush_lock = asyncio.Lock()
+
+    async def flush(force=False):
+        nonlocal pending, delivered, delivery_error
+        async with flush_lock:
+            if delivery_error is not None:
+                raise delivery_error
+            if pending and (force or len(pending) >= FLUSH_EVERY):
+                items, pending = pending, []
+                try:
+                    await on_questions(items)
+                except Exception as e:
+                    delivery_error = e
+                    raise
+                delivered += len(items)
+
+    def accept(item):
+        """Validate, de-duplicate and queue one parsed item; True if kept."""
+        nonlocal accepted
+        item = normalize_question(item)
+        if item is None or accepted >= num_questions:
+            return False
+        norm = _normalize(item["question"])
+        if _is_duplicate(norm, seen, DUPLICATE_RATIO):
+            return False
+        seen.append(norm)
+        pending.append(item)
+        accepted += 1
+        return True
+
+    batches = plan_batches(notes_text, num_questions)
+    remaining = {b.index: b.count for b in batches}
+
+    async def run(batch):
+        """Stream one batch, counting each kept question off its quota as it lands."""
+        parser = QuestionStreamParser()
+        kept = 0
+        async with limit, aclosing(stream_model(build_prompt(batch.section, remaining[batch.index]))) as stream:
+            async for text in stream:
+                taken = sum(accept(obj) for obj in parser.feed(text))
+                remaining[batch.index] = max(0, remaining[batch.index] - taken)
+                kept += taken
+                await flush()
+                if remaining[batch.index] == 0 or accepted >= num_questions:
+                    break
+        if parser.malformed:
+            logger.info("Question batch %d: skipped %d malformed items", batch.index, parser.malformed)
+        if not kept:
+            raise ValueError("no valid questions in batch")
+
+    last_error = None
+    for attempt in range(1, max_attempts + 1):
+        # Whatever a failed batch streamed before failing is already kept;
+        # the retry only asks for the rest of its quota.
+        todo = [b for b in batches if remaining[b.index] > 0]
+        if not todo or accepted >= num_questions:
+            break
+        results = await asyncio.gather(*(run(b) for b in todo), return_exceptions=True)
+        if delivery_error is not None:
+            # on_questions failed, not the model: stop rather than retry.
+            raise delivery_error
+        for batch, result in zip(todo, results):
+            if isinstance(result, BaseException):
+                logger.warning("Question batch %d failed (attempt %d): %s", batch.index, attempt, result)
+                last_error = result
+    await flush(force=True)
+
+    if delivered == 0 and last_error is not None:
+        raise last_error
+    return delivered
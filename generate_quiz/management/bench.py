@@ -0,0 +1,22 @@
+"""Shared helpers for the benchmark management commands."""
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[idx]
+
+
+def latency_stats(latencies, wall):
+    """Summarize request latencies (seconds) measured over `wall` seconds."""
+    ms = sorted(v * 1000 for v in latencies)
+    return {
+        "requests": len(ms),
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+        "max_ms": ms[-1] if ms else 0.0,
+        "wall_s": wall,
+        "throughput_rps": len(ms) / wall if wall else 0.0,
+    }
@@ -0,0 +1,154 @@
+"""
+Deadline-burst benchmark for submit_quiz.
+
+Fires N concurrent submits at one room (everyone's timer expiring at once) and
+reports submit latency percentiles through the write-behind buffer and,
+with --mode both, again with inline writes (very slow on SQLite, where
+concurrent writers serialize on the database lock). Runs against a throwaway
+test database.
+
+    python manage.py bench_submit --participants 1000
+    python manage.py bench_submit --mode both --participants 200 --json bench_submit.json
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from generate_quiz.management.bench import latency_stats
+from generate_quiz.models import Participant, Question, Quiz, QuizResult
+from generate_quiz.room_state import RUNNING, set_room_state
+from users.models import CustomUser
+
+ROOM_CODE = "900001"
+
+
+class Command(BaseCommand):
+    help = "Benchmark submit_quiz latency under a deadline burst of concurrent submits."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--participants", type=int, default=1000)
+        parser.add_argument("--concurrency", type=int, default=1000,
+                            help="Maximum submits in flight at once.")
+        parser.add_argument("--questions", type=int, default=20)
+        parser.add_argument("--mode", choices=["both", "write-behind", "inline"], default="write-behind")
+        parser.add_argument("--json", dest="json_path", help="Write results to this file as JSON.")
+
+    def handle(self, *args, **opts):
+        setup_test_environment()
+        # Keep benchmark traffic out of this host's /metrics snapshots and shared cache.
+        isolated_settings = override_settings(METRICS_DIR=tempfile.mkdtemp(), CACHES={"default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": tempfile.mkdtemp(),
+        }})
+        isolated_settings.enable()
+        if connection.vendor == "sqlite":
+            # A file database so every request thread gets a real connection.
+            connection.settings_dict["TEST"]["NAME"] = os.path.join(tempfile.mkdtemp(), "bench_submit.sqlite3")
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            clients, quiz = self._setup(opts["participants"], opts["questions"])
+            modes = ["write-behind", "inline"] if opts["mode"] == "both" else [opts["mode"]]
+            report = {
+                "participants": opts["participants"],
+                "concurrency": opts["concurrency"],
+                "questions": opts["questions"],
+                "database": connection.vendor,
+                "runs": {},
+            }
+            for mode in modes:
+                self._reset(quiz)
+                with override_settings(QUIZ_RESULT_WRITE_BEHIND=(mode == "write-behind")):
+                    stats = self._burst(clients, quiz, opts["concurrency"])
+                report["runs"][mode] = stats
+                self.stdout.write(
+                    f"{mode:>12}: n={stats['requests']} errors={stats['errors']} "
+                    f"p50={stats['p50_ms']:.1f}ms p95={stats['p95_ms']:.1f}ms "
+                    f"p99={stats['p99_ms']:.1f}ms max={stats['max_ms']:.1f}ms "
+                    f"wall={stats['wall_s']:.2f}s stored={stats['stored']}"
+                )
+            if opts["json_path"]:
+                with open(opts["json_path"], "w") as fh:
+                    json.dump(report, fh, indent=2)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            isolated_settings.disable()
+
+    def _setup(self, participants, num_questions):
+        creator = CustomUser.objects.create_user("bench_creator")
+        quiz = Quiz.objects.create(
+            creator=creator, title="Submit benchmark", difficulty=1, duration=10, room_code=ROOM_CODE,
+        )
+        Question.objects.bulk_create([
+            Question(quiz=quiz, text=f"Question {i}", option_a="a", option_b="b",
+                     option_c="c", option_d="d", correct_option="ABCD"[i % 4])
+            for i in range(num_questions)
+        ])
+        CustomUser.objects.bulk_create([CustomUser(username=f"bench_{i}") for i in range(participants)])
+        users = list(CustomUser.objects.filter(username__startswith="bench_").exclude(id=creator.id))
+        Participant.objects.bulk_create([Participant(quiz=quiz, user=u, name=u.username) for u in users])
+
+        question_ids = list(quiz.questions.order_by("id").values_list("id", flat=True))
+        clients = []
+        for n, user in enumerate(users):
+            client = Client()
+            client.force_login(user)
+            answers = {f"q_{qid}": "ABCD"[(n + i) % 4] for i, qid in enumerate(question_ids)}
+            clients.append((client, answers))
+        return clients, quiz
+
+    def _reset(self, quiz):
+        QuizResult.objects.filter(quiz=quiz).delete()
+        Participant.objects.filter(quiz=quiz).update(score=0, has_started=False)
+        cache.clear()
+        now = timezone.now()
+        set_room_state(quiz, RUNNING, started_at=now - timedelta(minutes=quiz.duration), ends_at=now)
+
+    def _burst(self, clients, quiz, concurrency):
+        url = reverse("submit_quiz", args=[quiz.room_code])
+        gate = threading.Event()
+        slots = threading.Semaphore(concurrency)
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def worker(client, answers):
+            gate.wait()
+            with slots:
+                started = time.perf_counter()
+                try:
+                    resp = client.post(url, answers)
+                    ok = resp.status_code == 302
+                except Exception as e:
+                    ok, resp = False, e
+                elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors.append(repr(resp))
+            connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=c) for c in clients]
+        for t in threads:
+            t.start()
+        wall_start = time.perf_counter()
+        gate.set()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - wall_start
+
+        return {
+            **latency_stats(latencies, wall),
+            "errors": len(errors),
+            "stored": QuizResult.objects.filter(quiz=quiz).count(),
+        }
@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from generate_quiz.room_codes import reclaim_room_codes
+
+
+class Command(BaseCommand):
+    help = "Return room codes of quizzes that finished before the retention window to the free pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None,
+                            help="Retention window in days (default: ROOM_CODE_RETENTION_DAYS).")
+
+    def handle(self, *args, **opts):
+        retention = timedelta(days=opts["days"]) if opts["days"] is not None else None
+        count = reclaim_room_codes(retention)
+        self.stdout.write(self.style.SUCCESS(f"Reclaimed {count} room code(s)."))
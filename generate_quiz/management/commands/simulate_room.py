@@ -0,0 +1,265 @@
+"""
+Load simulator for one live quiz room.
+
+Drives the whole multiplayer flow for N virtual participants, in order:
+
+    upload_notes (creator, stub LLM) -> join_quiz -> quiz_lobby_status polling
+    -> start_quiz (creator) -> quiz_page -> submit_quiz (deadline burst)
+    -> quiz_results_data polling
+
+Each phase fans out over threads with an in-process test client, against a
+throwaway test database, so no server or network is needed. Gemini is
+replaced by a stub that streams valid questions. Every endpoint reports
+latency percentiles, throughput and the DB queries its requests ran (counted
+with an execute wrapper on the request's own connection, so the write-behind
+flusher's batched writes are not included in submit_quiz).
+
+    python manage.py simulate_room --participants 200
+    python manage.py simulate_room --participants 1000 --json simulate_room.json
+"""
+import asyncio
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from generate_quiz import views
+from generate_quiz.management.bench import latency_stats
+from generate_quiz.models import Quiz, QuizResult
+from users.models import CustomUser
+
+NOTES = "\n\n".join(
+    f"Section {i}. Photosynthesis converts light energy into chemical energy stored in glucose."
+    for i in range(40)
+)
+
+
+class _StubChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class _StubResponse:
+    def __init__(self, text, delay):
+        self._text = text
+        self._delay = delay
+
+    async def __aiter__(self):
+        for i in range(0, len(self._text), 200):
+            if self._delay:
+                await asyncio.sleep(self._delay)
+            yield _StubChunk(self._text[i:i + 200])
+
+
+class StubGeminiModel:
+    """Streams `count` distinct, valid questions for whatever prompt it gets."""
+
+    def __init__(self, chunk_delay=0.0):
+        self.chunk_delay = chunk_delay
+
+    async def generate_content_async(self, prompt, stream=False):
+        count = int(prompt.split("Number of questions: ", 1)[1].split(".", 1)[0])
+        items = [
+            {
+                "question": f"Simulated question {random.getrandbits(48):x} {random.getrandbits(48):x}?",
+                "options": ["alpha", "beta", "gamma", "delta"],
+                "answer_index": random.randrange(4),
+            }
+            for _ in range(count)
+        ]
+        return _StubResponse(json.dumps(items), self.chunk_delay)
+
+
+class _Recorder:
+    """Per-endpoint latency, status and query-count samples from many threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.walls = defaultdict(float)
+
+    def call(self, endpoint, request, ok_statuses=(200, 302)):
+        count = 0
+
+        def counter(execute, sql, params, many, context):
+            nonlocal count
+            count += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(counter):
+                ok = request().status_code in ok_statuses
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies[endpoint].append(elapsed)
+            self.queries[endpoint].append(count)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def report(self):
+        endpoints = {}
+        for endpoint, latencies in self.latencies.items():
+            queries = self.queries[endpoint]
+            endpoints[endpoint] = {
+                **latency_stats(latencies, self.walls[endpoint]),
+                "errors": self.errors[endpoint],
+                "queries_total": sum(queries),
+                "queries_per_request": sum(queries) / len(queries),
+                "queries_max": max(queries),
+            }
+        return endpoints
+
+
+class Command(BaseCommand):
+    help = "Simulate N participants playing one live quiz room end to end and report per-endpoint load."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--participants", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=200,
+                            help="Maximum virtual users with a request in flight at once.")
+        parser.add_argument("--questions", type=int, default=20)
+        parser.add_argument("--lobby-polls", type=int, default=3,
+                            help="quiz_lobby_status polls per participant before the start.")
+        parser.add_argument("--results-polls", type=int, default=3,
+                            help="quiz_results_data polls per participant after submitting.")
+        parser.add_argument("--llm-delay", type=float, default=0.0,
+                            help="Seconds the stub LLM waits before each streamed chunk.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--json", dest="json_path", help="Write results to this file as JSON.")
+
+    def handle(self, *args, **opts):
+        random.seed(opts["seed"])
+        setup_test_environment()
+        # Keep benchmark traffic out of this host's /metrics snapshots and shared cache.
+        metrics_dir = override_settings(METRICS_DIR=tempfile.mkdtemp(), CACHES={"default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": tempfile.mkdtemp(),
+        }})
+        metrics_dir.enable()
+        if connection.vendor == "sqlite":
+            # A file database so every request thread gets a real connection.
+            connection.settings_dict["TEST"]["NAME"] = os.path.join(tempfile.mkdtemp(), "simulate_room.sqlite3")
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            cache.clear()
+            recorder = _Recorder()
+            started_at = timezone.now()
+            wall_start = time.perf_counter()
+            quiz = self._simulate(recorder, opts)
+            report = {
+                "started_at": started_at.isoformat(),
+                "participants": opts["participants"],
+                "concurrency": opts["concurrency"],
+                "questions": opts["questions"],
+                "lobby_polls": opts["lobby_polls"],
+                "results_polls": opts["results_polls"],
+                "database": connection.vendor,
+                "wall_s": time.perf_counter() - wall_start,
+                "questions_stored": quiz.questions.count() if quiz else 0,
+                "results_stored": QuizResult.objects.filter(quiz=quiz).count() if quiz else 0,
+                "endpoints": recorder.report(),
+            }
+            self._print(report)
+            if opts["json_path"]:
+                with open(opts["json_path"], "w") as fh:
+                    json.dump(report, fh, indent=2)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            metrics_dir.disable()
+
+    def _simulate(self, recorder, opts):
+        creator = CustomUser.objects.create_user("sim_creator")
+        CustomUser.objects.bulk_create([CustomUser(username=f"sim_{i}") for i in range(opts["participants"])])
+        users = list(CustomUser.objects.filter(username__startswith="sim_").exclude(id=creator.id))
+        creator_client = Client()
+        creator_client.force_login(creator)
+        clients = []
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            clients.append(client)
+
+        with mock.patch.object(views, "get_gemini_model", return_value=StubGeminiModel(opts["llm_delay"])):
+            self._phase(recorder, "upload_notes", [creator_client], 1, lambda c: c.post(
+                reverse("generate_quiz_create"),
+                {"title": "Simulated room", "difficulty": 2, "duration": 10,
+                 "num_questions": opts["questions"], "notes_text": NOTES},
+            ), ok_statuses=(302,))
+        quiz = Quiz.objects.filter(creator=creator).first()
+        if quiz is None:
+            self.stderr.write("Room creation failed; nothing to simulate.")
+            return None
+        code = quiz.room_code
+        concurrency = opts["concurrency"]
+
+        self._phase(recorder, "join_quiz", clients, concurrency, lambda c: c.post(
+            reverse("generate_quiz_join"), {"room_code": code, "name": "sim"},
+        ), ok_statuses=(302,))
+        lobby_url = reverse("quiz_lobby_status", args=[code])
+        self._phase(recorder, "quiz_lobby_status", clients, concurrency,
+                    lambda c: c.get(lobby_url), repeat=opts["lobby_polls"])
+        self._phase(recorder, "start_quiz", [creator_client], 1,
+                    lambda c: c.post(reverse("start_quiz", args=[code])), ok_statuses=(302,))
+        self._phase(recorder, "quiz_page", clients, concurrency,
+                    lambda c: c.get(reverse("quiz_page", args=[code])))
+
+        question_ids = list(quiz.questions.values_list("id", flat=True))
+        submit_url = reverse("submit_quiz", args=[code])
+        self._phase(recorder, "submit_quiz", clients, concurrency, lambda c: c.post(
+            submit_url, {f"q_{qid}": random.choice("ABCD") for qid in question_ids},
+        ), ok_statuses=(302,))
+        data_url = reverse("quiz_results_data", args=[quiz.id])
+        self._phase(recorder, "quiz_results_data", clients, concurrency,
+                    lambda c: c.get(data_url), repeat=opts["results_polls"])
+        return quiz
+
+    def _phase(self, recorder, endpoint, clients, concurrency, request, repeat=1, ok_statuses=(200,)):
+        """Every client runs `request` `repeat` times; all clients start together."""
+        gate = threading.Event()
+        slots = threading.Semaphore(concurrency)
+
+        def worker(client):
+            gate.wait()
+            for _ in range(repeat):
+                with slots:
+                    recorder.call(endpoint, lambda: request(client), ok_statuses)
+            connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(c,)) for c in clients]
+        for t in threads:
+            t.start()
+        started = time.perf_counter()
+        gate.set()
+        for t in threads:
+            t.join()
+        recorder.walls[endpoint] += time.perf_counter() - started
+
+    def _print(self, report):
+        self.stdout.write(
+            f"{report['participants']} participants, {report['questions_stored']} questions, "
+            f"{report['results_stored']} results stored, {report['wall_s']:.2f}s total ({report['database']})"
+        )
+        for endpoint, s in report["endpoints"].items():
+            self.stdout.write(
+                f"{endpoint:>18}: n={s['requests']} errors={s['errors']} "
+                f"p50={s['p50_ms']:.1f}ms p95={s['p95_ms']:.1f}ms p99={s['p99_ms']:.1f}ms "
+                f"rps={s['throughput_rps']:.1f} queries/req={s['queries_per_request']:.1f}"
+            )
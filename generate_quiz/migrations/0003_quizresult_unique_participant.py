@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:06
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def drop_duplicate_results(apps, schema_editor):
+    # update_or_create races could leave two rows per (quiz, participant); keep the latest.
+    QuizResult = apps.get_model("generate_quiz", "QuizResult")
+    dupes = (
+        QuizResult.objects.values("quiz_id", "participant_id")
+        .annotate(keep=Max("id"), n=models.Count("id"))
+        .filter(n__gt=1)
+    )
+    for d in dupes:
+        QuizResult.objects.filter(quiz_id=d["quiz_id"], participant_id=d["participant_id"]).exclude(id=d["keep"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generate_quiz', '0002_alter_quizresult_options_alter_participant_name_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_results, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='quizresult',
+            constraint=models.UniqueConstraint(fields=('quiz', 'participant'), name='uniq_result_per_participant'),
+        ),
+    ]
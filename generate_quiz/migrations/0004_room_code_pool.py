@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generate_quiz', '0003_quizresult_unique_participant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FreeRoomCode',
+            fields=[
+                ('code', models.CharField(max_length=6, primary_key=True, serialize=False)),
+                ('released_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['released_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RoomCodeAllocator',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('next_index', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='quiz',
+            name='room_code',
+            field=models.CharField(blank=True, max_length=6, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:20
+
+from django.db import migrations, models
+
+
+def mark_inactive_quizzes_ended(apps, schema_editor):
+    Quiz = apps.get_model("generate_quiz", "Quiz")
+    Quiz.objects.filter(is_active=False).update(state="ended")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generate_quiz', '0004_room_code_pool'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='state',
+            field=models.CharField(choices=[('lobby', 'Lobby'), ('running', 'Running'), ('ended', 'Ended'), ('aborted', 'Aborted')], default='lobby', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='state_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(mark_inactive_quizzes_ended, migrations.RunPython.noop),
+    ]
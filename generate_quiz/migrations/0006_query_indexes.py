@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:21
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def drop_duplicate_participants(apps, schema_editor):
+    # get_or_create races could leave two rows per (quiz, user); keep the first.
+    Participant = apps.get_model("generate_quiz", "Participant")
+    dupes = (
+        Participant.objects.values("quiz_id", "user_id")
+        .annotate(keep=Min("id"), n=models.Count("id"))
+        .filter(n__gt=1)
+    )
+    for d in dupes:
+        Participant.objects.filter(quiz_id=d["quiz_id"], user_id=d["user_id"]).exclude(id=d["keep"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generate_quiz', '0005_quiz_room_state'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='participant',
+            index=models.Index(fields=['quiz', 'joined_at'], name='participant_lobby_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(fields=['room_code', 'is_active'], name='quiz_code_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizresult',
+            index=models.Index(fields=['quiz', 'rank'], name='result_leaderboard_idx'),
+        ),
+        migrations.RunPython(drop_duplicate_participants, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='participant',
+            constraint=models.UniqueConstraint(fields=('quiz', 'user'), name='uniq_participant_per_user'),
+        ),
+    ]
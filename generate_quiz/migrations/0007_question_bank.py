@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generate_quiz', '0006_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionSource',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('embedding', models.BinaryField()),
+                ('embedding_tag', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('creator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='question_sources', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BankedQuestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('difficulty', models.IntegerField()),
+                ('text', models.TextField()),
+                ('option_a', models.CharField(max_length=255)),
+                ('option_b', models.CharField(max_length=255)),
+                ('option_c', models.CharField(max_length=255)),
+                ('option_d', models.CharField(max_length=255)),
+                ('correct_option', models.CharField(max_length=1)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('embedding', models.BinaryField()),
+                ('times_used', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='questions', to='generate_quiz.questionsource')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='questionsource',
+            constraint=models.UniqueConstraint(fields=('creator', 'content_hash'), name='uniq_source_per_creator'),
+        ),
+        migrations.AddIndex(
+            model_name='bankedquestion',
+            index=models.Index(fields=['source', 'difficulty'], name='bank_source_difficulty_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bankedquestion',
+            constraint=models.UniqueConstraint(fields=('source', 'content_hash'), name='uniq_banked_question'),
+        ),
+    ]
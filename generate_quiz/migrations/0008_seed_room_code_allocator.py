@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def seed_allocator(apps, schema_editor):
+    # The single cursor row room_codes._next_fresh() increments.
+    RoomCodeAllocator = apps.get_model("generate_quiz", "RoomCodeAllocator")
+    RoomCodeAllocator.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generate_quiz', '0007_question_bank'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_allocator, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generate_quiz', '0008_seed_room_code_allocator'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='quizresult',
+            options={'ordering': ['-score', 'time_taken']},
+        ),
+        migrations.RemoveIndex(
+            model_name='quizresult',
+            name='result_leaderboard_idx',
+        ),
+        migrations.RemoveField(
+            model_name='quizresult',
+            name='rank',
+        ),
+        migrations.AddIndex(
+            model_name='quizresult',
+            index=models.Index(fields=['quiz', '-score', 'time_taken'], name='result_leaderboard_idx'),
+        ),
+    ]
@@ -26,12 +26,33 @@ class Quiz(models.Model):
         null=True,
         help_text="Optional: Focus on specific topics"
     )
-    room_code = models.CharField(max_length=6, unique=True)
+    # Cleared (NULL) when a finished room's code is reclaimed for reuse, see room_codes.py;
+    # results are addressed by id, so they stay reachable.
+    room_code = models.CharField(max_length=6, unique=True, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(
         default=True,
         help_text="Indicates if the quiz is currently active"
     )
+    # Durable copy of the room lifecycle; the hot path reads it from the cache (room_state.py)
+    state = models.CharField(
+        max_length=10,
+        choices=[
+            ("lobby", "Lobby"),
+            ("running", "Running"),
+            ("ended", "Ended"),
+            ("aborted", "Aborted"),
+        ],
+        default="lobby",
+    )
+    started_at = models.DateTimeField(null=True, blank=True)
+    ends_at = models.DateTimeField(null=True, blank=True)
+    state_version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["room_code", "is_active"], name="quiz_code_active_idx"),  # join_quiz
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.room_code})"
@@ -50,6 +71,52 @@ class Question(models.Model):
         return self.text
 
 
+class QuestionSource(models.Model):
+    """Notes a creator generated questions from, fingerprinted for the question bank."""
+    creator = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="question_sources"
+    )
+    content_hash = models.CharField(max_length=64)
+    embedding = models.BinaryField()                   # float32, unit length
+    embedding_tag = models.CharField(max_length=64)    # backend that produced it, see notes/embedding_backends.py
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["creator", "content_hash"], name="uniq_source_per_creator"),
+        ]
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} ({self.creator_id})"
+
+
+class BankedQuestion(models.Model):
+    """A generated question kept for reuse when the same creator uploads similar notes."""
+    source = models.ForeignKey(QuestionSource, on_delete=models.CASCADE, related_name="questions")
+    difficulty = models.IntegerField()
+    text = models.TextField()
+    option_a = models.CharField(max_length=255)
+    option_b = models.CharField(max_length=255)
+    option_c = models.CharField(max_length=255)
+    option_d = models.CharField(max_length=255)
+    correct_option = models.CharField(max_length=1)
+    content_hash = models.CharField(max_length=64)
+    embedding = models.BinaryField()
+    times_used = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["source", "content_hash"], name="uniq_banked_question"),
+        ]
+        indexes = [
+            models.Index(fields=["source", "difficulty"], name="bank_source_difficulty_idx"),
+        ]
+
+    def __str__(self):
+        return self.text
+
+
 class Participant(models.Model):
     quiz = models.ForeignKey(
         Quiz, on_delete=models.CASCADE, related_name="generated_quiz_participations"
@@ -60,6 +127,15 @@ class Participant(models.Model):
     score = models.IntegerField(default=0)
     has_started = models.BooleanField(default=False)
 
+    class Meta:
+        constraints = [
+            # submit_quiz / leave_quiz look participants up by (quiz, user)
+            models.UniqueConstraint(fields=["quiz", "user"], name="uniq_participant_per_user"),
+        ]
+        indexes = [
+            models.Index(fields=["quiz", "joined_at"], name="participant_lobby_idx"),  # lobby ordering
+        ]
+
     def __str__(self):
         return f"{self.name} in {self.quiz.room_code}"
 
@@ -69,11 +145,36 @@ class QuizResult(models.Model):
     participant = models.ForeignKey(Participant, on_delete=models.CASCADE)
     score = models.IntegerField()
     time_taken = models.DurationField(null=True, blank=True)
-    rank = models.IntegerField(default=0)
 
     class Meta:
-        ordering = ["rank"]
+        # Leaderboard order; ranks are computed from it at read time (views._ranked_results).
+        ordering = ["-score", "time_taken"]
+        constraints = [
+            models.UniqueConstraint(fields=["quiz", "participant"], name="uniq_result_per_participant"),
+        ]
+        indexes = [
+            models.Index(fields=["quiz", "-score", "time_taken"], name="result_leaderboard_idx"),
+        ]
 
     def __str__(self):
         return f"{self.participant.name} - {self.score}"
 
+
+class RoomCodeAllocator(models.Model):
+    """Single-row cursor over a fixed permutation of the 6-digit code space."""
+    next_index = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"next room code index {self.next_index}"
+
+
+class FreeRoomCode(models.Model):
+    """A room code reclaimed from an expired quiz, handed out before fresh ones."""
+    code = models.CharField(max_length=6, primary_key=True)
+    released_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["released_at"]
+
+    def __str__(self):
+        return self.code
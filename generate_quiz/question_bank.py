@@ -0,0 +1,191 @@
+"""
+Per-creator question bank for live quizzes.
+
+Every question generated in upload_notes is kept as a BankedQuestion under a
+QuestionSource: a fingerprint of the notes it came from (a hash of the
+normalized text plus the mean embedding of a few sections). When the same
+creator uploads notes whose fingerprint matches a previous source (same hash,
+or cosine similarity >= QUESTION_BANK_SOURCE_SIMILARITY), draw() returns up to
+N of that source's questions at the quiz's difficulty:
+
+  - least used first, shuffled within equal use counts, so a teacher running
+    the same notes for several sections gets different questions while the
+    bank lasts
+  - near-duplicates (same content hash, or question embeddings with cosine
+    >= QUESTION_BANK_DUPLICATE_SIMILARITY) are dropped
+  - options are shuffled unless an option refers to the others by position
+
+Only the shortfall then goes to Gemini. Banks are private to their creator and
+only compare vectors produced by the same embedding backend.
+"""
+import hashlib
+import random
+import re
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db.models import F
+
+from notes import rag_utils
+from study_assistant.lazy import lazy_import
+
+from .generation import _normalize, normalize_question, split_sections
+from .models import BankedQuestion, QuestionSource
+
+np = lazy_import("numpy")
+
+SOURCE_SECTIONS = 8          # sections of the notes averaged into the source embedding
+SOURCE_SCAN_LIMIT = 200      # most recent sources of a creator compared against new notes
+MAX_SOURCES = 5              # best matching sources questions are drawn from
+SOURCE_SIMILARITY = 0.9
+DUPLICATE_SIMILARITY = 0.92
+# "All of the above", "Both A and B": order matters, keep the options as generated.
+_POSITIONAL = re.compile(r"\b(above|below)\b|\b[a-d] and [a-d]\b", re.IGNORECASE)
+
+
+@dataclass
+class Fingerprint:
+    content_hash: str
+    vector: "np.ndarray"
+    tag: str
+
+
+def _pack(vector):
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def _unpack(blob):
+    return np.frombuffer(bytes(blob), dtype=np.float32)
+
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def question_hash(item):
+    """Hash of a question's words and its option set, independent of option order."""
+    options = sorted(" ".join(_normalize(o)) for o in item["options"])
+    raw = "\x1f".join([" ".join(_normalize(item["question"]))] + options)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def fingerprint(notes_text, embeddings=None):
+    """Hash and embed notes so later uploads can be matched against them."""
+    embeddings = embeddings or rag_utils.get_hf_embeddings()
+    content_hash = hashlib.sha256(" ".join(notes_text.lower().split()).encode()).hexdigest()
+    # Whole paragraphs only: character slices would shift with any edit near the start.
+    paragraphs = sum(1 for p in re.split(r"\n\s*\n", notes_text) if p.strip())
+    sections = list(dict.fromkeys(split_sections(notes_text, max(1, min(SOURCE_SECTIONS, paragraphs)))))
+    vector = _unit(_unit(embeddings.embed_documents(sections)).mean(axis=0))
+    return Fingerprint(content_hash, vector, rag_utils._embeddings_tag(embeddings))
+
+
+def matching_sources(user_id, fp):
+    """Ids of this creator's sources that match `fp`, best first."""
+    threshold = getattr(settings, "QUESTION_BANK_SOURCE_SIMILARITY", SOURCE_SIMILARITY)
+    rows = list(
+        QuestionSource.objects.filter(creator_id=user_id, embedding_tag=fp.tag)
+        .order_by("-created_at").values_list("pk", "content_hash", "embedding")[:SOURCE_SCAN_LIMIT]
+    )
+    if not rows:
+        return []
+    scores = np.stack([_unpack(blob) for _, _, blob in rows]) @ fp.vector
+    ranked = sorted(
+        ((1.0 if h == fp.content_hash else float(score), pk) for (pk, h, _), score in zip(rows, scores)),
+        reverse=True,
+    )
+    return [pk for score, pk in ranked if score >= threshold][:MAX_SOURCES]
+
+
+def _as_item(question, shuffle_options):
+    options = [question.option_a, question.option_b, question.option_c, question.option_d]
+    answer = "ABCD".index(question.correct_option)
+    if shuffle_options and not any(_POSITIONAL.search(o) for o in options):
+        order = random.sample(range(4), 4)
+        options, answer = [options[i] for i in order], order.index(answer)
+    return normalize_question({"question": question.text, "options": options, "answer_index": answer})
+
+
+def draw(user_id, fp, count, difficulty, shuffle_options=True):
+    """Up to `count` distinct, validated questions from matching sources, as generation-style dicts."""
+    sources = matching_sources(user_id, fp)
+    if not sources or count <= 0:
+        return []
+    candidates = list(BankedQuestion.objects.filter(source_id__in=sources, difficulty=difficulty))
+    random.shuffle(candidates)
+    candidates.sort(key=lambda q: q.times_used)
+
+    threshold = getattr(settings, "QUESTION_BANK_DUPLICATE_SIMILARITY", DUPLICATE_SIMILARITY)
+    picked, items, hashes, vectors = [], [], set(), []
+    for question in candidates:
+        if len(items) >= count:
+            break
+        vector = _unpack(question.embedding)
+        if question.content_hash in hashes or (vectors and float(np.max(np.stack(vectors) @ vector)) >= threshold):
+            continue
+        item = _as_item(question, shuffle_options)
+        if item is None:
+            continue
+        picked.append(question.pk)
+        items.append(item)
+        hashes.add(question.content_hash)
+        vectors.append(vector)
+
+    BankedQuestion.objects.filter(pk__in=picked).update(times_used=F("times_used") + 1)
+    return items
+
+
+def _retag(source, fp, embeddings):
+    """The embedding backend changed since this source was banked: re-embed it and its questions."""
+    questions = list(source.questions.all())
+    if questions:
+        vectors = _unit(embeddings.embed_documents([q.text for q in questions]))
+        for question, vector in zip(questions, vectors):
+            question.embedding = _pack(vector)
+        BankedQuestion.objects.bulk_update(questions, ["embedding"])
+    source.embedding, source.embedding_tag = _pack(fp.vector), fp.tag
+    source.save(update_fields=["embedding", "embedding_tag"])
+
+
+def add(user_id, fp, difficulty, items, embeddings=None):
+    """Bank freshly generated questions under the source `fp` describes. Returns how many were new."""
+    if not items:
+        return 0
+    embeddings = embeddings or rag_utils.get_hf_embeddings()
+    source, created = QuestionSource.objects.get_or_create(
+        creator_id=user_id, content_hash=fp.content_hash,
+        defaults={"embedding": _pack(fp.vector), "embedding_tag": fp.tag},
+    )
+    if not created and source.embedding_tag != fp.tag:
+        _retag(source, fp, embeddings)
+
+    known = set(source.questions.values_list("content_hash", flat=True))
+    fresh = {}
+    for item in items:
+        h = question_hash(item)
+        if h not in known:
+            fresh.setdefault(h, item)
+    if not fresh:
+        return 0
+    vectors = _unit(embeddings.embed_documents([it["question"] for it in fresh.values()]))
+    BankedQuestion.objects.bulk_create(
+        [
+            BankedQuestion(
+                source=source,
+                difficulty=difficulty,
+                text=it["question"],
+                option_a=it["options"][0],
+                option_b=it["options"][1],
+                option_c=it["options"][2],
+                option_d=it["options"][3],
+                correct_option="ABCD"[it["answer_index"]],
+                content_hash=h,
+                embedding=_pack(vector),
+            )
+            for (h, it), vector in zip(fresh.items(), vectors)
+        ],
+        ignore_conflicts=True,
+    )
+    return len(fresh)
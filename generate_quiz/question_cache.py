@@ -0,0 +1,53 @@
+"""
+Compiled question sets.
+
+Each room's questions are compiled once per question-set version and then
+served from process memory (bounded LRU) with the shared cache behind it.
+Versions live in room_state.room_cache, so a bump reaches every worker within
+room_state.LOCAL_TTL. Views read through compiled_questions(); writers
+(views._append_questions, and the Question signals for edits made elsewhere)
+call forget_compiled_questions().
+"""
+from study_assistant.tiered_cache import TieredCache
+
+from .models import Question
+from .room_state import room_cache
+
+QUESTIONS_TTL = 60 * 60 * 24
+LOCAL_MAX = 256  # compiled rooms kept in process memory
+
+QUESTION_FIELDS = ("id", "text", "option_a", "option_b", "option_c", "option_d")
+
+# Versioned question sets never change, so workers keep them in memory for the full TTL.
+compiled_cache = TieredCache(local_ttl=QUESTIONS_TTL, local_max=LOCAL_MAX)
+
+
+def _cache_key(quiz_id):
+    return f"quiz:{quiz_id}:questions"
+
+
+def compiled_questions(quiz_id):
+    """
+    Per-room question set:
+      - "questions": render payload for generate_quiz_quiz.html (no answers)
+      - "answer_key": ((question_id, correct_option), ...) used for scoring
+      - "version": the question-set version, also the quiz page's fragment key
+    """
+    name = _cache_key(quiz_id)
+    version = room_cache.version(name, QUESTIONS_TTL)
+    key = f"{name}:{version}"
+    compiled = compiled_cache.get(key)
+    if compiled is None:
+        rows = Question.objects.filter(quiz_id=quiz_id).order_by("id").values(*QUESTION_FIELDS, "correct_option")
+        questions, answer_key = [], []
+        for r in rows:
+            answer_key.append((r["id"], r.pop("correct_option")))
+            questions.append(r)
+        compiled = {"questions": tuple(questions), "answer_key": tuple(answer_key), "version": version}
+        compiled_cache.set(key, compiled, QUESTIONS_TTL)
+    return compiled
+
+
+def forget_compiled_questions(quiz_id):
+    """Move every worker to a new question-set version; the old one is never read again."""
+    room_cache.bump(_cache_key(quiz_id), QUESTIONS_TTL)
@@ -0,0 +1,216 @@
+"""
+Write-behind buffer for quiz submissions.
+
+When a room's timer runs out every participant auto-submits within about a
+second. Instead of one `update_or_create` + `participant.save()` per request,
+submissions are queued here and a single flusher thread writes them in batches
+(group commit):
+
+  - one `bulk_create(update_conflicts=True)` upsert for QuizResult rows
+  - one `bulk_update` for the matching Participant rows
+  - one leaderboard version bump per affected quiz
+
+A request is only acknowledged after the batch holding its result has been
+committed, so an acknowledged submit is durable. Async views use `asubmit`,
+which awaits the commit on the event loop instead of holding a thread, so a
+burst of submits under ASGI queues up together and shares one batch. If a batch fails, its rows are
+retried one by one, so a bad row (say, for a participant deleted mid-quiz) only
+fails its own submit. Resubmits are idempotent: the
+(quiz, participant) unique constraint turns them into an upsert of the same row,
+and duplicates inside one batch collapse to the latest submission.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import Participant, QuizResult
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingResult:
+    quiz_id: int
+    participant_id: int
+    score: int
+    time_taken: timedelta
+    done: threading.Event = field(default_factory=threading.Event)
+    error: Exception = None
+    superseded: list = field(default_factory=list)  # older queued submits this one replaced
+    future: asyncio.Future = None   # set by asubmit; resolved on its loop once committed
+
+    def acknowledge(self):
+        self.done.set()
+        if self.future is not None:
+            self.future.get_loop().call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ResultWriteBuffer:
+    def __init__(self, on_flush=None, max_batch=500, max_delay=0.02, ack_timeout=10.0):
+        self.on_flush = on_flush          # called with the set of quiz ids written in a batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay        # seconds to wait for a batch to fill up
+        self.ack_timeout = ack_timeout
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+
+    @property
+    def enabled(self):
+        return getattr(settings, "QUIZ_RESULT_WRITE_BEHIND", True)
+
+    def submit(self, quiz_id, participant_id, score, time_taken):
+        """Queue one result and block until it is committed."""
+        entry = PendingResult(quiz_id, participant_id, score, time_taken)
+        if not self.enabled:
+            self._write([entry])
+            return
+
+        self._enqueue(entry)
+        if not entry.done.wait(self.ack_timeout):
+            # Flusher is wedged; fall back to writing this result ourselves.
+            # Safe because the write is an idempotent upsert.
+            logger.warning("Result buffer flush timed out; writing quiz %s inline", quiz_id)
+            self._write([entry])
+            return
+        if entry.error is not None:
+            raise entry.error
+
+    async def asubmit(self, quiz_id, participant_id, score, time_taken):
+        """Queue one result and await its commit without tying up a thread."""
+        entry = PendingResult(quiz_id, participant_id, score, time_taken)
+        if not self.enabled:
+            await sync_to_async(self._write)([entry])
+            return
+
+        entry.future = asyncio.get_running_loop().create_future()
+        self._enqueue(entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(entry.future), self.ack_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Result buffer flush timed out; writing quiz %s inline", quiz_id)
+            await sync_to_async(self._write)([entry])
+            return
+        if entry.error is not None:
+            raise entry.error
+
+    def flush(self):
+        """Write everything queued right now in the calling thread."""
+        with self._cond:
+            batch = list(self._pending.values())
+            self._pending.clear()
+        if batch:
+            self._commit(batch)
+
+    # -----------------------------
+    # Internals
+    # -----------------------------
+    def _enqueue(self, entry):
+        with self._cond:
+            key = (entry.quiz_id, entry.participant_id)
+            previous = self._pending.get(key)
+            if previous is not None:
+                # Same participant resubmitted before the flush: the newer answer
+                # wins, and the older request is acknowledged with the same batch.
+                entry.superseded = previous.superseded + [previous]
+            self._pending[key] = entry
+            self._ensure_flusher()
+            self._cond.notify()
+
+    def _ensure_flusher(self):
+        # Threads don't survive a fork (gunicorn --preload), so track the owner pid.
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="quiz-result-flusher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.max_delay
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = list(self._pending.values())
+                self._pending.clear()
+
+            close_old_connections()
+            self._commit(batch)
+
+    def _commit(self, batch):
+        try:
+            try:
+                self._write_rows(batch)
+                written = batch
+            except Exception:
+                # One bad row (e.g. a participant deleted mid-quiz) must not fail
+                # everyone else's submit: retry the batch row by row.
+                logger.warning("Batch write of %d quiz results failed; retrying one by one", len(batch), exc_info=True)
+                written = []
+                for entry in batch:
+                    try:
+                        self._write_rows([entry])
+                    except Exception as e:
+                        logger.exception("Failed to write quiz %s result for participant %s",
+                                         entry.quiz_id, entry.participant_id)
+                        for waiter in (entry, *entry.superseded):
+                            waiter.error = e
+                    else:
+                        written.append(entry)
+            self._after_write(written)
+        finally:
+            for entry in batch:
+                for waiter in (entry, *entry.superseded):
+                    waiter.acknowledge()
+
+    def _write(self, batch):
+        self._write_rows(batch)
+        self._after_write(batch)
+
+    def _write_rows(self, batch):
+        with transaction.atomic():
+            QuizResult.objects.bulk_create(
+                [
+                    QuizResult(
+                        quiz_id=e.quiz_id,
+                        participant_id=e.participant_id,
+                        score=e.score,
+                        time_taken=e.time_taken,
+                    )
+                    for e in batch
+                ],
+                update_conflicts=True,
+                unique_fields=["quiz", "participant"],
+                update_fields=["score", "time_taken"],
+            )
+            Participant.objects.bulk_update(
+                [Participant(id=e.participant_id, score=e.score, has_started=True) for e in batch],
+                ["score", "has_started"],
+            )
+
+    def _after_write(self, batch):
+        if self.on_flush and batch:
+            # Results are already committed; a failed follow-up must not fail the submits.
+            try:
+                self.on_flush({e.quiz_id for e in batch})
+            except Exception:
+                logger.exception("Post-flush hook failed")
@@ -0,0 +1,155 @@
+"""
+Room-code allocation.
+
+Codes are handed out in O(1) without probing for collisions:
+
+  1. Codes reclaimed from finished quizzes (FreeRoomCode) are reused first.
+  2. Otherwise the next slot of a keyed pseudorandom permutation of
+     000000-999999 (a Feistel network) is taken
+     from a single-row cursor (RoomCodeAllocator). Every index maps to a
+     distinct code, so fresh codes never collide with each other.
+
+Both steps run in short transactions that lock one row, so concurrent quiz
+creation serializes on the allocator instead of failing on the unique index.
+A reclaimed code belongs to whoever deletes its FreeRoomCode row, which also
+holds on databases without row locks (SQLite).
+Results pages are addressed by quiz id, so a quiz's results stay reachable
+after its code has been reclaimed and handed to a new room.
+"""
+import hashlib
+import hmac
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import FreeRoomCode, Quiz, RoomCodeAllocator
+
+CODE_SPACE = 10 ** 6
+HALF = 10 ** 3          # Feistel halves: code = left * HALF + right
+ROUNDS = 8
+
+
+class RoomCodesExhausted(RuntimeError):
+    pass
+
+
+@lru_cache(maxsize=4)
+def _round_tables(key):
+    """One pseudorandom function per Feistel round, tabulated over a half (0-999)."""
+    return tuple(
+        tuple(
+            int.from_bytes(hmac.new(key, f"{r}:{x}".encode(), hashlib.sha256).digest()[:8], "big") % HALF
+            for x in range(HALF)
+        )
+        for r in range(ROUNDS)
+    )
+
+
+def _code_for_index(index):
+    """
+    Map allocator slot `index` to a code with a keyed Feistel network over the
+    two three-digit halves of 000000-999999. Each round is a bijection, so
+    distinct slots get distinct codes, and without the key (ROOM_CODE_KEY,
+    else SECRET_KEY) earlier codes say nothing useful about the next one. The halves cover the code space
+    exactly, so no cycle-walking is needed.
+    """
+    key = (settings.ROOM_CODE_KEY or settings.SECRET_KEY).encode()
+    left, right = divmod(index, HALF)
+    for table in _round_tables(key):
+        left, right = right, (left + table[right]) % HALF
+    return f"{left * HALF + right:06d}"
+
+
+def _peek_recycled():
+    return FreeRoomCode.objects.select_for_update(skip_locked=True).values_list("code", flat=True).first()
+
+
+def _pop_recycled():
+    while True:
+        with transaction.atomic():
+            code = _peek_recycled()
+            if code is None:
+                return None
+            # select_for_update is a no-op on SQLite, so two callers can read the
+            # same row; only the one whose delete removes it owns the code.
+            if FreeRoomCode.objects.filter(code=code).delete()[0] == 1:
+                return code
+
+
+def _claim_index():
+    return RoomCodeAllocator.objects.filter(pk=1, next_index__lt=CODE_SPACE).update(
+        next_index=F("next_index") + 1
+    )
+
+
+def _next_fresh():
+    with transaction.atomic():
+        # Increment first: the UPDATE takes the row (or, on SQLite, database)
+        # write lock before we read, so no two callers see the same index.
+        claimed = _claim_index()
+        if not claimed:
+            # The row is seeded by migration 0008; recreate it if it went missing.
+            _, created = RoomCodeAllocator.objects.get_or_create(pk=1)
+            if not created:
+                return None
+            claimed = _claim_index()
+        index = RoomCodeAllocator.objects.values_list("next_index", flat=True).get(pk=1) - 1
+    return _code_for_index(index)
+
+
+def allocate_room_code():
+    """Return a room code no quiz currently holds."""
+    reclaimed = False
+    while True:
+        code = _pop_recycled() or _next_fresh()
+        if code is None:
+            # Fresh space used up: sweep expired quizzes once before giving up.
+            if reclaimed or reclaim_room_codes() == 0:
+                raise RoomCodesExhausted("No free room codes left.")
+            reclaimed = True
+            continue
+        # Quizzes created before the allocator existed got random codes, which a
+        # slot can map to; skip those.
+        if not Quiz.objects.filter(room_code=code).exists():
+            return code
+
+
+def release_room_code(code):
+    """Return a code that was allocated but never used (e.g. generation failed)."""
+    if code:
+        FreeRoomCode.objects.get_or_create(code=code)
+
+
+def reclaim_room_codes(retention=None):
+    """
+    Free the codes of rooms that finished more than `retention` ago (default
+    ROOM_CODE_RETENTION_DAYS): ended or aborted, deactivated, or past their
+    end time. Lobbies and running rooms keep their code however old they are.
+    The old quiz and its results are kept; it simply no longer owns a room
+    code.
+    Returns the number of codes reclaimed.
+    """
+    if retention is None:
+        retention = timedelta(days=settings.ROOM_CODE_RETENTION_DAYS)
+    now = timezone.now()
+    cutoff = now - retention
+    finished = Q(state__in=("ended", "aborted")) | Q(is_active=False) | Q(ends_at__lt=now)
+    with transaction.atomic():
+        stale = (
+            Quiz.objects.select_for_update()
+            .filter(finished, room_code__isnull=False)
+            # Aborted lobbies never got an end time; they count from creation.
+            .alias(finished_at=Coalesce("ends_at", "created_at"))
+            .filter(finished_at__lt=cutoff)
+        )
+        codes = list(stale.values_list("room_code", flat=True))
+        if not codes:
+            return 0
+        Quiz.objects.filter(room_code__in=codes).update(room_code=None)
+        FreeRoomCode.objects.bulk_create([FreeRoomCode(code=c) for c in codes], ignore_conflicts=True)
+    return len(codes)
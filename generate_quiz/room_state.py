@@ -0,0 +1,106 @@
+"""
+Room lifecycle state.
+
+One compact record per quiz, (state, started_at, ends_at, version) with epoch
+timestamps, replaces the separate start/end/abort cache keys. Reads go through
+the two-tier cache (study_assistant/tiered_cache.py: per-process L1, then the
+cache shared by all workers), then the Quiz columns. So a request costs at most
+one shared-cache read, and an evicted cache entry is rebuilt from the database
+instead of making a running quiz vanish. Writes go to the Quiz row first and
+then to the cache; other workers see them within LOCAL_TTL.
+"""
+import time
+from typing import NamedTuple, Optional
+
+from django.db.models import F
+
+from study_assistant.tiered_cache import TieredCache
+
+from .models import Quiz
+
+LOBBY, RUNNING, ENDED, ABORTED = "lobby", "running", "ended", "aborted"
+
+STATE_TTL = 60 * 60 * 6   # shared cache; the DB is the fallback
+LOCAL_TTL = 1.0           # seconds a worker trusts its own copy
+LOCAL_MAX = 1024
+
+
+class RoomState(NamedTuple):
+    state: str
+    started_at: Optional[float]   # epoch seconds
+    ends_at: Optional[float]
+    version: int
+
+    @property
+    def aborted(self):
+        return self.state == ABORTED
+
+    @property
+    def started(self):
+        return self.started_at is not None and self.state in (RUNNING, ENDED)
+
+    def is_over(self, now=None):
+        if self.state == ENDED:
+            return True
+        return self.ends_at is not None and (now or time.time()) >= self.ends_at
+
+    def remaining_seconds(self, now=None):
+        if self.ends_at is None:
+            return 0
+        return max(0, int(self.ends_at - (now or time.time())))
+
+    def elapsed(self, now=None):
+        """Seconds since start, capped at the room's duration."""
+        if self.started_at is None:
+            return 0.0
+        now = now or time.time()
+        if self.ends_at is not None:
+            now = min(now, self.ends_at)
+        return max(0.0, now - self.started_at)
+
+
+room_cache = TieredCache(local_ttl=LOCAL_TTL, local_max=LOCAL_MAX)
+
+
+def _key(quiz_id):
+    return f"quiz:{quiz_id}:state"
+
+
+def _epoch(dt):
+    return dt.timestamp() if dt else None
+
+
+def _from_quiz(quiz):
+    return RoomState(quiz.state, _epoch(quiz.started_at), _epoch(quiz.ends_at), quiz.state_version)
+
+
+def get_room_state(quiz_id, quiz=None):
+    """
+    Current state of a room. Pass the Quiz instance when the caller already has
+    it so a cache miss doesn't cost another query.
+    """
+    cached = room_cache.get(_key(quiz_id))
+    if cached is not None:
+        return RoomState(*cached)
+    if quiz is None:
+        quiz = Quiz.objects.only("state", "started_at", "ends_at", "state_version").get(pk=quiz_id)
+    room_state = _from_quiz(quiz)
+    room_cache.set(_key(quiz_id), tuple(room_state), STATE_TTL)
+    return room_state
+
+
+def set_room_state(quiz, state, started_at=None, ends_at=None):
+    """Write-through transition: Quiz columns first, then the shared cache."""
+    fields = {"state": state, "state_version": F("state_version") + 1}
+    if started_at is not None:
+        fields["started_at"] = started_at
+    if ends_at is not None:
+        fields["ends_at"] = ends_at
+    if state in (ENDED, ABORTED):
+        fields["is_active"] = False
+    Quiz.objects.filter(pk=quiz.pk).update(**fields)
+    quiz.refresh_from_db(fields=["state", "started_at", "ends_at", "state_version", "is_active"])
+
+    room_state = _from_quiz(quiz)
+    room_cache.set(_key(quiz.pk), tuple(room_state), STATE_TTL)
+    return room_state
@@ -0,0 +1,16 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import question_cache
+from .models import Question
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def forget_compiled_questions(sender, instance, **kwargs):
+    # Edits outside _append_questions (admin, shell); bump after commit so no
+    # worker compiles the old rows under the new version.
+    transaction.on_commit(partial(question_cache.forget_compiled_questions, instance.quiz_id))
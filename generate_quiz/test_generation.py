@@ -0,0 +1,271 @@
+import asyncio
+import json
+
+from django.test import SimpleTestCase, override_settings
+
+from . import generation
+from .generation import (
+    QuestionStreamParser,
+    dedupe_questions,
+    generate_questions,
+    is_valid_question,
+    normalize_question,
+    plan_batches,
+)
+
+
+def _q(text, answer=0):
+    return {"question": text, "options": ["alpha", "beta", "gamma", "delta"], "answer_index": answer}
+
+
+def _json(item):
+    return json.dumps(item)
+
+
+class QuestionStreamParserTests(SimpleTestCase):
+    def test_object_split_across_chunks(self):
+        parser = QuestionStreamParser()
+        raw = "[" + _json(_q("What is heat?")) + "]"
+        objects = []
+        for i in range(0, len(raw), 7):
+            objects += parser.feed(raw[i:i + 7])
+        self.assertEqual(objects, [_q("What is heat?")])
+
+    def test_braces_and_escaped_quotes_inside_strings(self):
+        parser = QuestionStreamParser()
+        text = '{"question": "Is \\"{x}\\" a set } or {?", "options": ["a{", "}b", "c\\\\", "d"], "answer_index": 1}'
+        objects = parser.feed(text[:20]) + parser.feed(text[20:])
+        self.assertEqual(len(objects), 1)
+        self.assertEqual(objects[0]["question"], 'Is "{x}" a set } or {?')
+        self.assertEqual(objects[0]["options"][2], "c\\")
+
+    def test_malformed_object_is_skipped_without_losing_the_rest(self):
+        parser = QuestionStreamParser()
+        stream = "[" + _json(_q("First?")) + ', {"question": "Broken", "options": [oops]}, ' + _json(_q("Third?")) + "]"
+        self.assertEqual(parser.feed(stream), [_q("First?"), _q("Third?")])
+        self.assertEqual(parser.malformed, 1)
+
+    def test_trailing_commas_and_code_fences(self):
+        parser = QuestionStreamParser()
+        stream = ('```json\n[\n  {"question": "Fenced?", "options": ["a", "b", "c", "d",], '
+                  '"answer_index": 2,},\n]\n```')
+        self.assertEqual(parser.feed(stream), [
+            {"question": "Fenced?", "options": ["a", "b", "c", "d"], "answer_index": 2},
+        ])
+        self.assertEqual(parser.malformed, 0)
+
+
+class NormalizeQuestionTests(SimpleTestCase):
+    def test_answer_as_letter(self):
+        item = normalize_question({"question": "Q?", "options": ["w", "x", "y", "z"], "answer": "c"})
+        self.assertEqual(item["answer_index"], 2)
+
+    def test_answer_as_option_text(self):
+        item = normalize_question({"question": "Q?", "options": ["Water", "Fire", "Earth", "Air"], "answer": " fire "})
+        self.assertEqual(item["answer_index"], 1)
+
+    def test_extra_options_are_trimmed_keeping_the_answer(self):
+        item = normalize_question({"question": "Q?", "options": list("abcdef"), "answer_index": 5})
+        self.assertEqual(len(item["options"]), 4)
+        self.assertEqual(item["options"][item["answer_index"]], "f")
+
+    def test_unsalvageable_items(self):
+        self.assertIsNone(normalize_question({"question": "Q?", "options": ["a", "b", "c"], "answer_index": 0}))
+        self.assertIsNone(normalize_question({"question": "Q?", "options": list("abcd"), "answer_index": 4}))
+        self.assertIsNone(normalize_question({"question": "", "options": list("abcd"), "answer_index": 0}))
+        self.assertIsNone(normalize_question("not a dict"))
+
+    def test_is_valid_question(self):
+        self.assertTrue(is_valid_question(_q("Q?", 3)))
+        self.assertFalse(is_valid_question(_q("Q?", 4)))
+        self.assertFalse(is_valid_question({"question": "Q?", "options": ["a", "b"], "answer_index": 0}))
+        self.assertFalse(is_valid_question(dict(_q("Q?"), answer_index="0")))
+
+
+class PlanningTests(SimpleTestCase):
+    NOTES = "\n\n".join(f"Paragraph {i} " + "text " * 40 for i in range(12))
+
+    def test_plan_batches_splits_count_and_sections(self):
+        batches = plan_batches(self.NOTES, 23, batch_size=10)
+        self.assertEqual([b.count for b in batches], [8, 8, 7])
+        self.assertEqual(sum(b.count for b in batches), 23)
+        self.assertTrue(all(b.section for b in batches))
+        self.assertTrue(batches[0].section.startswith("Paragraph 0"))
+        self.assertNotEqual(batches[0].section, batches[1].section)
+
+    def test_dedupe_threshold(self):
+        items = [
+            {"question": "What is the first law of thermodynamics?"},
+            {"question": "What is the first law of thermodynamics ?"},         # punctuation only
+            {"question": "What is the first law of thermodynamics about?"},    # ratio ~0.93
+            {"question": "What is the second law of thermodynamics?"},         # ratio ~0.86
+            {"question": "Who formulated the second law of thermodynamics?"},  # ratio < 0.85
+        ]
+        kept = [it["question"] for it in dedupe_questions(items)]
+        self.assertEqual(kept, [items[0]["question"], items[4]["question"]])
+        self.assertEqual(len(dedupe_questions(items, ratio=0.99)), 4)
+
+
+class _FakeModel:
+    """Stub for stream_model: replies with questions numbered per prompt, split into small chunks."""
+
+    def __init__(self, fail_first=0, partial=0):
+        self.prompts = []
+        self.fail_first = fail_first   # calls that raise after streaming `partial` questions
+        self.partial = partial
+
+    async def __call__(self, prompt):
+        self.prompts.append(prompt)
+        call = len(self.prompts)
+        count = int(prompt.split("|")[1])
+        failing = call <= self.fail_first
+        # Every word unique to (call, i), so no two questions are near-duplicates.
+        items = [_q(" ".join(f"c{call}q{i}w{k}" for k in range(5)) + "?")
+                 for i in range(self.partial if failing else count)]
+        raw = "[" + ", ".join(_json(it) for it in items)
+        for i in range(0, len(raw), 16):
+            await asyncio.sleep(0)
+            yield raw[i:i + 16]
+        if failing:
+            raise asyncio.TimeoutError()
+        yield "]"
+
+
+def _run(model, notes, count, **kwargs):
+    delivered = []
+
+    async def on_questions(items):
+        delivered.append(list(items))
+
+    total = asyncio.run(generate_questions(
+        notes, count,
+        build_prompt=lambda section, n: f"{section[:12]}|{n}",
+        stream_model=model,
+        on_questions=on_questions,
+        **kwargs,
+    ))
+    return total, delivered
+
+
+@override_settings(QUIZ_GENERATION_BATCH_SIZE=5)
+class GenerateQuestionsRetryTests(SimpleTestCase):
+    NOTES = "\n\n".join(f"Section {i} " + "words " * 30 for i in range(6))
+
+    def test_failed_batch_retries_only_its_remaining_quota(self):
+        model = _FakeModel(fail_first=1, partial=2)
+        total, delivered = _run(model, self.NOTES, 10, concurrency=1)
+        self.assertEqual(total, 10)
+        self.assertEqual(sum(len(group) for group in delivered), 10)
+        # Two batches of 5; the first streamed 2 before failing, so its retry asks for 3.
+        self.assertEqual([int(p.split("|")[1]) for p in model.prompts], [5, 5, 3])
+
+    def test_gives_up_after_max_attempts(self):
+        model = _FakeModel(fail_first=100, partial=0)
+        with self.assertRaises(asyncio.TimeoutError):
+            _run(model, self.NOTES, 5, max_attempts=generation.MAX_ATTEMPTS)
+        self.assertEqual(len(model.prompts), generation.MAX_ATTEMPTS)
+
+    def test_partial_output_is_kept_when_attempts_run_out(self):
+        model = _FakeModel(fail_first=100, partial=1)
+        total, delivered = _run(model, self.NOTES, 5, max_attempts=2)
+        self.assertEqual(total, 2)
+        self.assertEqual(len(model.prompts), 2)
+
+    def test_on_questions_error_reaches_the_caller(self):
+        model = _FakeModel()
+        calls = []
+
+        async def on_questions(items):
+            calls.append(len(items))
+            if len(calls) == 2:
+                raise RuntimeError("database is locked")
+
+        with self.assertRaisesMessage(RuntimeError, "database is locked"):
+            asyncio.run(generate_questions(
+                self.NOTES, 10,
+                build_prompt=lambda section, n: f"{section[:12]}|{n}",
+                stream_model=model,
+                on_questions=on_questions,
+                concurrency=1,
+            ))
+        # The failed group is neither retried nor followed by further groups.
+        self.assertEqual(calls, [generation.FLUSH_EVERY, generation.FLUSH_EVERY])
+        self.assertEqual(len(model.prompts), 2)
+
+
+class _ParallelModel:
+    """Stub for stream_model that streams one item per tick and tracks overlapping calls."""
+
+    def __init__(self, shared=0):
+        self.calls = 0
+        self.in_flight = 0
+        self.peak = 0
+        self.shared = shared    # questions every call repeats before its own
+
+    async def __call__(self, prompt):
+        self.calls += 1
+        call = self.calls
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            count = int(prompt.split("|")[1])
+            items = [_q(" ".join(f"s{i}w{k}" for k in range(5)) + "?") for i in range(self.shared)]
+            items += [_q(" ".join(f"c{call}q{i}w{k}" for k in range(5)) + "?") for i in range(count)]
+            yield "["
+            for item in items:
+                await asyncio.sleep(0.002)
+                yield _json(item) + ","
+            yield "]"
+        finally:
+            self.in_flight -= 1
+
+
+@override_settings(QUIZ_GENERATION_BATCH_SIZE=5)
+class ParallelGenerationTests(SimpleTestCase):
+    NOTES = "\n\n".join(f"Section {i} " + "words " * 30 for i in range(8))
+
+    def _generate(self, model, count, concurrency):
+        groups, live = [], []
+
+        async def on_questions(items):
+            groups.append(list(items))
+            live.append(model.in_flight)
+
+        total = asyncio.run(generate_questions(
+            self.NOTES, count,
+            build_prompt=lambda section, n: f"{section[:12]}|{n}",
+            stream_model=model,
+            on_questions=on_questions,
+            concurrency=concurrency,
+        ))
+        return total, groups, live
+
+    def test_batches_run_in_parallel_up_to_the_semaphore(self):
+        model = _ParallelModel()
+        total, _, _ = self._generate(model, 20, concurrency=2)
+        self.assertEqual(total, 20)
+        self.assertEqual(model.calls, 4)
+        self.assertEqual(model.peak, 2)
+
+        model = _ParallelModel()
+        self._generate(model, 20, concurrency=8)
+        self.assertEqual(model.peak, 4)
+
+    def test_questions_are_handed_over_while_batches_still_stream(self):
+        model = _ParallelModel()
+        total, groups, live = self._generate(model, 20, concurrency=4)
+        self.assertEqual(sum(len(g) for g in groups), total)
+        self.assertGreater(len(groups), 1)
+        self.assertGreater(live[0], 0)
+        self.assertTrue(all(len(g) >= generation.FLUSH_EVERY for g in groups[:-1]))
+
+    def test_count_is_exact_and_duplicates_across_batches_are_dropped(self):
+        model = _ParallelModel(shared=2)
+        total, groups, _ = self._generate(model, 20, concurrency=4)
+        questions = [item["question"] for group in groups for item in group]
+        self.assertEqual(total, 20)
+        self.assertEqual(len(questions), 20)
+        self.assertEqual(len(set(questions)), 20)
+        self.assertEqual(sum(q.startswith("s0w0") for q in questions), 1)
+        self.assertEqual(sum(q.startswith("s1w0") for q in questions), 1)
+        self.assertEqual(model.calls, 4)
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.db import IntegrityError
+from django.test import AsyncClient, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import CustomUser
+
+from . import room_state, views
+from .models import Participant, Quiz, QuizResult
+from .result_buffer import ResultWriteBuffer
+
+
+class _CountingBuffer(ResultWriteBuffer):
+    def __init__(self, **kwargs):
+        super().__init__(on_flush=self._flushed, **kwargs)
+        self.batches = []
+        self.flushed = []
+
+    def _write_rows(self, batch):
+        self.batches.append(len(batch))
+        super()._write_rows(batch)
+
+    def _flushed(self, quiz_ids):
+        self.flushed.append(quiz_ids)
+
+
+# The flusher thread has its own connection, so test data must be committed.
+@override_settings(QUIZ_RESULT_WRITE_BEHIND=True)
+class ResultWriteBufferTests(TransactionTestCase):
+    def setUp(self):
+        creator = CustomUser.objects.create_user("buffer_creator")
+        self.quiz = Quiz.objects.create(creator=creator, title="Buffer", difficulty=1, duration=5, room_code="515151")
+        self.participants = [
+            Participant.objects.create(quiz=self.quiz, user=CustomUser.objects.create_user(f"p{i}"), name=f"p{i}")
+            for i in range(8)
+        ]
+
+    def _submit_all(self, buffer, submits):
+        errors = {}
+
+        def run(participant_id, score):
+            try:
+                buffer.submit(self.quiz.id, participant_id, score, timedelta(seconds=score))
+            except Exception as e:
+                errors[participant_id] = e
+
+        threads = [threading.Thread(target=run, args=args) for args in submits]
+        for t in threads:
+            t.start()
+            time.sleep(0.005)
+        for t in threads:
+            t.join(5)
+        return errors
+
+    def test_concurrent_submits_share_one_commit(self):
+        buffer = _CountingBuffer(max_delay=0.3)
+        errors = self._submit_all(buffer, [(p.id, i) for i, p in enumerate(self.participants)])
+        self.assertEqual(errors, {})
+        self.assertEqual(buffer.batches, [8])
+        self.assertEqual(buffer.flushed, [{self.quiz.id}])
+        self.assertEqual(
+            dict(QuizResult.objects.values_list("participant_id", "score")),
+            {p.id: i for i, p in enumerate(self.participants)},
+        )
+        self.assertEqual(Participant.objects.filter(has_started=True).count(), 8)
+
+    def test_resubmit_keeps_newest_answer_and_acks_both(self):
+        buffer = _CountingBuffer(max_delay=0.3)
+        pid = self.participants[0].id
+        errors = self._submit_all(buffer, [(pid, 3), (pid, 7)])
+        self.assertEqual(errors, {})
+        self.assertEqual(buffer.batches, [1])
+        self.assertEqual(list(QuizResult.objects.values_list("score", flat=True)), [7])
+
+        # A later resubmit is an upsert of the same row.
+        buffer.submit(self.quiz.id, pid, 9, timedelta(seconds=1))
+        self.assertEqual(list(QuizResult.objects.values_list("score", flat=True)), [9])
+
+    def test_wedged_flusher_falls_back_to_inline_write(self):
+        buffer = _CountingBuffer(ack_timeout=0.05)
+        buffer._ensure_flusher = lambda: None      # nothing will ever drain the queue
+        started = time.monotonic()
+        buffer.submit(self.quiz.id, self.participants[0].id, 4, timedelta(seconds=2))
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+        self.assertEqual(QuizResult.objects.get().score, 4)
+
+    def test_bad_row_fails_only_its_own_submit(self):
+        buffer = _CountingBuffer(max_delay=0.3)
+        good = self.participants[0].id
+        missing = max(p.id for p in self.participants) + 100
+        errors = self._submit_all(buffer, [(good, 5), (missing, 6)])
+        self.assertEqual(list(errors), [missing])
+        self.assertIsInstance(errors[missing], IntegrityError)
+        self.assertEqual(buffer.batches, [2, 1, 1])
+        self.assertEqual(list(QuizResult.objects.values_list("participant_id", "score")), [(good, 5)])
+        self.assertEqual(buffer.flushed, [{self.quiz.id}])
+
+    def test_inline_mode_raises_to_the_caller(self):
+        buffer = _CountingBuffer()
+        with override_settings(QUIZ_RESULT_WRITE_BEHIND=False):
+            with self.assertRaises(IntegrityError):
+                buffer.submit(self.quiz.id, 10**6, 1, timedelta(seconds=1))
+            buffer.submit(self.quiz.id, self.participants[0].id, 2, timedelta(seconds=1))
+        self.assertEqual(buffer.flushed, [{self.quiz.id}])
+
+    def test_concurrent_asgi_submits_share_one_batch(self):
+        now = timezone.now()
+        room_state.set_room_state(self.quiz, room_state.RUNNING, started_at=now, ends_at=now + timedelta(minutes=5))
+        url = reverse("submit_quiz", args=[self.quiz.room_code])
+        buffer = _CountingBuffer(max_delay=0.3)
+
+        async def burst():
+            clients = []
+            for participant in self.participants:
+                client = AsyncClient()
+                await client.aforce_login(participant.user)
+                clients.append(client)
+            return await asyncio.gather(*(client.post(url, {}) for client in clients))
+
+        with mock.patch.object(views, "_result_buffer", buffer):
+            responses = async_to_sync(burst)()
+        self.assertEqual([r.status_code for r in responses], [302] * 8)
+        self.assertEqual(buffer.batches, [8])
+        self.assertEqual(QuizResult.objects.filter(quiz=self.quiz).count(), 8)
+
+    def test_asubmit_raises_a_failed_row_to_its_caller(self):
+        buffer = _CountingBuffer(max_delay=0.01)
+        missing = max(p.id for p in self.participants) + 100
+        with self.assertRaises(IntegrityError):
+            async_to_sync(buffer.asubmit)(self.quiz.id, missing, 1, timedelta(seconds=1))
+        async_to_sync(buffer.asubmit)(self.quiz.id, self.participants[0].id, 2, timedelta(seconds=1))
+        self.assertEqual(QuizResult.objects.get().score, 2)
@@ -0,0 +1,202 @@
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import CustomUser
+
+from . import room_codes, views
+from .forms import QuizCreationForm
+from .models import FreeRoomCode, Quiz, RoomCodeAllocator
+from .room_codes import (
+    CODE_SPACE,
+    _code_for_index,
+    allocate_room_code,
+    reclaim_room_codes,
+    release_room_code,
+)
+
+
+class PermutationTests(TestCase):
+    def test_every_index_maps_to_a_distinct_code(self):
+        codes = {_code_for_index(i) for i in range(CODE_SPACE)}
+        self.assertEqual(len(codes), CODE_SPACE)
+        self.assertTrue(all(len(c) == 6 and c.isdigit() for c in list(codes)[:1000]))
+
+    def test_consecutive_codes_do_not_reveal_the_next_one(self):
+        codes = [int(_code_for_index(i)) for i in range(1000)]
+        steps = {(b - a) % CODE_SPACE for a, b in zip(codes, codes[1:])}
+        self.assertGreater(len(steps), 900)
+
+    def test_codes_depend_on_the_key(self):
+        with override_settings(ROOM_CODE_KEY="one"):
+            one = [_code_for_index(i) for i in range(20)]
+        with override_settings(ROOM_CODE_KEY="two"):
+            two = [_code_for_index(i) for i in range(20)]
+        self.assertNotEqual(one, two)
+
+    def test_fresh_codes_follow_the_permutation(self):
+        first = RoomCodeAllocator.objects.get(pk=1).next_index
+        codes = [allocate_room_code() for _ in range(5)]
+        self.assertEqual(codes, [_code_for_index(first + i) for i in range(5)])
+
+
+class AllocationTests(TestCase):
+    def setUp(self):
+        self.creator = CustomUser.objects.create_user("codes_creator")
+
+    def make_quiz(self, code, **fields):
+        return Quiz.objects.create(creator=self.creator, title="Codes", difficulty=1, duration=5,
+                                   room_code=code, **fields)
+
+    def test_released_code_is_reused_first(self):
+        code = allocate_room_code()
+        release_room_code(code)
+        self.assertEqual(allocate_room_code(), code)
+        self.assertFalse(FreeRoomCode.objects.exists())
+        self.assertNotEqual(allocate_room_code(), code)
+
+    def test_codes_held_by_quizzes_are_skipped(self):
+        index = RoomCodeAllocator.objects.get(pk=1).next_index
+        self.make_quiz(_code_for_index(index))
+        self.assertEqual(allocate_room_code(), _code_for_index(index + 1))
+
+    def test_allocator_row_is_recreated_inside_the_transaction(self):
+        RoomCodeAllocator.objects.all().delete()
+        self.assertEqual(allocate_room_code(), _code_for_index(0))
+        self.assertEqual(RoomCodeAllocator.objects.get(pk=1).next_index, 1)
+
+    def test_exhausted_space_reclaims_finished_rooms(self):
+        RoomCodeAllocator.objects.filter(pk=1).update(next_index=CODE_SPACE)
+        old = timezone.now() - timedelta(days=60)
+        quiz = self.make_quiz("777777", state="ended", is_active=False, ends_at=old)
+        self.assertEqual(allocate_room_code(), "777777")
+        quiz.refresh_from_db()
+        self.assertIsNone(quiz.room_code)
+
+    def test_exhausted_space_without_finished_rooms_raises(self):
+        RoomCodeAllocator.objects.filter(pk=1).update(next_index=CODE_SPACE)
+        with self.assertRaises(room_codes.RoomCodesExhausted):
+            allocate_room_code()
+
+
+class RacingAllocationTests(TestCase):
+    """Races replayed step by step, so they run on SQLite too."""
+
+    def setUp(self):
+        self.creator = CustomUser.objects.create_user("race_creator")
+
+    def test_a_recycled_code_claimed_by_another_caller_is_skipped(self):
+        release_room_code("300001")
+        release_room_code("300002")
+        peek = room_codes._peek_recycled
+        raced = []
+
+        def peek_then_lose(*args):
+            code = peek()
+            if not raced:
+                # Another worker read the same row and deleted it first.
+                raced.append(code)
+                FreeRoomCode.objects.filter(code=code).delete()
+            return code
+
+        with mock.patch.object(room_codes, "_peek_recycled", side_effect=peek_then_lose):
+            code = allocate_room_code()
+        self.assertEqual(raced, ["300001"])
+        self.assertEqual(code, "300002")
+        self.assertFalse(FreeRoomCode.objects.exists())
+
+    def test_room_creation_draws_again_when_its_code_was_taken(self):
+        Quiz.objects.create(creator=self.creator, title="Taken", difficulty=1, duration=5, room_code="400001")
+        form = QuizCreationForm({"title": "Race", "difficulty": 1, "duration": 5})
+        self.assertTrue(form.is_valid(), form.errors)
+        with mock.patch.object(views, "allocate_room_code", side_effect=["400001", "400002"]):
+            quiz = views._create_room(form, self.creator)
+        self.assertEqual(quiz.room_code, "400002")
+        self.assertEqual(Quiz.objects.filter(room_code__in=["400001", "400002"]).count(), 2)
+
+    def test_room_creation_gives_up_after_repeated_collisions(self):
+        Quiz.objects.create(creator=self.creator, title="Taken", difficulty=1, duration=5, room_code="400001")
+        form = QuizCreationForm({"title": "Race", "difficulty": 1, "duration": 5})
+        self.assertTrue(form.is_valid(), form.errors)
+        with mock.patch.object(views, "allocate_room_code", return_value="400001"):
+            self.assertIsNone(views._create_room(form, self.creator))
+        self.assertEqual(Quiz.objects.count(), 1)
+
+
+@override_settings(ROOM_CODE_RETENTION_DAYS=30)
+class ReclaimTests(TestCase):
+    def setUp(self):
+        self.creator = CustomUser.objects.create_user("reclaim_creator")
+        self.now = timezone.now()
+
+    def make_quiz(self, code, age_days, **fields):
+        quiz = Quiz.objects.create(creator=self.creator, title=code, difficulty=1, duration=5,
+                                   room_code=code, **fields)
+        Quiz.objects.filter(pk=quiz.pk).update(created_at=self.now - timedelta(days=age_days))
+        return quiz
+
+    def test_only_rooms_finished_before_the_retention_window(self):
+        long_ago = self.now - timedelta(days=40)
+        ended = self.make_quiz("100001", 41, state="ended", is_active=False, ends_at=long_ago)
+        aborted = self.make_quiz("100002", 41, state="aborted", is_active=False)
+        overran = self.make_quiz("100003", 41, state="running", ends_at=long_ago)
+        recent = self.make_quiz("100004", 41, state="ended", is_active=False,
+                                ends_at=self.now - timedelta(days=2))
+        lobby = self.make_quiz("100005", 90, state="lobby")
+        running = self.make_quiz("100006", 90, state="running", ends_at=self.now + timedelta(minutes=5))
+
+        self.assertEqual(reclaim_room_codes(), 3)
+        codes = dict(Quiz.objects.values_list("pk", "room_code"))
+        self.assertEqual([codes[q.pk] for q in (ended, aborted, overran)], [None, None, None])
+        self.assertEqual([codes[q.pk] for q in (recent, lobby, running)], ["100004", "100005", "100006"])
+        self.assertEqual(set(FreeRoomCode.objects.values_list("code", flat=True)),
+                         {"100001", "100002", "100003"})
+
+    def test_results_stay_reachable_after_reclaim(self):
+        quiz = self.make_quiz("200001", 41, state="ended", is_active=False,
+                              ends_at=self.now - timedelta(days=40))
+        reclaim_room_codes()
+        self.client.force_login(self.creator)
+        self.assertEqual(self.client.get(reverse("quiz_results", args=[quiz.id])).status_code, 200)
+        self.assertEqual(self.client.get(reverse("quiz_results_pdf", args=[quiz.id])).status_code, 200)
+
+
+# SQLite's shared-cache test database fails parallel writers at once instead of
+# waiting on the lock; this needs a server database with row locks.
+@skipUnlessDBFeature("has_select_for_update_skip_locked")
+class ConcurrentAllocationTests(TransactionTestCase):
+    def test_parallel_allocations_never_share_a_code(self):
+        RoomCodeAllocator.objects.get_or_create(pk=1)
+        for code in ("300001", "300002", "300003"):
+            release_room_code(code)
+        codes, errors = [], []
+        lock = threading.Lock()
+        gate = threading.Barrier(8)
+
+        def worker():
+            try:
+                gate.wait()
+                for _ in range(5):
+                    code = allocate_room_code()
+                    with lock:
+                        codes.append(code)
+            except Exception as exc:  # surfaced below
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(codes), 40)
+        self.assertEqual(len(set(codes)), 40)
+        self.assertTrue({"300001", "300002", "300003"} <= set(codes))
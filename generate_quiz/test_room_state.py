@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from users.models import CustomUser
+
+from . import room_state
+from .models import Quiz
+from .room_state import ABORTED, ENDED, LOBBY, RUNNING, RoomState, get_room_state, set_room_state
+
+
+class RoomStateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        room_state.room_cache.clear_local()
+        creator = CustomUser.objects.create_user("state_creator")
+        self.quiz = Quiz.objects.create(creator=creator, title="State", difficulty=1, duration=10, room_code="575757")
+
+    def forget(self):
+        """What a worker sees after the shared cache lost the entry."""
+        cache.clear()
+        room_state.room_cache.clear_local()
+
+    def test_every_transition_bumps_the_version(self):
+        self.assertEqual(get_room_state(self.quiz.id), RoomState(LOBBY, None, None, 0))
+        now = timezone.now()
+        versions = [
+            set_room_state(self.quiz, RUNNING, started_at=now, ends_at=now + timedelta(minutes=10)).version,
+            set_room_state(self.quiz, ENDED).version,
+            set_room_state(self.quiz, ENDED).version,   # repeating a state is still a new version
+        ]
+        self.assertEqual(versions, [1, 2, 3])
+        self.assertEqual(Quiz.objects.get(pk=self.quiz.pk).state_version, 3)
+        self.assertEqual(get_room_state(self.quiz.id).version, 3)
+
+    def test_cache_miss_falls_back_to_the_database(self):
+        now = timezone.now()
+        written = set_room_state(self.quiz, RUNNING, started_at=now, ends_at=now + timedelta(minutes=10))
+        self.forget()
+        with self.assertNumQueries(1):
+            self.assertEqual(get_room_state(self.quiz.id), written)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_room_state(self.quiz.id), written)   # rebuilt cache entry
+
+    def test_cache_miss_with_the_quiz_in_hand_costs_no_query(self):
+        set_room_state(self.quiz, ABORTED)
+        self.forget()
+        with self.assertNumQueries(0):
+            state = get_room_state(self.quiz.id, self.quiz)
+        self.assertTrue(state.aborted)
+        self.assertFalse(self.quiz.is_active)
+
+    def test_started_room_survives_cache_loss(self):
+        now = timezone.now()
+        set_room_state(self.quiz, RUNNING, started_at=now, ends_at=now + timedelta(minutes=10))
+        self.forget()
+        state = get_room_state(self.quiz.id)
+        self.assertTrue(state.started)
+        self.assertFalse(state.is_over())
+        self.assertAlmostEqual(state.remaining_seconds(), 600, delta=2)
+        self.assertTrue(state.is_over(now=state.ends_at))
+        self.assertEqual(state.elapsed(now=state.ends_at + 60), 600)
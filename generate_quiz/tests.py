@@ -1,3 +1,419 @@
-from django.test import TestCase
+import zlib
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import CustomUser
+
+from . import question_bank, question_cache, room_state, views
+from .models import BankedQuestion, Participant, Question, Quiz, QuizResult
+
+# Declared per-view query budgets for a warm request. A view that goes over,
+# or whose count changes with room size, fails the suite.
+QUERY_BUDGETS = {
+    "quiz_lobby_status": 4,   # session, user, quiz, participants
+    "quiz_results_data": 7,   # session, user, quiz, me, rank+position, window, total
+    "quiz_page": 4,           # session, user, quiz, participant get_or_create
+    "quiz_dashboard": 4,      # session, user, quiz, is-participant; the list is a cached fragment
+    "submit_quiz": 8,         # session, user, participant, upsert, bulk_update
+}
+ROOM_SIZES = (10, 1000)
+
+
+@override_settings(QUIZ_RESULT_WRITE_BEHIND=False)
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        question_cache.compiled_cache.clear_local()
+        room_state.room_cache.clear_local()
+
+    def make_room(self, size, room_code):
+        creator = CustomUser.objects.create_user(f"creator_{room_code}")
+        quiz = Quiz.objects.create(
+            creator=creator, title="Budget", difficulty=1, duration=10, room_code=room_code,
+        )
+        Question.objects.bulk_create([
+            Question(quiz=quiz, text=f"Q{i}", option_a="a", option_b="b",
+                     option_c="c", option_d="d", correct_option="A")
+            for i in range(10)
+        ])
+        CustomUser.objects.bulk_create([CustomUser(username=f"p{room_code}_{i}") for i in range(size)])
+        users = list(CustomUser.objects.filter(username__startswith=f"p{room_code}_").order_by("id"))
+        Participant.objects.bulk_create([Participant(quiz=quiz, user=u, name=u.username) for u in users])
+        participants = list(Participant.objects.filter(quiz=quiz).order_by("id"))
+        QuizResult.objects.bulk_create([
+            QuizResult(quiz=quiz, participant=p, score=i % 10, time_taken=timedelta(seconds=i))
+            for i, p in enumerate(participants)
+        ])
+        views._results_changed(quiz.id)
+        now = timezone.now()
+        room_state.set_room_state(quiz, room_state.RUNNING, started_at=now, ends_at=now + timedelta(minutes=10))
+        return quiz, users
+
+    def count_queries(self, size, view_name, method="get", data=None):
+        room_code = f"{size:06d}"
+        quiz, users = self.make_room(size, room_code)
+        self.client.force_login(users[len(users) // 2])
+        # Results pages are addressed by quiz id, so they outlive the room code.
+        url = reverse(view_name, args=[quiz.id if view_name.startswith("quiz_results") else room_code])
+        call = getattr(self.client, method)
+        call(url, data or {})  # warm per-room caches
+        with CaptureQueriesContext(connection) as ctx:
+            response = call(url, data or {})
+        self.assertLess(response.status_code, 400, view_name)
+        return len(ctx.captured_queries)
+
+    def assertQueryBudget(self, view_name, method="get", data=None):
+        budget = QUERY_BUDGETS[view_name]
+        counts = {size: self.count_queries(size, view_name, method, data) for size in ROOM_SIZES}
+        for size, count in counts.items():
+            self.assertLessEqual(
+                count, budget,
+                f"{view_name} ran {count} queries with {size} participants (budget {budget})",
+            )
+        self.assertEqual(
+            len(set(counts.values())), 1,
+            f"{view_name} query count grows with room size: {counts}",
+        )
+
+    def test_lobby_status_budget(self):
+        self.assertQueryBudget("quiz_lobby_status")
+
+    def test_results_data_budget(self):
+        # Small top slice, so the caller sits below it in every room size.
+        self.assertQueryBudget("quiz_results_data", data={"top": 3})
+
+    def test_quiz_page_budget(self):
+        self.assertQueryBudget("quiz_page")
+
+    def test_submit_budget(self):
+        self.assertQueryBudget("submit_quiz", method="post", data={"q_1": "A"})
+
+    def test_dashboard_budget(self):
+        self.assertQueryBudget("quiz_dashboard")
+
+
+class LobbyFragmentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        room_state.room_cache.clear_local()
+        self.creator = CustomUser.objects.create_user("lobby_creator")
+        self.quiz = Quiz.objects.create(
+            creator=self.creator, title="Lobby", difficulty=1, duration=10, room_code="424242",
+        )
+        self.url = reverse("quiz_dashboard", args=[self.quiz.room_code])
+
+    def test_join_refreshes_cached_participant_list(self):
+        self.client.force_login(self.creator)
+        self.assertNotContains(self.client.get(self.url), "newcomer")
+
+        newcomer = CustomUser.objects.create_user("newcomer")
+        self.client.force_login(newcomer)
+        self.client.post(reverse("generate_quiz_join"), {"room_code": self.quiz.room_code, "name": "newcomer"})
+
+        self.client.force_login(self.creator)
+        self.assertContains(self.client.get(self.url), "newcomer")
+
+
+class LeaderboardTests(TestCase):
+    # (score, seconds): equal pairs tie; time breaks score ties; no time sorts last.
+    ENTRIES = [(10, 30), (10, 30), (8, 20), (8, 30), (8, 30), (5, 30), (3, 40), (3, None)]
+
+    def setUp(self):
+        cache.clear()
+        room_state.room_cache.clear_local()
+        creator = CustomUser.objects.create_user("board_creator")
+        self.quiz = Quiz.objects.create(creator=creator, title="Board", difficulty=1, duration=10, room_code="545454")
+        self.users = []
+        for i, (score, seconds) in enumerate(self.ENTRIES):
+            user = CustomUser.objects.create_user(f"board_{i}")
+            participant = Participant.objects.create(quiz=self.quiz, user=user, name=f"board_{i}")
+            QuizResult.objects.create(
+                quiz=self.quiz, participant=participant, score=score,
+                time_taken=timedelta(seconds=seconds) if seconds is not None else None,
+            )
+            self.users.append(user)
+        views._results_changed(self.quiz.id)
+        self.url = reverse("quiz_results_data", args=[self.quiz.id])
+
+    def ranks(self):
+        ranked = dict(views._ranked_results(self.quiz.id).values_list("participant__name", "rank"))
+        return [rank for name, rank in sorted(ranked.items())]
+
+    def test_ties_share_a_rank_and_leave_a_gap(self):
+        self.assertEqual(self.ranks(), [1, 1, 3, 4, 4, 6, 7, 8])
+
+    def test_a_late_top_score_writes_no_other_rows(self):
+        before = views._results_version(self.quiz.id)
+        with CaptureQueriesContext(connection) as ctx:
+            QuizResult.objects.filter(participant__user=self.users[7]).update(score=11)
+            views._results_changed(self.quiz.id)
+        self.assertEqual(len(ctx.captured_queries), 1)   # just the submit itself
+        self.assertEqual(self.ranks(), [2, 2, 4, 5, 5, 7, 8, 1])
+        self.assertNotEqual(views._results_version(self.quiz.id), before)
+
+    def test_own_rank_matches_the_leaderboard(self):
+        board = {r["participant__user_id"]: r["rank"] for r in views._ranked_results(self.quiz.id).values(*views._RESULT_FIELDS)}
+        for user in self.users:
+            me, _ = views._my_result_window(self.quiz.id, user.id, 0)
+            self.assertEqual(me["rank"], board[user.id], user.username)
+
+    def test_top_results_are_cached_per_version(self):
+        version = views._results_version(self.quiz.id)
+        self.assertEqual([r["score"] for r in views._top_results(self.quiz.id, version, 3)], [10, 10, 8])
+        QuizResult.objects.filter(participant__user=self.users[7]).update(score=11)
+        with self.assertNumQueries(0):
+            views._top_results(self.quiz.id, version, 3)
+        views._results_changed(self.quiz.id)
+        fresh = views._results_version(self.quiz.id)
+        self.assertEqual([r["score"] for r in views._top_results(self.quiz.id, fresh, 3)], [11, 10, 10])
+
+    def test_neighbour_window_is_clipped_at_the_edges(self):
+        def window(user, k):
+            me, rows = views._my_result_window(self.quiz.id, user.id, k)
+            return me["participant__name"], [r["participant__name"] for r in rows]
+
+        self.assertEqual(window(self.users[0], 2), ("board_0", ["board_0", "board_1", "board_2"]))
+        self.assertEqual(window(self.users[7], 2), ("board_7", ["board_5", "board_6", "board_7"]))
+        self.assertEqual(window(self.users[3], 1), ("board_3", ["board_2", "board_3", "board_4"]))
+        self.assertEqual(window(self.users[3], 0), ("board_3", []))
+
+    def test_neighbour_window_starts_after_the_top_slice(self):
+        me, rows = views._my_result_window(self.quiz.id, self.users[4].id, 3, skip=4)
+        self.assertEqual([r["participant__name"] for r in rows], ["board_4", "board_5", "board_6", "board_7"])
+
+    def test_around_is_dropped_when_the_caller_is_in_the_top_slice(self):
+        self.client.force_login(self.users[7])
+        data = self.client.get(self.url, {"top": 3, "around": 1}).json()
+        self.assertEqual([r["rank"] for r in data["results"]], [1, 1, 3])
+        self.assertEqual(data["me"]["rank"], 8)
+        self.assertEqual([r["rank"] for r in data["neighbors"]], [7, 8])
+        self.assertEqual(data["total"], 8)
+
+        self.client.force_login(self.users[0])
+        data = self.client.get(self.url, {"top": 3, "around": 1}).json()
+        self.assertTrue(data["me"]["is_me"])
+        self.assertEqual(data["neighbors"], [])
+
+    def test_matching_version_answers_unchanged(self):
+        self.client.force_login(self.users[0])
+        version = self.client.get(self.url).json()["version"]
+        with self.assertNumQueries(3):   # session, user, quiz; no leaderboard reads
+            self.assertEqual(self.client.get(self.url, {"v": version}).json(), {"unchanged": True, "version": version})
+        views._results_changed(self.quiz.id)
+        data = self.client.get(self.url, {"v": version}).json()
+        self.assertNotIn("unchanged", data)
+        self.assertNotEqual(data["version"], version)
+
+
+class ResultsPdfTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        room_state.room_cache.clear_local()
+        creator = CustomUser.objects.create_user("pdf_creator")
+        self.quiz = Quiz.objects.create(creator=creator, title="Pdf", difficulty=1, duration=10, room_code="555555")
+        participant = Participant.objects.create(quiz=self.quiz, user=creator, name="pdf_creator")
+        self.result = QuizResult.objects.create(quiz=self.quiz, participant=participant, score=4)
+        views._results_changed(self.quiz.id)
+        self.client.force_login(creator)
+        self.url = reverse("quiz_results_pdf", args=[self.quiz.id])
+
+    def download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        body = b"".join(response.streaming_content)
+        self.assertEqual(int(response["Content-Length"]), len(body))
+        return body
+
+    def test_pdf_is_rendered_once_per_results_version(self):
+        with mock.patch.object(views, "_render_results_pdf", wraps=views._render_results_pdf) as render:
+            first = self.download()
+            self.assertEqual(self.download(), first)
+            self.assertEqual(render.call_count, 1)
+
+            QuizResult.objects.filter(pk=self.result.pk).update(score=9)
+            views._results_changed(self.quiz.id)   # bumps the results version
+            self.download()
+            self.assertEqual(render.call_count, 2)
+        self.assertTrue(first.startswith(b"%PDF"))
+
+
+class ResultsAccessTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        room_state.room_cache.clear_local()
+        self.creator = CustomUser.objects.create_user("access_creator")
+        self.player = CustomUser.objects.create_user("access_player")
+        self.quiz = Quiz.objects.create(creator=self.creator, title="Access", difficulty=1, duration=10,
+                                        room_code="585858", is_active=True)
+        Participant.objects.create(quiz=self.quiz, user=self.player, name="access_player")
+
+    def urls(self):
+        return [reverse(name, args=[self.quiz.id])
+                for name in ("quiz_results", "quiz_results_data", "quiz_results_pdf")]
+
+    def test_only_the_creator_and_participants_see_results(self):
+        self.client.force_login(CustomUser.objects.create_user("access_stranger"))
+        for url in self.urls():
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+        for user in (self.creator, self.player):
+            self.client.force_login(user)
+            for url in self.urls():
+                self.assertEqual(self.client.get(url).status_code, 200, url)
+
+    def test_viewing_results_leaves_a_live_room_open(self):
+        now = timezone.now()
+        room_state.set_room_state(self.quiz, room_state.RUNNING, started_at=now, ends_at=now + timedelta(minutes=10))
+        self.client.force_login(self.player)
+        self.client.get(self.urls()[0])
+        self.quiz.refresh_from_db()
+        self.assertTrue(self.quiz.is_active)
+        self.assertEqual(self.quiz.state, room_state.RUNNING)
+
+    def test_viewing_results_after_the_timer_ends_the_room(self):
+        start = timezone.now() - timedelta(minutes=20)
+        room_state.set_room_state(self.quiz, room_state.RUNNING, started_at=start, ends_at=start + timedelta(minutes=10))
+        self.client.force_login(self.player)
+        self.client.get(self.urls()[0])
+        self.quiz.refresh_from_db()
+        self.assertFalse(self.quiz.is_active)
+        self.assertEqual(self.quiz.state, room_state.ENDED)
+
+
+class QuizPageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        question_cache.compiled_cache.clear_local()
+        room_state.room_cache.clear_local()
+        self.creator = CustomUser.objects.create_user("page_creator")
+        self.quiz = Quiz.objects.create(
+            creator=self.creator, title="Page", difficulty=1, duration=10, room_code="535353",
+        )
+        views._append_questions(self.quiz, [
+            {"question": "Original question?", "options": ["a", "b", "c", "d"], "answer_index": 0},
+        ])
+        now = timezone.now()
+        room_state.set_room_state(self.quiz, room_state.RUNNING, started_at=now, ends_at=now + timedelta(minutes=10))
+        self.client.force_login(self.creator)
+        self.url = reverse("quiz_page", args=[self.quiz.room_code])
+
+    def test_question_fragment_follows_the_question_set(self):
+        self.assertContains(self.client.get(self.url), "Original question?")
+        views._append_questions(self.quiz, [
+            {"question": "Appended question?", "options": ["a", "b", "c", "d"], "answer_index": 1},
+        ])
+        # The room itself didn't change; the cached fragment still must.
+        self.assertContains(self.client.get(self.url), "Appended question?")
+
+
+class CompiledQuestionsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        question_cache.compiled_cache.clear_local()
+        room_state.room_cache.clear_local()
+        creator = CustomUser.objects.create_user("compiled_creator")
+        self.quiz = Quiz.objects.create(creator=creator, title="Compiled", difficulty=1, duration=10, room_code="565656")
+        views._append_questions(self.quiz, [
+            {"question": f"Q{i}?", "options": ["a", "b", "c", "d"], "answer_index": i % 4} for i in range(4)
+        ])
+        self.ids = list(Question.objects.filter(quiz=self.quiz).order_by("id").values_list("id", flat=True))
+
+    def test_compiled_once_and_answers_kept_out_of_the_payload(self):
+        compiled = question_cache.compiled_questions(self.quiz.id)
+        self.assertEqual(compiled["answer_key"], tuple(zip(self.ids, "ABCD")))
+        self.assertTrue(all("correct_option" not in q for q in compiled["questions"]))
+        with self.assertNumQueries(0):
+            self.assertIs(question_cache.compiled_questions(self.quiz.id), compiled)
+
+    def test_scoring_uses_the_cached_answer_key(self):
+        answers = {f"q_{qid}": option for qid, option in zip(self.ids, "ABCA")}
+        self.assertEqual(views._score_answers(question_cache.compiled_questions(self.quiz.id)["answer_key"], answers), 3)
+        # A bare UPDATE sends no signal, so the cached key is still what scores.
+        Question.objects.filter(pk=self.ids[3]).update(correct_option="A")
+        with self.assertNumQueries(0):
+            key = question_cache.compiled_questions(self.quiz.id)["answer_key"]
+        self.assertEqual(views._score_answers(key, answers), 3)
+        self.assertEqual(views._score_answers(key, {"q_0": "A", "junk": "B"}), 0)
+
+    def test_editing_a_question_invalidates_after_commit(self):
+        before = question_cache.compiled_questions(self.quiz.id)
+        question = Question.objects.get(pk=self.ids[3])
+        question.correct_option = "A"
+        with self.captureOnCommitCallbacks(execute=True):
+            question.save()
+        after = question_cache.compiled_questions(self.quiz.id)
+        self.assertNotEqual(after["version"], before["version"])
+        self.assertEqual(dict(after["answer_key"])[self.ids[3]], "A")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            question.delete()
+        self.assertEqual(len(question_cache.compiled_questions(self.quiz.id)["answer_key"]), 3)
+
+
+class _BagOfWordsEmbeddings:
+    """Deterministic stand-in for the sentence model: hashed word counts."""
+    tag = "test:bow"
+
+    def embed_documents(self, texts):
+        vectors = []
+        for text in texts:
+            vector = [0.0] * 64
+            for word in text.lower().split():
+                vector[zlib.crc32(word.encode()) % 64] += 1.0
+            vectors.append(vector)
+        return vectors
+
+
+def _item(i, topic="thermodynamics"):
+    return {"question": f"Question {i} about {topic} law number {i * 7}?",
+            "options": [f"alpha {i}", f"beta {i}", f"gamma {i}", f"delta {i}"], "answer_index": i % 4}
+
+
+class QuestionBankTests(TestCase):
+    NOTES = "The first law of thermodynamics states energy is conserved.\n\nEntropy of an isolated system never decreases."
+
+    def setUp(self):
+        self.embeddings = _BagOfWordsEmbeddings()
+        self.creator = CustomUser.objects.create_user("bank_creator")
+        self.fp = question_bank.fingerprint(self.NOTES, self.embeddings)
+        question_bank.add(self.creator.id, self.fp, 2, [_item(i) for i in range(6)], self.embeddings)
+
+    def test_similar_notes_reuse_banked_questions(self):
+        similar = question_bank.fingerprint(self.NOTES + "\n\nEnergy is conserved.", self.embeddings)
+        self.assertNotEqual(similar.content_hash, self.fp.content_hash)
+        items = question_bank.draw(self.creator.id, similar, 4, difficulty=2)
+        self.assertEqual(len(items), 4)
+        self.assertEqual(len({it["question"] for it in items}), 4)
+        by_text = {it["question"]: it for it in (_item(i) for i in range(6))}
+        for it in items:
+            original = by_text[it["question"]]
+            self.assertEqual(it["options"][it["answer_index"]], original["options"][original["answer_index"]])
+
+    def test_other_notes_difficulty_or_creator_get_nothing(self):
+        other = question_bank.fingerprint("Photosynthesis converts light into chemical energy in chloroplasts.",
+                                          self.embeddings)
+        self.assertEqual(question_bank.draw(self.creator.id, other, 4, difficulty=2), [])
+        self.assertEqual(question_bank.draw(self.creator.id, self.fp, 4, difficulty=3), [])
+        stranger = CustomUser.objects.create_user("bank_stranger")
+        self.assertEqual(question_bank.draw(stranger.id, self.fp, 4, difficulty=2), [])
+
+    def test_duplicates_are_banked_and_drawn_once(self):
+        reordered = dict(_item(0), options=list(reversed(_item(0)["options"])), answer_index=3)
+        self.assertEqual(question_bank.add(self.creator.id, self.fp, 2, [reordered], self.embeddings), 0)
+        self.assertEqual(BankedQuestion.objects.count(), 6)
+        # One extra word: a new hash but a near-identical embedding.
+        near = dict(_item(1), question=_item(1)["question"].replace("about", "exactly about"))
+        question_bank.add(self.creator.id, self.fp, 2, [near], self.embeddings)
+        self.assertEqual(BankedQuestion.objects.count(), 7)
+        self.assertEqual(len(question_bank.draw(self.creator.id, self.fp, 10, difficulty=2)), 6)
+
+    def test_least_used_questions_are_drawn_first(self):
+        first = {it["question"] for it in question_bank.draw(self.creator.id, self.fp, 3, difficulty=2)}
+        second = {it["question"] for it in question_bank.draw(self.creator.id, self.fp, 3, difficulty=2)}
+        self.assertFalse(first & second)
@@ -1,9 +1,10 @@
+import asyncio
+import io
+import logging
 import os
-import json
 import random
-import fitz
-import google.generativeai as genai
-from datetime import timedelta, datetime
+from asgiref.sync import sync_to_async
+from datetime import timedelta
 from django.conf import settings
 from django.core.cache import cache
 from django.contrib import messages
@@ -12,11 +13,33 @@ from django.utils import timezone
 from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 from django.db import IntegrityError, transaction
-from django.http import JsonResponse, HttpResponse
+from django.db.models import Count, Exists, F, OuterRef, Q, Window
+from django.db.models.functions import Rank
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.urls import reverse
 
+from study_assistant import compaction, metrics
+from study_assistant.admission import admission_controlled
+from study_assistant.lazy import lazy_import
+from study_assistant.profiling import profiled
+
 from .models import Quiz, Question, Participant, QuizResult
 from .forms import QuizCreationForm
+from .generation import generate_questions, is_valid_question
+from .question_cache import QUESTIONS_TTL, compiled_questions, forget_compiled_questions
+from .result_buffer import ResultWriteBuffer
+from .room_codes import RoomCodesExhausted, allocate_room_code, release_room_code
+from . import question_bank, room_state
+from .room_state import get_room_state, room_cache, set_room_state
+
+# PDF, Gemini and reportlab libraries load on first use, not at URL import.
+fitz = lazy_import("fitz")
+genai = lazy_import("google.generativeai")
+pdfgen_canvas = lazy_import("reportlab.pdfgen.canvas")
+pagesizes = lazy_import("reportlab.lib.pagesizes")
+
+logger = logging.getLogger(__name__)
+AVOID_IN_PROMPT = 30   # banked questions listed in the prompt so Gemini doesn't repeat them
 
 # -----------------------------
 # Gemini setup
@@ -41,36 +64,148 @@ def get_gemini_model():
 # -----------------------------
 # Helpers
 # -----------------------------
-ABORT_TTL = 60 * 60 * 6  # 6 hours in cache
-
-def _quiz_cache_keys(room_code: str):
-    base = f"quiz:{room_code}"
+RESULTS_TTL = 60 * 60 * 6
+RESULTS_TOP_N = 50        # rows shipped to every results viewer
+RESULTS_MAX_TOP_N = 500
+RESULTS_NEIGHBORS = 3     # rows above/below "me" when outside the top N
+FRAGMENT_TTL = 60 * 60     # {% cache %} fragments; keyed by version, so this only bounds memory
+ROOM_CODE_ATTEMPTS = 5     # allocations tried when a room code is taken under us
+
+def _results_cache_keys(quiz_id, version=None):
+    base = f"quiz:{quiz_id}:results"
     return {
-        "start_at": f"{base}:start_at",
-        "ends_at": f"{base}:ends_at",
-        "aborted": f"{base}:aborted",
+        "top": f"{base}:{version}:top",
+        "pdf": f"{base}:{version}:pdf",
     }
 
-def _generate_unique_room_code():
-    for _ in range(50):
-        code = "".join(str(random.randint(0, 9)) for _ in range(6))
-        if not Quiz.objects.filter(room_code=code).exists():
-            return code
-    return "".join(str(random.randint(0, 9)) for _ in range(6))
+def _results_version(quiz_id):
+    """Current leaderboard version; a fresh one is minted if the cache lost it."""
+    return room_cache.version(f"quiz:{quiz_id}:results", RESULTS_TTL)
+
+def _lobby_version(quiz_id):
+    """Version of the room's participant list, bumped on every join/leave."""
+    return room_cache.version(f"quiz:{quiz_id}:lobby", RESULTS_TTL)
+
+def _bump_lobby_version(quiz_id):
+    room_cache.bump(f"quiz:{quiz_id}:lobby", RESULTS_TTL)
+
+def _results_changed(quiz_id):
+    """
+    Results were written or removed: bump the leaderboard version. Ranks are
+    computed at read time (_ranked_results), so a late submit near the top
+    writes nothing else however big the room is.
+    """
+    room_cache.bump(f"quiz:{quiz_id}:results", RESULTS_TTL)
+
+def _results_changed_in(quiz_ids):
+    for quiz_id in quiz_ids:
+        _results_changed(quiz_id)
+
+# Submits are scored in memory and persisted in batches (see result_buffer.py).
+_result_buffer = ResultWriteBuffer(on_flush=_results_changed_in)
+
+# Higher score first, then faster; results without a time sort last.
+_RANK_ORDER = (F("score").desc(), F("time_taken").asc(nulls_last=True))
+_RESULT_FIELDS = ("id", "rank", "score", "time_taken", "participant__name", "participant__user_id")
+
+def _ranked_results(quiz_id):
+    """One quiz's results in leaderboard order; ties share a RANK() and leave a gap."""
+    return (
+        QuizResult.objects.filter(quiz_id=quiz_id)
+        .annotate(rank=Window(expression=Rank(), order_by=_RANK_ORDER))
+        .order_by(*_RANK_ORDER, "id")
+    )
 
+def _result_row(r, user_id):
+    return {
+        "rank": r["rank"],
+        "name": r["participant__name"],
+        "score": r["score"],
+        "time_taken": str(r["time_taken"]) if r["time_taken"] else "—",
+        "is_me": r["participant__user_id"] == user_id,
+    }
+
+def _top_results(quiz_id, version, limit):
+    """Top `limit` leaderboard rows, cached per results version."""
+    key = _results_cache_keys(quiz_id, version)["top"]
+    cached = cache.get(key)
+    if cached is None or cached[0] < limit:
+        fetched = max(limit, RESULTS_TOP_N)
+        rows = list(_ranked_results(quiz_id).values(*_RESULT_FIELDS)[:fetched])
+        cached = (fetched, rows)
+        cache.set(key, cached, RESULTS_TTL)
+    return cached[1][:limit]
+
+def _ahead_of(score, time_taken):
+    """Results that rank strictly before (score, time_taken), and those tied with it."""
+    if time_taken is None:
+        ahead = Q(score__gt=score) | Q(score=score, time_taken__isnull=False)
+        tied = Q(score=score, time_taken__isnull=True)
+    else:
+        ahead = Q(score__gt=score) | Q(score=score, time_taken__lt=time_taken)
+        tied = Q(score=score, time_taken=time_taken)
+    return ahead, tied
+
+def _my_result_window(quiz_id, user_id, neighbors, skip=0):
+    """
+    The caller's own row plus `neighbors` rows on each side of it, leaving out
+    the first `skip` rows (the top slice the caller already shows).
+    """
+    fields = [f for f in _RESULT_FIELDS if f != "rank"]
+    me = (
+        QuizResult.objects.filter(quiz_id=quiz_id, participant__user_id=user_id)
+        .values(*fields).first()
+    )
+    if not me:
+        return me, []
+    ahead, tied = _ahead_of(me["score"], me["time_taken"])
+    counts = QuizResult.objects.filter(quiz_id=quiz_id).aggregate(
+        ahead=Count("id", filter=ahead),
+        position=Count("id", filter=ahead | (tied & Q(id__lt=me["id"]))),
+    )
+    me["rank"] = counts["ahead"] + 1
+    position = counts["position"]
+    if neighbors <= 0 or position < skip:
+        return me, []
+    start = max(skip, position - neighbors)
+    window = list(_ranked_results(quiz_id).values(*_RESULT_FIELDS)[start:position + neighbors + 1])
+    return me, window
+
+def _score_answers(answer_key, answers):
+    return sum(1 for qid, correct in answer_key if answers.get(f"q_{qid}") == correct)
+
+def _int_param(request, name, default, upper):
+    try:
+        value = int(request.GET.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    return max(0, min(upper, value))
+
+def _discard_quiz(quiz):
+    """Delete a quiz whose generation failed and give its room code back."""
+    code = quiz.room_code
+    quiz.delete()
+    release_room_code(code)
+
+@profiled
 def _extract_text_from_upload(upload):
     if not upload:
         return ""
     name = (upload.name or "").lower()
-    if name.endswith(".pdf"):
-        text = []
-        with fitz.open(stream=upload.read(), filetype="pdf") as doc:
-            for page in doc:
-                text.append(page.get_text())
-        return "\n".join(text).strip()
-    return upload.read().decode("utf-8", errors="ignore").strip()
-
-def _build_quiz_prompt(notes_text, difficulty, duration_minutes, topic_focus, num_questions):
+    pages = None
+    with metrics.timer("extract"):
+        if name.endswith(".pdf"):
+            with fitz.open(stream=upload.read(), filetype="pdf") as doc:
+                pages = [page.get_text() for page in doc]
+        else:
+            text = upload.read().decode("utf-8", errors="ignore")
+    if pages is not None:
+        # Headers, footers and page numbers would repeat in every generation batch's prompt.
+        return compaction.compact_pages(pages, source="generate_quiz").text
+    return compaction.compact_text(text, source="generate_quiz").text
+
+def _build_quiz_prompt(notes_text, difficulty, duration_minutes, topic_focus, num_questions, avoid=()):
+    avoid = "".join(f"\n  - {q}" for q in list(avoid)[:AVOID_IN_PROMPT])
     return f"""
 You are an expert exam-setter. Create a high-quality multiple-choice quiz from the given notes.
 
@@ -79,6 +214,7 @@ CONSTRAINTS:
 - Number of questions: {num_questions}.
 - Total duration: {duration_minutes} minutes.
 - Topic focus: {topic_focus or "None"}.
+- Do not repeat these questions already in the quiz: {avoid or "None"}
 
 FORMAT (STRICT JSON):
 [{{"question": "...", "options": ["A","B","C","D"], "answer_index": 0}}]
@@ -87,42 +223,56 @@ NOTES:
 {notes_text}
 """.strip()
 
-def _safe_json_from_model_response(response_text):
-    raw = (response_text or "").strip()
-    if raw.startswith("```"):
-        raw = raw.strip("`")
-        if raw.startswith("json"):
-            raw = raw[4:].strip()
-    return json.loads(raw)
-
-def _store_questions(quiz, items):
-    Question.objects.filter(quiz=quiz).delete()
-    objs = []
-    for it in items:
-        q = it.get("question", "").strip()
-        opts = it.get("options", [])
-        ans_idx = it.get("answer_index", None)
-        if not (q and len(opts) == 4 and isinstance(ans_idx, int) and 0 <= ans_idx <= 3):
-            continue
-        objs.append(Question(
+def _append_questions(quiz, items):
+    """Insert one streamed group of questions; generation calls this as batches arrive."""
+    objs = [
+        Question(
             quiz=quiz,
-            text=q,
-            option_a=str(opts[0]),
-            option_b=str(opts[1]),
-            option_c=str(opts[2]),
-            option_d=str(opts[3]),
-            correct_option=["A", "B", "C", "D"][ans_idx],
-        ))
+            text=it["question"],
+            option_a=it["options"][0],
+            option_b=it["options"][1],
+            option_c=it["options"][2],
+            option_d=it["options"][3],
+            correct_option="ABCD"[it["answer_index"]],
+        )
+        for it in items
+        if is_valid_question(it)
+    ]
     Question.objects.bulk_create(objs)
+    forget_compiled_questions(quiz.id)
     return len(objs)
 
-def _parse_iso(dt_str):
-    if not dt_str:
-        return None
-    dt = datetime.fromisoformat(dt_str)
-    if timezone.is_naive(dt):
-        dt = timezone.make_aware(dt, timezone.get_current_timezone())
-    return dt
+def _bank_draw(user_id, notes_text, count, difficulty, reuse):
+    """
+    Fingerprint the notes and, if `reuse`, draw matching questions from the
+    creator's bank. Returns (fingerprint, items); the bank never blocks generation.
+    """
+    if not settings.QUESTION_BANK_ENABLED:
+        return None, []
+    try:
+        with metrics.timer("question_bank"):
+            fp = question_bank.fingerprint(notes_text)
+            return fp, (question_bank.draw(user_id, fp, count, difficulty) if reuse else [])
+    except Exception:
+        logger.exception("Question bank lookup failed")
+        return None, []
+
+def _bank_add(user_id, fp, difficulty, items):
+    if fp is None or not items:
+        return
+    try:
+        with metrics.timer("question_bank"):
+            question_bank.add(user_id, fp, difficulty, items)
+    except Exception:
+        logger.exception("Question bank indexing failed")
+
+def _progress_key(user_id, generation_id):
+    return f"quiz:generation:{user_id}:{generation_id}"
+
+def _generation_id(request):
+    """Client-chosen id for polling progress; only short token-like values are accepted."""
+    value = (request.POST.get("generation_id") or "").strip()
+    return value if value and len(value) <= 64 and value.replace("-", "").isalnum() else None
 
 # -----------------------------
 # API for real-time lobby
@@ -139,24 +289,27 @@ def quiz_lobby_status(request, room_code):
         }
         for p in qs
     ]
-    keys = _quiz_cache_keys(room_code)
-    started = bool(cache.get(keys["start_at"]))
-    aborted = bool(cache.get(keys["aborted"])) or getattr(quiz, "status", "") == "aborted"
+    room = get_room_state(quiz.id, quiz)
 
     return JsonResponse({
         "participants": participants,
-        "quiz_started": started,
-        "quiz_aborted": aborted,
+        "quiz_started": room.started,
+        "quiz_aborted": room.aborted,
         "quiz_url": request.build_absolute_uri(reverse("quiz_page", args=[room_code])),
         "redirect": request.build_absolute_uri(reverse("home")),
     })
 
+@login_required
+def generation_progress(request, generation_id):
+    """How many questions of an in-flight generation are stored so far."""
+    progress = cache.get(_progress_key(request.user.id, generation_id)) or {}
+    return JsonResponse({"target": progress.get("target"), "ready": progress.get("ready", 0)})
+
 @require_POST
 @login_required
 @transaction.atomic
 def leave_quiz(request, room_code):
     quiz = get_object_or_404(Quiz, room_code=room_code)
-    keys = _quiz_cache_keys(room_code)
     redirect_url = reverse("home")
 
     participation = quiz.generated_quiz_participations.filter(user_id=request.user.id).first()
@@ -166,45 +319,84 @@ def leave_quiz(request, room_code):
         return JsonResponse({"ok": False, "error": "not-in-room", "redirect": redirect_url}, status=400)
 
     if is_creator:
-        cache.set(keys["aborted"], True, ABORT_TTL)
-        if hasattr(quiz, "status"):
-            quiz.status = "aborted"
-            quiz.save(update_fields=["status"])
+        set_room_state(quiz, room_state.ABORTED)
         quiz.generated_quiz_participations.all().delete()
+        _bump_lobby_version(quiz.id)
         return JsonResponse({"ok": True, "aborted": True, "redirect": redirect_url})
 
     participation.delete()
+    _bump_lobby_version(quiz.id)
+    _results_changed(quiz.id)
     return JsonResponse({"ok": True, "aborted": False, "redirect": redirect_url})
 
 # -----------------------------
 # Views
 # -----------------------------
+def _create_room(form, user):
+    """Save the quiz with a fresh room code; None if the code space is exhausted."""
+    quiz = form.save(commit=False)
+    quiz.creator = user
+    quiz.is_active = True
+    for _ in range(ROOM_CODE_ATTEMPTS):
+        try:
+            quiz.room_code = allocate_room_code()
+        except RoomCodesExhausted:
+            return None
+        try:
+            with transaction.atomic():
+                quiz.save()
+            return quiz
+        except IntegrityError:
+            # Another room took the code between allocation and insert; draw again.
+            if not Quiz.objects.filter(room_code=quiz.room_code).exists():
+                raise
+    return None
+
+async def _astream_content(prompt):
+    """
+    Yield Gemini's response text as it streams. Each wait (first byte, next
+    chunk) is bounded by LLM_TIMEOUT_SECONDS, so a stalled stream fails the
+    batch instead of hanging the request.
+    """
+    model = get_gemini_model()
+    timeout = settings.LLM_TIMEOUT_SECONDS
+    with metrics.llm_call("generate_quiz") as call:
+        response = await asyncio.wait_for(model.generate_content_async(prompt, stream=True), timeout=timeout)
+        chunks = response.__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+            except StopAsyncIteration:
+                return
+            call.response = chunk  # the last chunk carries the usage totals
+            try:
+                yield chunk.text
+            except ValueError:
+                # Chunk without text parts (e.g. a safety stop); nothing to parse.
+                continue
+
 @login_required
-def upload_notes(request):
+@admission_controlled("generate_quiz_create")
+async def upload_notes(request):
+    arender = sync_to_async(render)
     if request.method == "POST":
+        user = await request.auser()
         form = QuizCreationForm(request.POST)
         notes_file = request.FILES.get("notes_file")
-        notes_text = _extract_text_from_upload(notes_file) or request.POST.get("notes_text", "").strip()
+        notes_text = (
+            await sync_to_async(_extract_text_from_upload, thread_sensitive=False)(notes_file)
+            or compaction.compact_text(request.POST.get("notes_text", ""), source="generate_quiz").text
+        )
 
         if not notes_text:
             messages.error(request, "Please upload or paste notes.")
-            return render(request, "generate_quiz_create.html", {"form": form})
-
-        if form.is_valid():
-            quiz = form.save(commit=False)
-            quiz.creator = request.user
-            for _ in range(5):
-                quiz.room_code = _generate_unique_room_code()
-                try:
-                    with transaction.atomic():
-                        quiz.is_active = True
-                        quiz.save()
-                        break
-                except IntegrityError:
-                    continue
-            else:
+            return await arender(request, "generate_quiz_create.html", {"form": form})
+
+        if await sync_to_async(form.is_valid)():
+            quiz = await sync_to_async(_create_room)(form, user)
+            if quiz is None:
                 messages.error(request, "Could not generate unique room code.")
-                return render(request, "generate_quiz_create.html", {"form": form})
+                return await arender(request, "generate_quiz_create.html", {"form": form})
 
             # Use requested number of questions if provided and valid; otherwise fallback to heuristic
             duration = max(1, int(quiz.duration))
@@ -214,31 +406,72 @@ def upload_notes(request):
                 requested = 0
             num_questions = requested if 5 <= requested <= 100 else max(5, min(50, round(duration / 1.7)))
 
+            generation_id = _generation_id(request)
+            progress_key = _progress_key(user.id, generation_id) if generation_id else None
+            stored = 0
+            generated = []
+
+            async def on_questions(items):
+                # Questions are stored as they stream in, so a failure late in
+                # generation still leaves a usable quiz.
+                nonlocal stored
+                stored += await sync_to_async(_append_questions)(quiz, items)
+                generated.extend(items)
+                if progress_key:
+                    await cache.aset(progress_key, {"target": num_questions, "ready": stored}, QUESTIONS_TTL)
+
+            # Questions the creator already generated from matching notes come
+            # from the bank; Gemini is only asked for the shortfall.
+            fingerprint, banked = await sync_to_async(_bank_draw, thread_sensitive=False)(
+                user.id, notes_text, num_questions, quiz.difficulty,
+                form.cleaned_data.get("use_question_bank"),
+            )
+            if banked:
+                stored += await sync_to_async(_append_questions)(quiz, banked)
+                metrics.inc("study_question_bank_questions_total", len(banked), origin="bank")
+                messages.info(request, f"Reused {len(banked)} question(s) from your question bank.")
+            banked_texts = [it["question"] for it in banked]
+
+            error = None
             try:
-                model = get_gemini_model()
-                prompt = _build_quiz_prompt(
-                    notes_text,
-                    quiz.difficulty,
-                    duration,
-                    quiz.topic_focus or "",
-                    num_questions,
-                )
-                resp = model.generate_content(prompt)
-                items = _safe_json_from_model_response(getattr(resp, "text", ""))
-                if _store_questions(quiz, items) == 0:
-                    quiz.delete()
-                    messages.error(request, "AI returned no valid questions.")
-                    return render(request, "generate_quiz_create.html", {"form": form})
+                if stored < num_questions:
+                    # Batches stream concurrently over separate note sections; only what
+                    # a failed batch did not deliver is retried.
+                    await generate_questions(
+                        notes_text,
+                        num_questions - stored,
+                        build_prompt=lambda section, count: _build_quiz_prompt(
+                            section, quiz.difficulty, duration, quiz.topic_focus or "", count, banked_texts,
+                        ),
+                        stream_model=_astream_content,
+                        on_questions=on_questions,
+                        exclude=banked_texts,
+                    )
             except Exception as e:
-                quiz.delete()
-                messages.error(request, f"Quiz generation failed: {e}")
-                return render(request, "generate_quiz_create.html", {"form": form})
+                error = "the AI took too long to respond." if isinstance(e, asyncio.TimeoutError) else e
+            finally:
+                if progress_key:
+                    await cache.adelete(progress_key)
+
+            if generated:
+                metrics.inc("study_question_bank_questions_total", len(generated), origin="generated")
+                await sync_to_async(_bank_add, thread_sensitive=False)(user.id, fingerprint, quiz.difficulty, generated)
+
+            if stored == 0:
+                await sync_to_async(_discard_quiz)(quiz)
+                if error is not None:
+                    messages.error(request, f"Quiz generation failed: {error}")
+                else:
+                    messages.error(request, "AI returned no valid questions.")
+                return await arender(request, "generate_quiz_create.html", {"form": form})
+            if stored < num_questions:
+                messages.warning(request, f"Only {stored} of {num_questions} questions could be generated.")
 
             if request.POST.get("creator_participates") == "on":
-                Participant.objects.get_or_create(
+                await Participant.objects.aget_or_create(
                     quiz=quiz,
-                    user=request.user,
-                    defaults={"name": getattr(request.user, "username", "Creator")},
+                    user=user,
+                    defaults={"name": getattr(user, "username", "Creator")},
                 )
 
             return redirect("quiz_dashboard", room_code=quiz.room_code)
@@ -246,7 +479,7 @@ def upload_notes(request):
         messages.error(request, "Please fix the errors.")
     else:
         form = QuizCreationForm()
-    return render(request, "generate_quiz_create.html", {"form": form})
+    return await arender(request, "generate_quiz_create.html", {"form": form})
 
 
 @login_required
@@ -259,34 +492,37 @@ def join_quiz(request):
             messages.error(request, "Invalid or inactive room code.")
             return redirect("generate_quiz_join")
 
-        keys = _quiz_cache_keys(room_code)
-        if cache.get(keys["aborted"]):
+        room = get_room_state(quiz.id, quiz)
+        if room.aborted:
             messages.error(request, "This quiz was ended by the creator.")
             return redirect("generate_quiz_join")
-        if cache.get(keys["start_at"]):
+        if room.started:
             messages.error(request, "Quiz has already started.")
             return redirect("generate_quiz_join")
 
-        Participant.objects.get_or_create(
+        _, created = Participant.objects.get_or_create(
             quiz=quiz, user=request.user,
             defaults={"name": name or getattr(request.user, "username", "Participant")}
         )
+        if created:
+            _bump_lobby_version(quiz.id)
         return redirect("quiz_dashboard", room_code=room_code)
     return render(request, "generate_quiz_join.html")
 
 @login_required
 def quiz_dashboard(request, room_code):
     quiz = get_object_or_404(Quiz, room_code=room_code)
-    participants_qs = quiz.generated_quiz_participations.select_related("user").order_by("joined_at")
-    participants = list(participants_qs)
     user_is_creator = (quiz.creator_id == request.user.id)
-    user_is_participant = user_is_creator or any(
-        getattr(p, "user_id", None) == request.user.id for p in participants
+    user_is_participant = user_is_creator or (
+        quiz.generated_quiz_participations.filter(user_id=request.user.id).exists()
     )
 
     return render(request, "generate_quiz_dashboard.html", {
         "quiz": quiz,
-        "participants": participants,
+        # Lazy: only evaluated when the participant list fragment isn't cached for this lobby version.
+        "participants": quiz.generated_quiz_participations.order_by("joined_at"),
+        "lobby_version": _lobby_version(quiz.id),
+        "fragment_ttl": FRAGMENT_TTL,
         "is_creator": user_is_creator,
         "user_is_creator": user_is_creator,
         "user_is_participant": user_is_participant,
@@ -299,11 +535,8 @@ def start_quiz(request, room_code):
     if quiz.creator_id != request.user.id:
         return redirect("quiz_dashboard", room_code=room_code)
 
-    keys = _quiz_cache_keys(room_code)
     now = timezone.now()
-    ends = now + timedelta(minutes=max(1, quiz.duration))
-    cache.set(keys["start_at"], now.isoformat(), timeout=quiz.duration * 120)
-    cache.set(keys["ends_at"], ends.isoformat(), timeout=quiz.duration * 120)
+    set_room_state(quiz, room_state.RUNNING, started_at=now, ends_at=now + timedelta(minutes=max(1, quiz.duration)))
 
     # If it’s an AJAX call, return JSON; otherwise do a normal redirect.
     is_ajax = request.headers.get("x-requested-with") == "XMLHttpRequest" or \
@@ -317,127 +550,135 @@ def start_quiz(request, room_code):
 @login_required
 def quiz_page(request, room_code):
     quiz = get_object_or_404(Quiz, room_code=room_code)
-    keys = _quiz_cache_keys(room_code)
-    if cache.get(keys["aborted"]) or getattr(quiz, "status", "") == "aborted":
+    room = get_room_state(quiz.id, quiz)
+    if room.aborted or not room.started:
         return redirect("quiz_dashboard", room_code=room_code)
 
-    start_iso = cache.get(keys["start_at"])
-    ends_iso = cache.get(keys["ends_at"])
-    if not (start_iso and ends_iso):
-        return redirect("quiz_dashboard", room_code=room_code)
-
-    start_at = _parse_iso(start_iso)
-    ends_at = _parse_iso(ends_iso)
-    if timezone.now() >= ends_at:
-        quiz.is_active = False
-        quiz.save(update_fields=["is_active"])
-        return redirect("quiz_results", room_code=room_code)
+    if room.is_over():
+        if room.state != room_state.ENDED:
+            set_room_state(quiz, room_state.ENDED)
+        return redirect("quiz_results", quiz_id=quiz.id)
 
-    Participant.objects.get_or_create(
+    _, created = Participant.objects.get_or_create(
         quiz=quiz, user=request.user,
         defaults={"name": getattr(request.user, "username", "Participant")}
     )
+    if created:
+        _bump_lobby_version(quiz.id)
+    compiled = compiled_questions(quiz.id)
     return render(request, "generate_quiz_quiz.html", {
         "quiz": quiz,
-        "questions": quiz.questions.all(),
-        "remaining_seconds": int((ends_at - timezone.now()).total_seconds())
+        "questions": compiled["questions"],
+        "questions_version": compiled["version"],
+        "fragment_ttl": FRAGMENT_TTL,
+        "remaining_seconds": room.remaining_seconds(),
     })
 
+def _score_submission(quiz_id, answers):
+    """(score, time taken) for one submit; both usually come from process memory."""
+    score = _score_answers(compiled_questions(quiz_id)["answer_key"], answers)
+    return score, timedelta(seconds=get_room_state(quiz_id).elapsed())
+
 @login_required
 @require_POST
-def submit_quiz(request, room_code):
-    quiz = get_object_or_404(Quiz, room_code=room_code)
-    participant = get_object_or_404(Participant, quiz=quiz, user=request.user)
-
-    score = 0
-    for q in quiz.questions.all():
-        if request.POST.get(f"q_{q.id}") == q.correct_option:
-            score += 1
-
-    keys = _quiz_cache_keys(room_code)
-    start_at = _parse_iso(cache.get(keys["start_at"]))
-    ends_at = _parse_iso(cache.get(keys["ends_at"]))
-
-    elapsed = timezone.now() - start_at if start_at else timedelta(0)
-    if ends_at and timezone.now() > ends_at:
-        elapsed = ends_at - (start_at or ends_at)
-
-    participant.score = score
-    participant.has_started = True
-    participant.save()
-
-    QuizResult.objects.update_or_create(
-        quiz=quiz, participant=participant,
-        defaults={"score": score, "time_taken": elapsed, "rank": 0}
+async def submit_quiz(request, room_code):
+    # Async so a timer-end burst waits on the write-behind buffer without
+    # holding the single thread ASGI runs sync code on; the submits then
+    # queue up together and commit as one batch.
+    user = await request.auser()
+    # One query resolves both the room and the caller's participation.
+    row = await (
+        Participant.objects.filter(quiz__room_code=room_code, user_id=user.id)
+        .values_list("id", "quiz_id").afirst()
+    )
+    if row is None:
+        raise Http404("Not a participant of this quiz.")
+    participant_id, quiz_id = row
+
+    score, elapsed = await sync_to_async(_score_submission)(quiz_id, request.POST)
+    await _result_buffer.asubmit(quiz_id, participant_id, score, elapsed)
+    return redirect("quiz_results", quiz_id=quiz_id)
+
+def _results_quiz(request, quiz_id, *fields):
+    """
+    The quiz behind a results URL, in one query, if the caller created it or
+    took part in it. Quiz ids are sequential, so anyone else gets a 404.
+    """
+    uid = request.user.id
+    quizzes = Quiz.objects.filter(pk=quiz_id).filter(
+        Q(creator_id=uid) | Exists(Participant.objects.filter(quiz_id=OuterRef("pk"), user_id=uid))
     )
-    return redirect("quiz_results", room_code=room_code)
+    return get_object_or_404(quizzes.only(*fields) if fields else quizzes)
 
 @login_required
-def quiz_results(request, room_code):
-    quiz = get_object_or_404(Quiz, room_code=room_code)
-    results = list(QuizResult.objects.filter(quiz=quiz).select_related("participant"))
-    results.sort(key=lambda r: (-int(r.score), r.time_taken or timedelta.max))
-
-    current_rank = 0
-    last_key = None
-    to_update = []
-    for idx, r in enumerate(results, start=1):
-        key = (int(r.score), r.time_taken or timedelta.max)
-        if key != last_key:
-            current_rank = idx
-            last_key = key
-        if r.rank != current_rank:
-            r.rank = current_rank
-            to_update.append(r)
-        r.is_me = (getattr(r.participant, "user_id", None) == request.user.id)
-    if to_update:
-        QuizResult.objects.bulk_update(to_update, ["rank"])
-
-    if quiz.is_active:
-        quiz.is_active = False
-        quiz.save(update_fields=["is_active"])
-
-    return render(request, "generate_quiz_results.html", {"quiz": quiz, "results": results})
+def quiz_results(request, quiz_id):
+    quiz = _results_quiz(request, quiz_id)
+    room = get_room_state(quiz.id, quiz)
+    if room.started and room.is_over() and room.state != room_state.ENDED:
+        # The timer ran out before anyone reloaded the quiz page.
+        set_room_state(quiz, room_state.ENDED)
+
+    version = _results_version(quiz.id)
+    results = [_result_row(r, request.user.id) for r in _top_results(quiz.id, version, RESULTS_TOP_N)]
+    me, neighbors = _my_result_window(quiz.id, request.user.id, RESULTS_NEIGHBORS, skip=RESULTS_TOP_N)
+    if me and any(r["is_me"] for r in results):
+        neighbors = []
+
+    return render(request, "generate_quiz_results.html", {
+        "quiz": quiz,
+        "results": results,
+        "neighbors": [_result_row(r, request.user.id) for r in neighbors],
+        "total": QuizResult.objects.filter(quiz=quiz).count(),
+        "version": version,
+    })
 
 # NEW: real-time results API
 @login_required
-def quiz_results_data(request, room_code):
-    quiz = get_object_or_404(Quiz, room_code=room_code)
-    results = list(QuizResult.objects.filter(quiz=quiz).select_related("participant").order_by("rank"))
-    data = []
-    for r in results:
-        data.append({
-            "rank": r.rank,
-            "name": r.participant.name,
-            "score": r.score,
-            "time_taken": str(r.time_taken) if r.time_taken else "—",
-            "is_me": (getattr(r.participant, "user_id", None) == request.user.id),
-        })
-    return JsonResponse({"results": data})
+def quiz_results_data(request, quiz_id):
+    """
+    Leaderboard slice for polling clients.
+
+    ?top=N      rows from the top (default RESULTS_TOP_N)
+    ?around=K   the caller's row plus K neighbors on each side
+    ?v=VERSION  version the client already has; answered with {"unchanged": true}
+    """
+    quiz_id = _results_quiz(request, quiz_id, "id").id
+    version = _results_version(quiz_id)
+    if request.GET.get("v") == str(version):
+        return JsonResponse({"unchanged": True, "version": version})
+
+    top_n = _int_param(request, "top", RESULTS_TOP_N, RESULTS_MAX_TOP_N)
+    around = _int_param(request, "around", RESULTS_NEIGHBORS, RESULTS_MAX_TOP_N)
+    results = [_result_row(r, request.user.id) for r in _top_results(quiz_id, version, top_n)]
+    me, neighbors = _my_result_window(quiz_id, request.user.id, around, skip=top_n)
+    if me and any(r["is_me"] for r in results):
+        neighbors = []
+
+    return JsonResponse({
+        "version": version,
+        "total": QuizResult.objects.filter(quiz_id=quiz_id).count(),
+        "results": results,
+        "me": _result_row(me, request.user.id) if me else None,
+        "neighbors": [_result_row(r, request.user.id) for r in neighbors],
+    })
 
 # -----------------------------
 # Results PDF
 # -----------------------------
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-
-@login_required
-def results_pdf(request, room_code):
-    quiz = get_object_or_404(Quiz, room_code=room_code)
-    results = quiz.results.order_by("rank")
-
-    resp = HttpResponse(content_type="application/pdf")
-    resp["Content-Disposition"] = f'attachment; filename="quiz_{room_code}_results.pdf"'
+RESULTS_PDF_CHUNK = 64 * 1024
 
-    p = canvas.Canvas(resp, pagesize=letter)
+def _render_results_pdf(quiz):
+    """Build the results PDF from a single server-side-iterated query."""
+    rows = _ranked_results(quiz.id).values_list("rank", "participant__name", "score").iterator(chunk_size=500)
+    buf = io.BytesIO()
+    p = pdfgen_canvas.Canvas(buf, pagesize=pagesizes.letter)
     p.setFont("Helvetica-Bold", 16)
-    p.drawString(72, 760, f"Results — {quiz.title} ({room_code})")
+    p.drawString(72, 760, f"Results — {quiz.title}" + (f" ({quiz.room_code})" if quiz.room_code else ""))
 
     y = 730
     p.setFont("Helvetica", 12)
-    for r in results:
-        line = f"{r.rank}. {r.participant.name}  —  {r.score} pts"
-        p.drawString(72, y, line)
+    for rank, name, score in rows:
+        p.drawString(72, y, f"{rank}. {name}  —  {score} pts")
         y -= 18
         if y < 72:
             p.showPage()
@@ -446,8 +687,23 @@ def results_pdf(request, room_code):
 
     p.showPage()
     p.save()
-    return resp
-
-
-
+    return buf.getvalue()
 
+@login_required
+def results_pdf(request, quiz_id):
+    quiz = _results_quiz(request, quiz_id, "id", "title", "room_code")
+
+    # Rendered once per results version; repeat downloads come from the cache.
+    key = _results_cache_keys(quiz.id, _results_version(quiz.id))["pdf"]
+    pdf = cache.get(key)
+    if pdf is None:
+        pdf = _render_results_pdf(quiz)
+        cache.set(key, pdf, RESULTS_TTL)
+
+    resp = StreamingHttpResponse(
+        (pdf[i:i + RESULTS_PDF_CHUNK] for i in range(0, len(pdf), RESULTS_PDF_CHUNK)),
+        content_type="application/pdf",
+    )
+    resp["Content-Length"] = str(len(pdf))
+    resp["Content-Disposition"] = f'attachment; filename="quiz_{quiz.id}_results.pdf"'
+    return resp
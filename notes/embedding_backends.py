@@ -0,0 +1,115 @@
+"""
+Embedding backends for the notes RAG pipeline, selected by EMBEDDING_BACKEND.
+
+  fp32  all-MiniLM-L6-v2 through sentence-transformers, full precision (default)
+  int8  the same model with its Linear layers dynamically quantized to int8;
+        typically ~2x faster on CPU with cosine agreement > 0.98 vs fp32
+  onnx  the same model on ONNX Runtime; needs sentence-transformers>=3.2 and
+        `pip install optimum[onnxruntime]`
+
+Each backend has a `tag` (e.g. "all-MiniLM-L6-v2:int8"). Every vector store
+records the tag it was built with, and queries against it are always embedded
+by that same backend, so vectors from different backends never meet in one index.
+Models load on first use.
+"""
+import asyncio
+import functools
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from study_assistant.lazy import lazy_import
+
+sentence_transformers = lazy_import("sentence_transformers")
+torch = lazy_import("torch")
+core_embeddings = lazy_import("langchain_core.embeddings")
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+ENCODE_BATCH_SIZE = 32
+
+
+class SentenceTransformerBackend:
+    name = "fp32"
+
+    def __init__(self, model_name=MODEL_NAME):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def tag(self):
+        return f"{self.model_name}:{self.name}"
+
+    def _load(self):
+        return sentence_transformers.SentenceTransformer(self.model_name, device="cpu")
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    def embed_documents(self, texts):
+        # Same preprocessing as LangChain's HuggingFaceEmbeddings, which built the older stores.
+        texts = [t.replace("\n", " ") for t in texts]
+        return self.model.encode(texts, batch_size=ENCODE_BATCH_SIZE, show_progress_bar=False).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text):
+        return await asyncio.to_thread(self.embed_query, text)
+
+
+class Int8Backend(SentenceTransformerBackend):
+    name = "int8"
+
+    def _load(self):
+        model = super()._load()
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxBackend(SentenceTransformerBackend):
+    name = "onnx"
+
+    def _load(self):
+        try:
+            return sentence_transformers.SentenceTransformer(self.model_name, device="cpu", backend="onnx")
+        except (ImportError, TypeError, ValueError) as e:
+            raise ImproperlyConfigured(
+                "The onnx embedding backend needs sentence-transformers>=3.2 and optimum[onnxruntime]."
+            ) from e
+
+
+BACKENDS = {
+    SentenceTransformerBackend.name: SentenceTransformerBackend,
+    Int8Backend.name: Int8Backend,
+    OnnxBackend.name: OnnxBackend,
+}
+# Stores written before backends were tagged were all built with fp32 MiniLM.
+LEGACY_TAG = f"{MODEL_NAME}:fp32"
+
+
+@functools.lru_cache(maxsize=None)
+def get_backend(name=None):
+    """The configured backend (or `name`), one instance per process."""
+    name = name or settings.EMBEDDING_BACKEND
+    if name not in BACKENDS:
+        raise ImproperlyConfigured(f"Unknown EMBEDDING_BACKEND {name!r}; choose from {', '.join(BACKENDS)}.")
+    cls = BACKENDS[name]
+    # Virtual subclass so LangChain/FAISS accept it without importing langchain_core up front.
+    core_embeddings.Embeddings.register(cls)
+    return cls()
+
+
+def backend_for_tag(tag):
+    model_name, _, name = tag.rpartition(":")
+    if model_name != MODEL_NAME or name not in BACKENDS:
+        raise ImproperlyConfigured(f"No embedding backend for vector store tag {tag!r}.")
+    return get_backend(name)
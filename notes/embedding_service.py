@@ -0,0 +1,197 @@
+"""
+Shared embedding sidecar.
+
+One process keeps the embedding model resident and serves every web worker
+over a Unix socket (settings.EMBEDDING_SERVICE_SOCKET), so the model's RAM is
+paid once per host instead of once per worker. Requests arriving from all
+workers within EMBEDDING_BATCH_WINDOW_MS are embedded together, up to
+EMBEDDING_MAX_BATCH texts, so single-question queries share a forward pass.
+
+    python manage.py embedding_server --socket /run/study_assistant/embed.sock
+
+Wire format (native byte order; both ends are on the same host):
+
+    request   b"EMB1" | u32 count | count x (u32 length | utf-8 bytes)
+    response  b"EMB1" | u8 0 | u32 count | u32 dim | u32 tag length | utf-8 backend tag
+                      | count*dim float32
+              b"EMB1" | u8 1 | u32 length | utf-8 error message
+
+The backend tag (e.g. "all-MiniLM-L6-v2:int8") names the model that produced
+the vectors, so clients can refuse vectors that don't match a store's recorded
+backend. A request with no texts returns just the tag.
+
+A connection may carry any number of request/response pairs in sequence.
+Queries and documents are embedded the same way (true for the MiniLM
+sentence-transformers model), so they share batches.
+"""
+import asyncio
+import logging
+import os
+import struct
+from array import array
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"EMB1"
+STATUS_OK, STATUS_ERROR = 0, 1
+MAX_TEXTS = 4096
+MAX_TEXT_BYTES = 1 << 20
+BATCH_WINDOW_MS = 5
+MAX_BATCH = 64
+
+_U32 = struct.Struct("=I")
+_HEADER = struct.Struct("=4sBIII")   # magic, status, count, dim, tag length
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+# -----------------------------
+# Encoding
+# -----------------------------
+def encode_request(texts):
+    parts = [MAGIC, _U32.pack(len(texts))]
+    for text in texts:
+        data = text.encode("utf-8")
+        parts += [_U32.pack(len(data)), data]
+    return b"".join(parts)
+
+
+def encode_vectors(vectors, tag):
+    dim = len(vectors[0]) if vectors else 0
+    flat = array("f")
+    for vec in vectors:
+        flat.extend(vec)
+    tag = tag.encode("utf-8")
+    return _HEADER.pack(MAGIC, STATUS_OK, len(vectors), dim, len(tag)) + tag + flat.tobytes()
+
+
+def encode_error(message):
+    data = message.encode("utf-8")[:4096]
+    return MAGIC + bytes([STATUS_ERROR]) + _U32.pack(len(data)) + data
+
+
+def payload_size(header):
+    """Bytes that follow `header`, the first _HEADER.size bytes of an OK response."""
+    _, _, count, dim, tag_length = _HEADER.unpack(header)
+    return tag_length + count * dim * 4
+
+
+def decode_vectors(header, payload):
+    """Returns (backend tag, vectors) from an OK response's header and payload."""
+    _, _, count, dim, tag_length = _HEADER.unpack(header)
+    flat = array("f")
+    flat.frombytes(payload[tag_length:])
+    return payload[:tag_length].decode("utf-8"), [flat[i * dim:(i + 1) * dim].tolist() for i in range(count)]
+
+
+async def read_request(reader):
+    if await reader.readexactly(4) != MAGIC:
+        raise ProtocolError("bad magic")
+    (count,) = _U32.unpack(await reader.readexactly(4))
+    if count > MAX_TEXTS:
+        raise ProtocolError(f"too many texts ({count} > {MAX_TEXTS})")
+    texts = []
+    for _ in range(count):
+        (length,) = _U32.unpack(await reader.readexactly(4))
+        if length > MAX_TEXT_BYTES:
+            raise ProtocolError(f"text too long ({length} bytes)")
+        texts.append((await reader.readexactly(length)).decode("utf-8", errors="replace"))
+    return texts
+
+
+# -----------------------------
+# Server
+# -----------------------------
+class EmbeddingServer:
+    def __init__(self, embeddings, socket_path, window_ms=BATCH_WINDOW_MS, max_batch=MAX_BATCH):
+        self.embeddings = embeddings
+        self.tag = getattr(embeddings, "tag", type(embeddings).__name__)
+        self.socket_path = socket_path
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.batches = 0
+        self.requests = 0
+        self._queue = None
+
+    async def serve(self, ready=None):
+        """Serve until cancelled. `ready` (an Event-like object) is set once listening."""
+        self._queue = asyncio.Queue()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)   # stale socket from a previous run
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        batcher = asyncio.create_task(self._batch_loop())
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    async def _handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    texts = await read_request(reader)
+                except asyncio.IncompleteReadError:
+                    break   # client closed the connection
+                except ProtocolError as e:
+                    writer.write(encode_error(str(e)))
+                    await writer.drain()
+                    break
+                self.requests += 1
+                if not texts:
+                    writer.write(encode_vectors([], self.tag))
+                    await writer.drain()
+                    continue
+                future = loop.create_future()
+                await self._queue.put((texts, future))
+                try:
+                    writer.write(encode_vectors(await future, self.tag))
+                except Exception as e:
+                    writer.write(encode_error(f"{type(e).__name__}: {e}"))
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.window
+            while size < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            texts = [t for item_texts, _ in batch for t in item_texts]
+            self.batches += 1
+            try:
+                # The model runs off the loop so new requests keep queueing meanwhile.
+                vectors = await loop.run_in_executor(None, self.embeddings.embed_documents, texts)
+            except Exception as e:
+                logger.exception("Embedding batch of %d texts failed", len(texts))
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            start = 0
+            for item_texts, future in batch:
+                if not future.done():
+                    future.set_result(vectors[start:start + len(item_texts)])
+                start += len(item_texts)
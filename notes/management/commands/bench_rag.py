@@ -0,0 +1,276 @@
+"""
+Benchmark for the notes RAG pipeline (notes/rag_utils.py).
+
+Runs every document in notes/bench_corpus/ (small ~4 KB, medium ~40 KB,
+large ~200 KB of synthetic lecture notes) through the pipeline stages and
+reports, per document:
+
+  - chunking throughput (split_notes)
+  - embedding throughput
+  - store_notes_as_vectors end to end
+  - FAISS index save and load latency, and index size on disk
+  - similarity-search query latency
+  - peak RSS of the process after the document
+
+`--embedder fake` (default) uses a deterministic hashing embedder, so runs are
+repeatable and need no model download. Timings then reflect the chunker, FAISS
+and serialization, not the model. `--embedder hf` uses the real local model
+with EMBEDDING_BACKEND (or `--backend`), and `--embedder socket` the shared
+embedding server at EMBEDDING_SERVICE_SOCKET (manage.py embedding_server).
+
+`--compare-backends fp32,int8` skips the pipeline stages and instead embeds
+each document with every listed backend, reporting throughput and the cosine
+agreement of each backend's vectors with the first one's.
+
+    python manage.py bench_rag
+    python manage.py bench_rag --embedder hf --sizes small,medium --json bench_rag.json
+    python manage.py bench_rag --compare-backends fp32,int8,onnx --sizes medium
+"""
+import hashlib
+import json
+import math
+import os
+import platform
+import re
+import statistics
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+from notes import embedding_backends, rag_utils, store_registry
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CORPUS_DIR = Path(__file__).resolve().parents[2] / "bench_corpus"
+QUERIES = [
+    "What does the Carnot cycle determine?",
+    "How is elasticity related to the demand curve?",
+    "Explain the role of mitochondria and ATP.",
+    "What is an eigenvalue of a matrix?",
+    "Why did industrialization change trade routes?",
+    "What happens to entropy in an adiabatic process?",
+    "How does a monopoly affect surplus?",
+    "What is the kernel of a linear map?",
+]
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic bag-of-words embedder: each token is hashed into one of `dim` signed buckets."""
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def _embed(self, text):
+        vec = [0.0] * self.dim
+        for token in re.findall(r"\w+", text.lower()):
+            h = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "big")
+            vec[h % self.dim] += 1.0 if h >> 63 else -1.0
+        norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+        return [v / norm for v in vec]
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def _dir_size(path):
+    return sum(f.stat().st_size for f in Path(path).iterdir() if f.is_file())
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def _load_backend(name):
+    """The named backend with its model loaded, or CommandError if it can't be."""
+    try:
+        backend = embedding_backends.get_backend(name)
+        backend.embed_query("warm up")
+    except (ImportError, ImproperlyConfigured) as e:
+        raise CommandError(f"Embedding backend {name or settings.EMBEDDING_BACKEND!r} unavailable: {e}")
+    return backend
+
+
+class Command(BaseCommand):
+    help = "Benchmark chunking, embedding, indexing and querying of the notes RAG pipeline."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--embedder", choices=["fake", "hf", "socket"], default="fake")
+        parser.add_argument("--backend", choices=list(embedding_backends.BACKENDS),
+                            help="Backend for --embedder hf (default: EMBEDDING_BACKEND).")
+        parser.add_argument("--compare-backends",
+                            help="Comma-separated backends to compare on throughput and vector agreement.")
+        parser.add_argument("--sizes", default="small,medium,large",
+                            help="Comma-separated corpus documents to run.")
+        parser.add_argument("--repeat", type=int, default=3,
+                            help="Runs per stage; the median is reported.")
+        parser.add_argument("--json", dest="json_path", help="Write results to this file as JSON.")
+
+    def handle(self, *args, **opts):
+        sizes = [s.strip() for s in opts["sizes"].split(",") if s.strip()]
+        missing = [s for s in sizes if not (CORPUS_DIR / f"{s}.txt").exists()]
+        if missing:
+            raise CommandError(f"No corpus document(s): {', '.join(missing)}")
+
+        if opts["compare_backends"]:
+            names = [n.strip() for n in opts["compare_backends"].split(",") if n.strip()]
+            unknown = [n for n in names if n not in embedding_backends.BACKENDS]
+            if unknown:
+                raise CommandError(f"Unknown backend(s): {', '.join(unknown)}")
+            report = self._compare_backends(names, sizes, max(1, opts["repeat"]))
+            if opts["json_path"]:
+                with open(opts["json_path"], "w") as fh:
+                    json.dump(report, fh, indent=2)
+            return
+
+        if opts["embedder"] == "hf":
+            embeddings = _load_backend(opts["backend"])
+        elif opts["embedder"] == "socket":
+            if not settings.EMBEDDING_SERVICE_SOCKET:
+                raise CommandError("Set EMBEDDING_SERVICE_SOCKET to the embedding server's socket.")
+            embeddings = rag_utils.get_hf_embeddings()
+        else:
+            embeddings = HashingEmbeddings()
+
+        report = {
+            "started_at": timezone.now().isoformat(),
+            "embedder": opts["embedder"],
+            "backend": getattr(embeddings, "tag", None),
+            "repeat": opts["repeat"],
+            "python": platform.python_version(),
+            "peak_rss_mb_start": _peak_rss_mb(),
+            "documents": {},
+        }
+        for size in sizes:
+            text = (CORPUS_DIR / f"{size}.txt").read_text()
+            stats = self._bench_document(text, embeddings, max(1, opts["repeat"]))
+            report["documents"][size] = stats
+            self.stdout.write(
+                f"{size:>7}: {stats['chars']} chars, {stats['chunks']} chunks | "
+                f"chunk {stats['chunk_chars_per_s'] / 1e6:.2f} MB/s | "
+                f"embed {stats['embed_chunks_per_s']:.0f} chunks/s | "
+                f"store {stats['store_s'] * 1000:.0f}ms | "
+                f"save {stats['save_ms']:.1f}ms load {stats['load_ms']:.1f}ms | "
+                f"query p50 {stats['query_p50_ms']:.2f}ms p95 {stats['query_p95_ms']:.2f}ms | "
+                f"rss {stats['peak_rss_mb'] or 0:.0f}MB"
+            )
+        if opts["json_path"]:
+            with open(opts["json_path"], "w") as fh:
+                json.dump(report, fh, indent=2)
+
+    def _bench_document(self, text, embeddings, repeat):
+        chunk_times, embed_times, store_times, save_times, load_times = [], [], [], [], []
+        for _ in range(repeat):
+            docs, t = _timed(lambda: rag_utils.split_notes(text))
+            chunk_times.append(t)
+            _, t = _timed(lambda: embeddings.embed_documents([d.page_content for d in docs]))
+            embed_times.append(t)
+
+            user_id = f"bench-{uuid.uuid4().hex}"
+            try:
+                _, t = _timed(lambda: rag_utils.store_notes_as_vectors(text, user_id, embeddings=embeddings))
+                store_times.append(t)
+            finally:
+                store_registry.remove_store_files(rag_utils._vector_path(user_id))
+
+        db = FAISS.from_documents(docs, embeddings)
+        tmp = tempfile.mkdtemp(prefix="bench_rag_")
+        try:
+            for _ in range(repeat):
+                _, t = _timed(lambda: db.save_local(tmp))
+                save_times.append(t)
+                loaded, t = _timed(lambda: rag_utils._load_vectorstore(tmp, embeddings))
+                load_times.append(t)
+            index_bytes = _dir_size(tmp)
+        finally:
+            store_registry.remove_store_files(tmp)
+
+        query_ms = []
+        for _ in range(repeat):
+            for q in QUERIES:
+                _, t = _timed(lambda: loaded.similarity_search(q, k=4))
+                query_ms.append(t * 1000)
+        query_ms.sort()
+
+        chunk_s = statistics.median(chunk_times)
+        embed_s = statistics.median(embed_times)
+        return {
+            "chars": len(text),
+            "chunks": len(docs),
+            "chunk_s": chunk_s,
+            "chunk_chars_per_s": len(text) / chunk_s if chunk_s else 0.0,
+            "embed_s": embed_s,
+            "embed_chunks_per_s": len(docs) / embed_s if embed_s else 0.0,
+            "store_s": statistics.median(store_times),
+            "save_ms": statistics.median(save_times) * 1000,
+            "load_ms": statistics.median(load_times) * 1000,
+            "index_bytes": index_bytes,
+            "query_p50_ms": query_ms[len(query_ms) // 2],
+            "query_p95_ms": query_ms[min(len(query_ms) - 1, math.ceil(0.95 * len(query_ms)) - 1)],
+            "queries": len(query_ms),
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+
+    def _compare_backends(self, names, sizes, repeat):
+        backends = [_load_backend(name) for name in names]
+        report = {
+            "started_at": timezone.now().isoformat(),
+            "backends": [b.tag for b in backends],
+            "repeat": repeat,
+            "python": platform.python_version(),
+            "documents": {},
+        }
+        for size in sizes:
+            texts = [d.page_content for d in rag_utils.split_notes((CORPUS_DIR / f"{size}.txt").read_text())]
+            results, reference = {}, None
+            for backend in backends:
+                times = []
+                for _ in range(repeat):
+                    vectors, t = _timed(lambda: backend.embed_documents(texts))
+                    times.append(t)
+                embed_s = statistics.median(times)
+                stats = {"embed_s": embed_s, "chunks_per_s": len(texts) / embed_s if embed_s else 0.0}
+                if reference is None:
+                    reference = vectors
+                else:
+                    cosines = [_cosine(a, b) for a, b in zip(reference, vectors)]
+                    stats["cosine_mean"] = statistics.mean(cosines)
+                    stats["cosine_min"] = min(cosines)
+                results[backend.name] = stats
+                agreement = (f" | cosine vs {backends[0].name} mean {stats['cosine_mean']:.4f} "
+                             f"min {stats['cosine_min']:.4f}" if "cosine_mean" in stats else "")
+                self.stdout.write(
+                    f"{size:>7} {backend.name:>5}: {len(texts)} chunks | "
+                    f"embed {stats['chunks_per_s']:.0f} chunks/s ({embed_s * 1000:.0f}ms){agreement}"
+                )
+            report["documents"][size] = results
+        return report
@@ -0,0 +1,42 @@
+"""
+Run the shared embedding sidecar (notes/embedding_service.py).
+
+    python manage.py embedding_server --socket /run/study_assistant/embed.sock
+
+Point the web workers at it with EMBEDDING_SERVICE_SOCKET set to the same path,
+and run it with the same EMBEDDING_BACKEND as the workers. Every response
+carries this server's backend tag, so a worker never queries a vector store
+with vectors from a different backend.
+"""
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from notes import embedding_service, rag_utils
+
+
+class Command(BaseCommand):
+    help = "Serve embeddings for all web workers from one resident model over a Unix socket."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--socket", default=settings.EMBEDDING_SERVICE_SOCKET,
+                            help="Socket path (default: EMBEDDING_SERVICE_SOCKET).")
+        parser.add_argument("--window-ms", type=float, default=settings.EMBEDDING_BATCH_WINDOW_MS,
+                            help="How long to wait for more requests to join a batch.")
+        parser.add_argument("--max-batch", type=int, default=settings.EMBEDDING_MAX_BATCH)
+
+    def handle(self, *args, **opts):
+        if not opts["socket"]:
+            raise CommandError("No socket path: pass --socket or set EMBEDDING_SERVICE_SOCKET.")
+        embeddings = rag_utils._local_embeddings()
+        embeddings.embed_documents(["warm up"])
+        server = embedding_service.EmbeddingServer(
+            embeddings, opts["socket"], window_ms=opts["window_ms"], max_batch=opts["max_batch"],
+        )
+        self.stdout.write(f"Embedding server ({embeddings.tag}) listening on {opts['socket']}")
+        try:
+            asyncio.run(server.serve())
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Served {server.requests} requests in {server.batches} batches")
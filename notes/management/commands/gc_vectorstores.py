@@ -0,0 +1,36 @@
+"""
+Remove expired and least recently used per-user vector stores
+(notes/store_registry.py). Run it from cron, e.g. hourly:
+
+    python manage.py gc_vectorstores
+    python manage.py gc_vectorstores --ttl-days 7 --max-mb 1024 --dry-run
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from notes.store_registry import collect_garbage
+
+
+class Command(BaseCommand):
+    help = "Evict vector stores past VECTORSTORE_TTL_DAYS, then LRU ones over VECTORSTORE_MAX_BYTES."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ttl-days", type=int, default=None,
+                            help="Evict stores not queried for this many days (default: VECTORSTORE_TTL_DAYS).")
+        parser.add_argument("--max-mb", type=int, default=None,
+                            help="Disk quota for all stores in MB (default: VECTORSTORE_MAX_BYTES).")
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be evicted.")
+
+    def handle(self, *args, **opts):
+        ttl = timedelta(days=opts["ttl_days"]) if opts["ttl_days"] is not None else None
+        max_bytes = opts["max_mb"] * 1024 * 1024 if opts["max_mb"] is not None else None
+        stats = collect_garbage(ttl=ttl, max_bytes=max_bytes, dry_run=opts["dry_run"])
+        verb = "Would evict" if opts["dry_run"] else "Evicted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {stats['expired']} expired and {stats['over_quota']} over-quota store(s), "
+            f"{stats['freed_bytes'] / 1e6:.1f} MB; {stats['busy']} busy, "
+            f"{stats['adopted']} adopted, {stats['orphans_removed']} orphan(s) removed, "
+            f"{stats['orphans_kept']} kept outside a dedicated VECTORSTORE_DIR; "
+            f"{stats['legacy_moved']} legacy store(s) moved in, {stats['legacy_removed']} removed."
+        ))
@@ -9,4 +9,16 @@ class Note(models.Model):
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return self.title
+
+class VectorStore(models.Model):
+    """A user's FAISS store on disk, see store_registry.py."""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='vector_store')
+    path = models.CharField(max_length=500)
+    size_bytes = models.BigIntegerField(default=0)
+    backend = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_accessed_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.path} ({self.size_bytes} bytes)"
@@ -1,17 +1,160 @@
+import asyncio
+import json
+import logging
 import os
-from bs4 import BeautifulSoup
-from langchain_community.vectorstores import FAISS
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.docstore.document import Document
-from langchain.chains import RetrievalQA
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain_google_genai import ChatGoogleGenerativeAI
+import socket
+import struct
+import threading
+
+from django.conf import settings
+
+from study_assistant import metrics
+from study_assistant.lazy import lazy_import
+from study_assistant.profiling import profiled
+
+from . import embedding_backends, embedding_service, store_registry
+
+logger = logging.getLogger(__name__)
+
+# LangChain, FAISS and the embedding model take seconds to import; load them on first use.
+vectorstores = lazy_import("langchain_community.vectorstores")
+text_splitter = lazy_import("langchain.text_splitter")
+docstore = lazy_import("langchain.docstore.document")
+chains = lazy_import("langchain.chains")
+core_embeddings = lazy_import("langchain_core.embeddings")
+google_genai = lazy_import("langchain_google_genai")
 
 # -----------------------------
 # Hugging Face Embeddings Model
 # -----------------------------
-def get_hf_embeddings():
-    return HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+def _local_embeddings():
+    """The in-process model for EMBEDDING_BACKEND, loaded once per worker."""
+    return embedding_backends.get_backend()
+
+class EmbeddingBackendMismatch(RuntimeError):
+    """The vectors came from a different backend than the store they are meant for."""
+
+
+class SocketEmbeddings:
+    """
+    Client for the shared embedding sidecar (notes/embedding_service.py).
+    Keeps one connection per thread; if the sidecar is unreachable, falls
+    back to the in-process model so requests still succeed.
+
+    Every response names the sidecar's backend. With `expected_tag` set (the
+    backend a vector store was built with), vectors from any other backend,
+    sidecar or fallback, raise EmbeddingBackendMismatch instead of being
+    compared against the store.
+    """
+
+    CHUNK = 64  # texts per request, so one big upload doesn't hold up queries
+
+    def __init__(self, socket_path, timeout=60, expected_tag=None):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.expected_tag = expected_tag
+        self._server_tag = None
+        self._local = threading.local()
+
+    @property
+    def tag(self):
+        """The backend vectors come from: the sidecar's, or the fallback model's when it's down."""
+        if self._server_tag is None:
+            try:
+                self._request([])
+            except OSError:
+                return _local_embeddings().tag
+        return self._server_tag
+
+    def _check(self, tag):
+        if self.expected_tag is not None and tag != self.expected_tag:
+            raise EmbeddingBackendMismatch(
+                f"embeddings from {tag!r} requested for a store built with {self.expected_tag!r}"
+            )
+
+    def _connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _drop(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    @staticmethod
+    def _recv_exact(sock, n):
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = sock.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError("embedding server closed the connection")
+            buf += chunk
+        return bytes(buf)
+
+    def _request(self, texts):
+        for attempt in range(2):
+            try:
+                sock = self._connection()
+                sock.sendall(embedding_service.encode_request(texts))
+                head = self._recv_exact(sock, 5)
+                if head[:4] != embedding_service.MAGIC:
+                    raise ConnectionError("unexpected reply from embedding server")
+                if head[4] == embedding_service.STATUS_ERROR:
+                    (length,) = struct.unpack("=I", self._recv_exact(sock, 4))
+                    raise RuntimeError(f"embedding server: {self._recv_exact(sock, length).decode()}")
+                header = head + self._recv_exact(sock, 12)
+                tag, vectors = embedding_service.decode_vectors(
+                    header, self._recv_exact(sock, embedding_service.payload_size(header))
+                )
+                self._server_tag = tag
+                return tag, vectors
+            except OSError:
+                # Stale pooled connection (server restarted): retry once on a fresh one.
+                self._drop()
+                if attempt:
+                    raise
+
+    def embed_documents(self, texts):
+        try:
+            vectors = []
+            for i in range(0, len(texts), self.CHUNK):
+                tag, chunk = self._request(texts[i:i + self.CHUNK])
+                self._check(tag)
+                vectors += chunk
+            return vectors
+        except OSError as e:
+            logger.warning("Embedding server unavailable (%s); embedding in-process", e)
+            local = _local_embeddings()
+            self._check(local.tag)
+            return local.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text):
+        return await asyncio.to_thread(self.embed_query, text)
+
+def get_hf_embeddings(expected_tag=None):
+    """
+    Embeddings for storing and querying notes: the shared sidecar when
+    EMBEDDING_SERVICE_SOCKET is set, otherwise this worker's own model.
+    `expected_tag` makes the sidecar client refuse vectors from another backend.
+    """
+    socket_path = getattr(settings, "EMBEDDING_SERVICE_SOCKET", "")
+    if socket_path:
+        # Virtual subclass so LangChain/FAISS accept it without importing langchain_core up front.
+        core_embeddings.Embeddings.register(SocketEmbeddings)
+        return SocketEmbeddings(socket_path, expected_tag=expected_tag)
+    return _local_embeddings()
 
 # -----------------------------
 # Gemini LLM (for generating / answering)
@@ -20,7 +163,7 @@ def get_working_llm():
     gemini_key = os.getenv("GOOGLE_API_KEY_1")  # single key for simplicity
     if not gemini_key:
         raise RuntimeError("⚠️ No Gemini API key found.")
-    return ChatGoogleGenerativeAI(
+    return google_genai.ChatGoogleGenerativeAI(
         model="gemini-1.5-flash",
         google_api_key=gemini_key
     )
@@ -28,47 +171,105 @@ def get_working_llm():
 # -----------------------------
 # Store Notes as Vectors (from raw text)
 # -----------------------------
-def store_notes_as_vectors(raw_text: str, user_id: str):
+def _vector_path(user_id: str) -> str:
+    return store_registry.store_path(user_id)
+
+BACKEND_FILE = "embedding.json"
+
+def _embeddings_tag(embeddings) -> str:
+    return getattr(embeddings, "tag", type(embeddings).__name__)
+
+def _write_backend_tag(vector_path: str, embeddings):
+    with open(os.path.join(vector_path, BACKEND_FILE), "w") as fh:
+        json.dump({"backend": _embeddings_tag(embeddings)}, fh)
+
+def _read_backend_tag(vector_path: str) -> str:
+    try:
+        with open(os.path.join(vector_path, BACKEND_FILE)) as fh:
+            return json.load(fh)["backend"]
+    except FileNotFoundError:
+        return embedding_backends.LEGACY_TAG
+
+def split_notes(raw_text: str):
+    """Chunk raw notes into overlapping ~500-character documents."""
+    splitter = text_splitter.CharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    with metrics.timer("chunk"):
+        return splitter.split_documents([docstore.Document(page_content=raw_text)])
+
+@profiled
+def store_notes_as_vectors(raw_text: str, user_id: str, embeddings=None):
     """
     Converts raw text into embeddings and stores FAISS vectorstore
-    in a temporary path based on user ID.
+    in a temporary path based on user ID. `embeddings` defaults to the
+    Hugging Face model; the benchmarks pass their own.
+    Returns the embedding backend tag recorded with the store.
     """
-    splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    docs = splitter.split_documents([Document(page_content=raw_text)])
+    docs = split_notes(raw_text)
 
-    vector_path = f"/tmp/vectorstore_user_{user_id}"
-    os.makedirs(vector_path, exist_ok=True)
+    vector_path = _vector_path(user_id)
 
-    embeddings = get_hf_embeddings()
-    db = FAISS.from_documents(docs, embeddings)
-    db.save_local(vector_path)
+    embeddings = embeddings or get_hf_embeddings()
+    if isinstance(embeddings, SocketEmbeddings):
+        # Pin the sidecar's current backend, so a sidecar restarted with another
+        # one mid-upload fails the upload instead of mixing vectors.
+        embeddings.expected_tag = embeddings.tag
+    with metrics.timer("embed"):
+        db = vectorstores.FAISS.from_documents(docs, embeddings)
+    with metrics.timer("index_save"), store_registry.store_lock(vector_path, exclusive=True):
+        os.makedirs(vector_path, exist_ok=True)
+        db.save_local(vector_path)
+        _write_backend_tag(vector_path, embeddings)
+    return _embeddings_tag(embeddings)
 
 # -----------------------------
 # Ask Question with RAG
 # -----------------------------
-def ask_question_with_rag(user_id: str, question: str) -> str:
+NO_NOTES_MESSAGE = "⚠️ No notes found. Please upload notes first."
+
+@profiled
+def _load_vectorstore(vector_path: str, embeddings=None):
     """
-    Loads FAISS vectorstore for a given user ID and runs RAG using Gemini LLM.
+    Queries must be embedded by the backend that built the store, so a store
+    written under a different EMBEDDING_BACKEND is queried with its own
+    backend (loaded in-process) until the user re-uploads their notes.
+    Explicit `embeddings` (the benchmarks) are used as given.
+    Raises FileNotFoundError if the store is gone (never written, or collected).
     """
-    vector_path = f"/tmp/vectorstore_user_{user_id}"
-    if not os.path.exists(os.path.join(vector_path, "index.faiss")):
-        return "⚠️ No notes found. Please upload notes first."
+    index_file = os.path.join(vector_path, "index.faiss")
+    if not os.path.exists(index_file):
+        raise FileNotFoundError(index_file)
+    with store_registry.store_lock(vector_path):
+        if not os.path.exists(index_file):   # collected while we waited for the lock
+            raise FileNotFoundError(index_file)
+        if embeddings is None:
+            tag = _read_backend_tag(vector_path)
+            embeddings = get_hf_embeddings(expected_tag=tag)
+            if _embeddings_tag(embeddings) != tag:
+                embeddings = embedding_backends.backend_for_tag(tag)
+        with metrics.timer("index_load"):
+            return vectorstores.FAISS.load_local(vector_path, embeddings, allow_dangerous_deserialization=True)
 
-    embeddings = get_hf_embeddings()
-    db = FAISS.load_local(vector_path, embeddings, allow_dangerous_deserialization=True)
+async def aask_question_with_rag(user_id: str, question: str) -> str:
+    """
+    Loads FAISS vectorstore for a given user ID and runs RAG using Gemini LLM.
+    The FAISS load runs in a worker thread, retrieval uses LangChain's
+    executor-backed async path and the Gemini call is awaited.
+    """
+    try:
+        db = await asyncio.to_thread(_load_vectorstore, _vector_path(user_id))
+    except FileNotFoundError:
+        # Notes uploaded before VECTORSTORE_DIR may still sit in the legacy location.
+        if not await asyncio.to_thread(store_registry.adopt_legacy_store, user_id):
+            return NO_NOTES_MESSAGE
+        try:
+            db = await asyncio.to_thread(_load_vectorstore, _vector_path(user_id))
+        except FileNotFoundError:
+            return NO_NOTES_MESSAGE
     retriever = db.as_retriever()
 
     llm = get_working_llm()
-    qa = RetrievalQA.from_chain_type(llm=llm, retriever=retriever)
-
-    return qa.run(question)
-
-
-
-
-
-
-
-
-
+    qa = chains.RetrievalQA.from_chain_type(llm=llm, retriever=retriever)
 
+    with metrics.llm_call("rag", stage="rag"):
+        result = await qa.ainvoke({"query": question})
+    return result["result"]
@@ -0,0 +1,14 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import VectorStore
+from .store_registry import remove_store_files
+
+
+@receiver(post_delete, sender=VectorStore)
+def remove_vector_store_files(sender, instance, **kwargs):
+    # Also runs when the user is deleted (CASCADE); keep the files if that rolls back.
+    transaction.on_commit(partial(remove_store_files, instance.path))
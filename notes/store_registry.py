@@ -0,0 +1,369 @@
+"""
+Registry and garbage collection for the per-user FAISS stores.
+
+Every store written by rag_utils.store_notes_as_vectors gets a VectorStore row
+with its size and last access. collect_garbage() removes stores not queried
+for VECTORSTORE_TTL_DAYS, then the least recently used ones until the total is
+under VECTORSTORE_MAX_BYTES. It runs from `manage.py gc_vectorstores` (cron)
+and, at most every VECTORSTORE_GC_INTERVAL seconds, on a background thread
+kicked off by uploads. Deleting a VectorStore row (directly or through its
+user) removes the files once the transaction commits.
+
+Store directories without a row are adopted when their user exists. Those of
+unknown users are only deleted when VECTORSTORE_DIR is dedicated to the stores,
+i.e. holds the DIR_MARKER file written when the registry created it; in a
+shared directory such as /tmp they may belong to another deployment.
+
+Stores written before VECTORSTORE_DIR existed live in VECTORSTORE_LEGACY_DIR
+(/tmp). Collection moves those of known users into VECTORSTORE_DIR and
+registers them, and deletes the rest (unknown users, or users who uploaded
+again since). A user asking a question first is moved on the spot.
+
+Readers hold a shared flock on "<store>.lock" while loading, writers and the
+collector an exclusive one; the collector skips stores that are in use.
+"""
+import contextlib
+import logging
+import os
+import re
+import shutil
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import VectorStore
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, GC is then best effort
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+STORE_PREFIX = "vectorstore_user_"
+_STORE_RE = re.compile(rf"^{STORE_PREFIX}(\d+)$")
+TOUCH_INTERVAL = timedelta(minutes=5)   # last_accessed_at granularity; saves a write per question
+GC_CACHE_KEY = "notes:vectorstore_gc"
+DIR_MARKER = ".vectorstores"             # in VECTORSTORE_DIR: the registry created it and owns its contents
+
+
+class StoreBusy(Exception):
+    pass
+
+
+def store_path(user_id):
+    return os.path.join(settings.VECTORSTORE_DIR, f"{STORE_PREFIX}{user_id}")
+
+
+def _ensure_root(root):
+    if not os.path.isdir(root):
+        os.makedirs(root, exist_ok=True)
+        with open(os.path.join(root, DIR_MARKER), "a"):
+            pass
+
+
+def _owns_root(root):
+    return os.path.exists(os.path.join(root, DIR_MARKER))
+
+
+@contextlib.contextmanager
+def store_lock(path, exclusive=False, blocking=True):
+    """flock "<path>.lock"; raises StoreBusy if `blocking` is False and it is held."""
+    if fcntl is None:
+        yield
+        return
+    lock_path = path + ".lock"
+    _ensure_root(os.path.dirname(lock_path))
+    flags = (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | (0 if blocking else fcntl.LOCK_NB)
+    while True:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, flags)
+        except BlockingIOError:
+            os.close(fd)
+            raise StoreBusy(path)
+        try:
+            # The collector unlinks lock files; make sure ours is still the live one.
+            if os.fstat(fd).st_ino == os.stat(lock_path).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+    try:
+        yield
+    finally:
+        os.close(fd)
+
+
+def _dir_size(path):
+    try:
+        return sum(e.stat().st_size for e in os.scandir(path) if e.is_file())
+    except FileNotFoundError:
+        return 0
+
+
+def _remove_files(path):
+    """Delete a store directory and its lock file. The caller holds the exclusive lock."""
+    shutil.rmtree(path, ignore_errors=True)
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path + ".lock")
+
+
+def remove_store_files(path):
+    with store_lock(path, exclusive=True):
+        _remove_files(path)
+
+
+# -----------------------------
+# Registry
+# -----------------------------
+def record_store(user_id, backend=""):
+    """Register (or refresh) a user's store after it was written."""
+    path = store_path(user_id)
+    VectorStore.objects.update_or_create(
+        user_id=user_id,
+        defaults={"path": path, "size_bytes": _dir_size(path), "backend": backend,
+                  "last_accessed_at": timezone.now()},
+    )
+
+
+def touch(user_id):
+    now = timezone.now()
+    VectorStore.objects.filter(user_id=user_id, last_accessed_at__lt=now - TOUCH_INTERVAL).update(last_accessed_at=now)
+
+
+# -----------------------------
+# Legacy location
+# -----------------------------
+def _legacy_root():
+    legacy = settings.VECTORSTORE_LEGACY_DIR
+    if not legacy or os.path.realpath(legacy) == os.path.realpath(settings.VECTORSTORE_DIR):
+        return None
+    return legacy
+
+
+def _move_legacy(user_id, old):
+    """
+    Move a legacy store into VECTORSTORE_DIR and register it. Returns False,
+    after deleting it, if the user already has a store there.
+    """
+    new = store_path(user_id)
+    with store_lock(old, exclusive=True, blocking=False), store_lock(new, exclusive=True, blocking=False):
+        if os.path.exists(new):
+            _remove_files(old)
+            return False
+        mtime = datetime.fromtimestamp(os.path.getmtime(old), tz=dt_timezone.utc)
+        shutil.move(old, new)
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(old + ".lock")
+    VectorStore.objects.update_or_create(
+        user_id=user_id,
+        defaults={"path": new, "size_bytes": _dir_size(new), "last_accessed_at": mtime},
+    )
+    return True
+
+
+def adopt_legacy_store(user_id):
+    """Move one user's legacy store into VECTORSTORE_DIR; True if there was one to move."""
+    root = _legacy_root()
+    if root is None:
+        return False
+    old = os.path.join(root, f"{STORE_PREFIX}{user_id}")
+    if not os.path.isdir(old):
+        return False
+    try:
+        return _move_legacy(user_id, old)
+    except StoreBusy:
+        return False
+
+
+def _sweep_legacy(stats):
+    root = _legacy_root()
+    if root is None:
+        return
+    try:
+        names = os.listdir(root)
+    except FileNotFoundError:
+        return
+    stores = {}
+    for name in names:
+        path = os.path.join(root, name)
+        if name.endswith(".lock"):
+            store = path[:-len(".lock")]
+            if _STORE_RE.match(os.path.basename(store)) and not os.path.exists(store):
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(path)
+            continue
+        match = _STORE_RE.match(name)
+        if match and os.path.isdir(path):
+            stores[int(match.group(1))] = path
+
+    users = set(get_user_model().objects.filter(pk__in=stores).values_list("pk", flat=True))
+    for user_id, path in stores.items():
+        try:
+            if user_id in users and _move_legacy(user_id, path):
+                stats["legacy_moved"] += 1
+                continue
+            if user_id not in users:
+                with store_lock(path, exclusive=True, blocking=False):
+                    _remove_files(path)
+            stats["legacy_removed"] += 1
+        except StoreBusy:
+            stats["busy"] += 1
+
+
+# -----------------------------
+# Garbage collection
+# -----------------------------
+def _evict(store):
+    try:
+        with store_lock(store.path, exclusive=True, blocking=False):
+            _remove_files(store.path)
+    except StoreBusy:
+        return False
+    store.delete()   # files are already gone, the post_delete cleanup is a no-op
+    return True
+
+
+def _sweep_orphans(stats):
+    """
+    Adopt store directories the registry doesn't know (written before it
+    existed), remove those of unknown users if the directory is ours, drop
+    dead rows.
+    """
+    known = set(VectorStore.objects.values_list("path", flat=True))
+    try:
+        names = os.listdir(settings.VECTORSTORE_DIR)
+    except FileNotFoundError:
+        names = []
+    orphans = {}
+    for name in names:
+        path = os.path.join(settings.VECTORSTORE_DIR, name)
+        if name.endswith(".lock"):
+            store = path[:-len(".lock")]
+            if _STORE_RE.match(os.path.basename(store)) and not os.path.exists(store):
+                with contextlib.suppress(StoreBusy):
+                    with store_lock(store, exclusive=True, blocking=False):
+                        _remove_files(store)
+            continue
+        match = _STORE_RE.match(name)
+        if match and path not in known and os.path.isdir(path):
+            orphans[int(match.group(1))] = path
+
+    users = set(get_user_model().objects.filter(pk__in=orphans).values_list("pk", flat=True))
+    owned = _owns_root(settings.VECTORSTORE_DIR)
+    for user_id, path in orphans.items():
+        if user_id in users:
+            mtime = datetime.fromtimestamp(os.path.getmtime(path), tz=dt_timezone.utc)
+            VectorStore.objects.get_or_create(
+                user_id=user_id,
+                defaults={"path": path, "size_bytes": _dir_size(path), "last_accessed_at": mtime},
+            )
+            stats["adopted"] += 1
+        elif not owned:
+            stats["orphans_kept"] += 1
+        else:
+            try:
+                with store_lock(path, exclusive=True, blocking=False):
+                    _remove_files(path)
+                stats["orphans_removed"] += 1
+            except StoreBusy:
+                pass
+
+    for store in VectorStore.objects.only("pk", "path"):
+        if not os.path.isdir(store.path):
+            store.delete()
+            stats["missing"] += 1
+
+
+def collect_garbage(ttl=None, max_bytes=None, dry_run=False):
+    """
+    Evict expired stores, then least recently used ones while over the quota.
+    `ttl` (timedelta) and `max_bytes` default to the VECTORSTORE_* settings;
+    a zero value disables that rule. Returns counts of what was done.
+    """
+    if ttl is None:
+        ttl = timedelta(days=settings.VECTORSTORE_TTL_DAYS)
+    if max_bytes is None:
+        max_bytes = settings.VECTORSTORE_MAX_BYTES
+    stats = {"expired": 0, "over_quota": 0, "busy": 0, "freed_bytes": 0,
+             "adopted": 0, "orphans_removed": 0, "orphans_kept": 0, "missing": 0,
+             "legacy_moved": 0, "legacy_removed": 0}
+    if not dry_run:
+        _sweep_legacy(stats)
+        _sweep_orphans(stats)
+
+    evicted = set()
+    candidates = VectorStore.objects.order_by("last_accessed_at")
+    if ttl:
+        for store in candidates.filter(last_accessed_at__lt=timezone.now() - ttl):
+            if dry_run or _evict(store):
+                stats["expired"] += 1
+                stats["freed_bytes"] += store.size_bytes
+                evicted.add(store.pk)
+            else:
+                stats["busy"] += 1
+
+    if max_bytes:
+        remaining = candidates.exclude(pk__in=evicted)
+        total = remaining.aggregate(total=Sum("size_bytes"))["total"] or 0
+        for store in remaining.iterator():
+            if total <= max_bytes:
+                break
+            if dry_run or _evict(store):
+                stats["over_quota"] += 1
+                stats["freed_bytes"] += store.size_bytes
+                total -= store.size_bytes
+            else:
+                stats["busy"] += 1
+    return stats
+
+
+def maybe_collect_garbage():
+    """Run collect_garbage() if no worker sharing this cache has in the last VECTORSTORE_GC_INTERVAL seconds."""
+    interval = settings.VECTORSTORE_GC_INTERVAL
+    if not interval or not cache.add(GC_CACHE_KEY, 1, timeout=interval):
+        return None
+    try:
+        stats = collect_garbage()
+    except Exception:
+        logger.exception("Vector store garbage collection failed")
+        return None
+    if stats["expired"] or stats["over_quota"] or stats["legacy_moved"] or stats["legacy_removed"]:
+        logger.info("Vector store GC: %s", stats)
+    if stats["orphans_kept"]:
+        logger.warning(
+            "Kept %d vector store(s) of unknown users: %s is not a dedicated directory (no %s file)",
+            stats["orphans_kept"], settings.VECTORSTORE_DIR, DIR_MARKER,
+        )
+    return stats
+
+
+_gc_thread = None
+_gc_lock = threading.Lock()
+
+
+def _background_gc():
+    close_old_connections()
+    try:
+        maybe_collect_garbage()
+    finally:
+        close_old_connections()
+
+
+def schedule_garbage_collection():
+    """Start maybe_collect_garbage() on a background thread unless one is running; returns at once."""
+    global _gc_thread
+    if not settings.VECTORSTORE_GC_INTERVAL:
+        return None
+    with _gc_lock:
+        if _gc_thread is None or not _gc_thread.is_alive():
+            _gc_thread = threading.Thread(target=_background_gc, name="vectorstore-gc", daemon=True)
+            _gc_thread.start()
+        return _gc_thread
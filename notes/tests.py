@@ -1,3 +1,323 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import shutil
+import statistics
+import threading
+import uuid
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from users.models import CustomUser
+
+from . import rag_utils, store_registry
+from .embedding_backends import LEGACY_TAG, get_backend
+from .embedding_service import EmbeddingServer
+from .models import VectorStore
+from .rag_utils import EmbeddingBackendMismatch, SocketEmbeddings
+
+# Import-time budget for a worker boot: django.setup() plus the URLconf, as
+# reported by `python -X importtime`. Heavy AI/PDF libraries must stay out of
+# it; they are loaded on first use through study_assistant.lazy.
+STARTUP_IMPORT_BUDGET_MS = 1500
+HEAVY_MODULES = (
+    "fitz", "google.generativeai", "langchain", "langchain_community", "langchain_google_genai",
+    "faiss", "reportlab", "torch", "sentence_transformers", "transformers",
+)
+
+STARTUP_SCRIPT = """
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+"""
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+class StartupImportTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": "study_assistant.settings"}
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=120,
+        )
+        if proc.returncode != 0:
+            raise AssertionError(f"startup failed:\n{proc.stderr[-2000:]}")
+        cls.imports = {}      # module -> (self us, cumulative us, depth)
+        for line in proc.stderr.splitlines():
+            m = IMPORTTIME_LINE.match(line)
+            if m:
+                cls.imports[m[4]] = (int(m[1]), int(m[2]), (len(m[3]) - 1) // 2)
+
+    def test_heavy_libraries_not_imported_at_startup(self):
+        loaded = sorted(
+            name for name in self.imports
+            if any(name == heavy or name.startswith(heavy + ".") for heavy in HEAVY_MODULES)
+        )
+        self.assertEqual(loaded, [], "heavy libraries imported during startup")
+
+    def test_startup_import_budget(self):
+        total_ms = sum(self_us for self_us, _, _ in self.imports.values()) / 1000
+        top = sorted(
+            ((cumulative, name) for name, (_, cumulative, depth) in self.imports.items() if depth == 0),
+            reverse=True,
+        )[:10]
+        slowest = ", ".join(f"{name} {cumulative / 1000:.0f}ms" for cumulative, name in top)
+        self.assertLessEqual(
+            total_ms, STARTUP_IMPORT_BUDGET_MS,
+            f"startup imports took {total_ms:.0f}ms (budget {STARTUP_IMPORT_BUDGET_MS}ms); slowest: {slowest}",
+        )
+
+
+class _LengthEmbeddings:
+    """Deterministic stand-in model that records how it was called."""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(len(texts))
+        return [[float(len(t)), float(sum(map(ord, t)) % 97), 1.0] for t in texts]
+
+
+class EmbeddingServiceTests(SimpleTestCase):
+    def setUp(self):
+        self.model = _LengthEmbeddings()
+        self.socket_path = os.path.join(tempfile.mkdtemp(), "embed.sock")
+        self.server = EmbeddingServer(self.model, self.socket_path, window_ms=20, max_batch=64)
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        self.task = self.loop.create_task(self.server.serve(ready))
+        self.thread = threading.Thread(target=self._run_server)
+        self.thread.start()
+        ready.wait(5)
+
+    def _run_server(self):
+        try:
+            self.loop.run_until_complete(self.task)
+        except asyncio.CancelledError:
+            pass
+
+    def tearDown(self):
+        self.loop.call_soon_threadsafe(self.task.cancel)
+        self.thread.join(5)
+        self.loop.close()
+
+    def test_concurrent_requests_share_batches(self):
+        client = SocketEmbeddings(self.socket_path)
+        questions = [f"question number {i}?" for i in range(32)]
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            vectors = list(pool.map(client.embed_query, questions))
+
+        expected = _LengthEmbeddings().embed_documents(questions)
+        for got, want in zip(vectors, expected):
+            self.assertEqual(got, want)
+        self.assertEqual(self.server.requests, 32)
+        self.assertLess(self.server.batches, 32)
+        self.assertEqual(sum(self.model.calls), 32)
+
+    def test_large_document_lists_are_chunked(self):
+        client = SocketEmbeddings(self.socket_path)
+        docs = [f"chunk {i} " * (i % 7 + 1) for i in range(150)]
+        self.assertEqual(client.embed_documents(docs), _LengthEmbeddings().embed_documents(docs))
+        self.assertEqual(self.server.requests, 3)
+
+    def test_responses_name_the_servers_backend(self):
+        client = SocketEmbeddings(self.socket_path)
+        self.assertEqual(client.tag, "_LengthEmbeddings")
+        self.assertEqual(self.model.calls, [])   # the tag probe embeds nothing
+
+    def test_vectors_from_another_backend_are_refused(self):
+        client = SocketEmbeddings(self.socket_path, expected_tag="all-MiniLM-L6-v2:int8")
+        with self.assertRaises(EmbeddingBackendMismatch):
+            client.embed_query("Which backend answered?")
+        self.assertEqual(SocketEmbeddings(self.socket_path, expected_tag="_LengthEmbeddings")
+                         .embed_query("ok"), _LengthEmbeddings().embed_documents(["ok"])[0])
+
+
+class _TaggedEmbeddings(_LengthEmbeddings):
+    tag = "test-model:test"
+
+
+class VectorStoreBackendTagTests(SimpleTestCase):
+    def setUp(self):
+        self.user_id = f"test-{uuid.uuid4().hex}"
+        self.path = rag_utils._vector_path(self.user_id)
+        self.addCleanup(store_registry.remove_store_files, self.path)
+        rag_utils.core_embeddings.Embeddings.register(_TaggedEmbeddings)
+
+    def test_store_records_its_backend(self):
+        rag_utils.store_notes_as_vectors("Entropy never decreases.\n\nATP stores energy.",
+                                         self.user_id, embeddings=_TaggedEmbeddings())
+        self.assertEqual(rag_utils._read_backend_tag(self.path), "test-model:test")
+
+    def test_untagged_store_counts_as_legacy_fp32(self):
+        os.makedirs(self.path)
+        self.assertEqual(rag_utils._read_backend_tag(self.path), LEGACY_TAG)
+
+    def test_store_from_unknown_backend_is_refused(self):
+        rag_utils.store_notes_as_vectors("Entropy never decreases.", self.user_id, embeddings=_TaggedEmbeddings())
+        with open(os.path.join(self.path, rag_utils.BACKEND_FILE), "w") as fh:
+            json.dump({"backend": "some-other-model:fp32"}, fh)
+        with self.assertRaises(ImproperlyConfigured):
+            rag_utils._load_vectorstore(self.path)
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    return dot / ((sum(x * x for x in a) * sum(y * y for y in b)) ** 0.5)
+
+
+@skipUnless(find_spec("torch") and find_spec("sentence_transformers"), "needs torch and sentence-transformers")
+class QuantizedEmbeddingParityTests(SimpleTestCase):
+    def test_int8_vectors_agree_with_fp32(self):
+        text = (Path(__file__).resolve().parent / "bench_corpus" / "small.txt").read_text()
+        texts = [d.page_content for d in rag_utils.split_notes(text)]
+        fp32 = get_backend("fp32").embed_documents(texts)
+        int8 = get_backend("int8").embed_documents(texts)
+
+        cosines = [_cosine(a, b) for a, b in zip(fp32, int8)]
+        self.assertGreater(statistics.mean(cosines), 0.98)
+        self.assertGreater(min(cosines), 0.95)
+
+
+class VectorStoreGCTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.legacy = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.legacy, ignore_errors=True)
+        override = override_settings(VECTORSTORE_DIR=root, VECTORSTORE_LEGACY_DIR=self.legacy)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _store(self, name, size, age_days):
+        user = CustomUser.objects.create_user(name)
+        path = store_registry.store_path(user.id)
+        os.makedirs(path)
+        with open(os.path.join(path, "index.faiss"), "wb") as fh:
+            fh.write(b"\0" * size)
+        store_registry.record_store(user.id)
+        VectorStore.objects.filter(user=user).update(last_accessed_at=timezone.now() - timedelta(days=age_days))
+        return user, path
+
+    def test_expired_stores_are_removed(self):
+        _, old = self._store("old", 100, age_days=40)
+        _, fresh = self._store("fresh", 100, age_days=1)
+        stats = store_registry.collect_garbage(ttl=timedelta(days=30), max_bytes=0)
+        self.assertEqual(stats["expired"], 1)
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(fresh))
+        self.assertEqual(VectorStore.objects.count(), 1)
+
+    def test_quota_evicts_least_recently_used_first(self):
+        _, oldest = self._store("a", 1000, age_days=3)
+        _, middle = self._store("b", 1000, age_days=2)
+        _, newest = self._store("c", 1000, age_days=1)
+        stats = store_registry.collect_garbage(ttl=timedelta(0), max_bytes=2500)
+        self.assertEqual(stats["over_quota"], 1)
+        self.assertFalse(os.path.exists(oldest))
+        self.assertTrue(os.path.exists(middle))
+        self.assertTrue(os.path.exists(newest))
+
+    def test_stores_being_read_are_skipped(self):
+        _, path = self._store("reader", 100, age_days=40)
+        with store_registry.store_lock(path):
+            stats = store_registry.collect_garbage(ttl=timedelta(days=30), max_bytes=0)
+        self.assertEqual((stats["expired"], stats["busy"]), (0, 1))
+        self.assertTrue(os.path.exists(path))
+
+    def test_deleting_the_user_removes_the_store(self):
+        user, path = self._store("leaver", 100, age_days=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_unregistered_directories_are_adopted_or_removed(self):
+        open(os.path.join(settings.VECTORSTORE_DIR, store_registry.DIR_MARKER), "w").close()
+        user = CustomUser.objects.create_user("legacy")
+        legacy = store_registry.store_path(user.id)
+        orphan = store_registry.store_path(user.id + 1000)
+        os.makedirs(legacy)
+        os.makedirs(orphan)
+        stats = store_registry.collect_garbage(ttl=timedelta(0), max_bytes=0)
+        self.assertEqual((stats["adopted"], stats["orphans_removed"]), (1, 1))
+        self.assertTrue(VectorStore.objects.filter(user=user).exists())
+        self.assertFalse(os.path.exists(orphan))
+
+    def test_unknown_stores_in_a_shared_directory_are_kept(self):
+        orphan = store_registry.store_path(987654)
+        os.makedirs(orphan)
+        stats = store_registry.collect_garbage(ttl=timedelta(0), max_bytes=0)
+        self.assertEqual((stats["orphans_removed"], stats["orphans_kept"]), (0, 1))
+        self.assertTrue(os.path.exists(orphan))
+
+    def _legacy_store(self, user_id):
+        path = os.path.join(self.legacy, f"{store_registry.STORE_PREFIX}{user_id}")
+        os.makedirs(path)
+        with open(os.path.join(path, "index.faiss"), "wb") as fh:
+            fh.write(b"\0" * 10)
+        open(path + ".lock", "w").close()
+        return path
+
+    def test_legacy_stores_are_moved_in_or_removed(self):
+        kept = CustomUser.objects.create_user("kept")
+        moved = self._legacy_store(kept.id)
+        unknown = self._legacy_store(kept.id + 1000)
+        reuploaded, fresh = self._store("reuploaded", 100, age_days=0)
+        stale = self._legacy_store(reuploaded.id)
+
+        stats = store_registry.collect_garbage(ttl=timedelta(0), max_bytes=0)
+        self.assertEqual((stats["legacy_moved"], stats["legacy_removed"]), (1, 2))
+        self.assertEqual(os.listdir(self.legacy), [])
+        store = VectorStore.objects.get(user=kept)
+        self.assertEqual(store.path, store_registry.store_path(kept.id))
+        self.assertTrue(os.path.exists(os.path.join(store.path, "index.faiss")))
+        self.assertEqual(store.size_bytes, 10)
+        with open(os.path.join(fresh, "index.faiss"), "rb") as fh:
+            self.assertEqual(len(fh.read()), 100)
+        self.assertFalse(any(os.path.exists(p) for p in (moved, unknown, stale)))
+
+    def test_a_legacy_store_is_moved_on_first_use(self):
+        user = CustomUser.objects.create_user("asker")
+        self._legacy_store(user.id)
+        self.assertTrue(store_registry.adopt_legacy_store(user.id))
+        self.assertTrue(os.path.isdir(store_registry.store_path(user.id)))
+        self.assertTrue(VectorStore.objects.filter(user=user).exists())
+        self.assertFalse(store_registry.adopt_legacy_store(user.id))
+
+    def test_legacy_pass_is_off_when_it_is_the_store_dir(self):
+        user = CustomUser.objects.create_user("samedir")
+        self._legacy_store(user.id)
+        with override_settings(VECTORSTORE_DIR=self.legacy):
+            stats = store_registry.collect_garbage(ttl=timedelta(0), max_bytes=0)
+        self.assertEqual((stats["legacy_moved"], stats["legacy_removed"], stats["adopted"]), (0, 0, 1))
+
+    def test_store_directory_created_by_the_registry_is_marked(self):
+        root = os.path.join(settings.VECTORSTORE_DIR, "dedicated")
+        with override_settings(VECTORSTORE_DIR=root):
+            with store_registry.store_lock(store_registry.store_path(1)):
+                pass
+        self.assertTrue(os.path.exists(os.path.join(root, store_registry.DIR_MARKER)))
+
+    @override_settings(VECTORSTORE_GC_INTERVAL=60)
+    def test_upload_gc_runs_off_the_request_thread(self):
+        ran = []
+        with mock.patch.object(store_registry, "maybe_collect_garbage",
+                               side_effect=lambda: ran.append(threading.current_thread().name)):
+            store_registry.schedule_garbage_collection().join(5)
+        self.assertEqual(ran, ["vectorstore-gc"])
@@ -1,15 +1,25 @@
-import os, uuid, fitz, time, logging
-from datetime import datetime
+import asyncio, os, uuid, logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
-import google.generativeai as genai
+
+from study_assistant import compaction, metrics
+from study_assistant.admission import admission_controlled
+from study_assistant.lazy import lazy_import
+from study_assistant.profiling import profiled
 
 from .forms import NoteUploadForm
-from .rag_utils import store_notes_as_vectors, ask_question_with_rag
+from . import store_registry
+from .rag_utils import store_notes_as_vectors, aask_question_with_rag
+
+# PyMuPDF and the Gemini SDK load on first use, not at URL import.
+fitz = lazy_import("fitz")
+genai = lazy_import("google.generativeai")
 
 # ------------------------------
 # Logging
@@ -32,7 +42,7 @@ GEMINI_KEYS = [
 # ------------------------------
 # Gemini model with key rotation + retry
 # ------------------------------
-def get_genai_model(retries=3, delay=2):
+async def aget_genai_model(retries=3, delay=2):
     last_exc = None
     for key in GEMINI_KEYS:
         if not key:
@@ -41,12 +51,13 @@ def get_genai_model(retries=3, delay=2):
             try:
                 genai.configure(api_key=key)
                 model = genai.GenerativeModel("gemini-1.5-flash")
-                _ = model.count_tokens("test")
+                with metrics.llm_call("notes_probe", stage="llm_probe"):
+                    _ = await asyncio.wait_for(model.count_tokens_async("test"), timeout=settings.LLM_TIMEOUT_SECONDS)
                 return model
             except Exception as e:
                 if "429" in str(e):
                     logger.warning(f"Rate limit hit for key {key}, retry {attempt+1}/{retries}")
-                    time.sleep(delay * (attempt + 1))
+                    await asyncio.sleep(delay * (attempt + 1))
                 else:
                     last_exc = e
                     break
@@ -62,40 +73,52 @@ def upload_notes(request):
 # ------------------------------
 # Generate Notes
 # ------------------------------
+@profiled
+def _save_and_extract(f, name):
+    """Blocking part of an upload: spool to storage and pull the text out."""
+    tmp = f"tmp_{uuid.uuid4().hex}_{name}"
+    path = default_storage.save(tmp, ContentFile(f.read()))
+    is_img = name.endswith(('.png', '.jpg', '.jpeg', '.gif'))
+    url = default_storage.url(path) if is_img else None
+
+    text, error = "", None
+    try:
+        with default_storage.open(path, 'rb') as fh:
+            data = fh.read()
+        with metrics.timer("extract"):
+            if name.endswith('.pdf'):
+                doc = fitz.open(stream=data, filetype="pdf")
+                text = compaction.compact_pages([p.get_text() for p in doc], source="notes").text
+            else:
+                text = compaction.compact_text(data.decode('utf-8', errors='ignore'), source="notes").text
+    except Exception as e:
+        error = e
+    finally:
+        default_storage.delete(path)
+    return text, url, is_img, error
+
 @login_required
-def generated_notes_view(request):
+@admission_controlled("generate_notes")
+async def generated_notes_view(request):
     if request.method != 'POST':
         return redirect('upload_notes')
 
+    user = await request.auser()
     form = NoteUploadForm(request.POST, request.FILES)
-    if not form.is_valid():
+    if not await sync_to_async(form.is_valid)():
         messages.error(request, "Invalid form submission.")
         return redirect('upload_notes')
 
     f = form.cleaned_data['file']
     pref = form.cleaned_data['preference'].strip()
     name = f.name.lower()
-    tmp = f"tmp_{uuid.uuid4().hex}_{name}"
-    path = default_storage.save(tmp, ContentFile(f.read()))
-    is_img = name.endswith(('.png', '.jpg', '.jpeg', '.gif'))
-    url = default_storage.url(path) if is_img else None
 
     # ------------------------------
-    # Extract text from file
+    # Extract text from file (CPU-bound, off the event loop)
     # ------------------------------
-    text = ""
-    try:
-        with default_storage.open(path, 'rb') as fh:
-            data = fh.read()
-        if name.endswith('.pdf'):
-            doc = fitz.open(stream=data, filetype="pdf")
-            text = "\n".join(p.get_text() for p in doc)
-        else:
-            text = data.decode('utf-8', errors='ignore')
-    except Exception as e:
-        messages.error(request, f"⚠️ Extraction error: {e}")
-    finally:
-        default_storage.delete(path)
+    text, url, is_img, error = await sync_to_async(_save_and_extract, thread_sensitive=False)(f, name)
+    if error:
+        messages.error(request, f"⚠️ Extraction error: {error}")
 
     # ------------------------------
     # Generate notes using Gemini
@@ -115,21 +138,27 @@ Content:
 Return only clean HTML (<h2>, <p>, <ul><li>…), no fences.
 """
         try:
-            model = get_genai_model()
-            resp = model.generate_content(prompt)
+            model = await aget_genai_model()
+            with metrics.llm_call("notes") as call:
+                resp = await asyncio.wait_for(model.generate_content_async(prompt), timeout=settings.LLM_TIMEOUT_SECONDS)
+                call.response = resp
             notes = (resp.text or "").replace("```html", "").replace("```", "").strip()
 
             # Save notes in session
-            request.session['generated_notes'] = notes
+            await request.session.aset('generated_notes', notes)
 
-            # Store embeddings/vectors
-            store_notes_as_vectors(text, str(request.user.id))
+            # Store embeddings/vectors (CPU-bound)
+            backend = await sync_to_async(store_notes_as_vectors, thread_sensitive=False)(text, str(user.id))
+            await sync_to_async(store_registry.record_store)(user.id, backend)
+            store_registry.schedule_garbage_collection()
 
         except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                e = "request timed out"
             logger.error(f"Gemini API Error: {e}")
             notes = f"⚠️ Gemini API Error: {e}"
 
-    return render(request, 'generated_notes.html', {
+    return await sync_to_async(render)(request, 'generated_notes.html', {
         'generated_notes': notes,
         'file_url': url,
         'file_is_image': is_img,
@@ -139,47 +168,25 @@ Return only clean HTML (<h2>, <p>, <ul><li>…), no fences.
 # Ask Doubt with RAG
 # ------------------------------
 @login_required
-def ask_doubt_view(request):
+@admission_controlled("ask_doubt", json_key="answer")
+async def ask_doubt_view(request):
     if request.method == 'POST':
+        user = await request.auser()
         question = request.POST.get('question', '').strip()
         if not question:
             return JsonResponse({'answer': "❌ Please ask a valid question."})
         try:
-            answer = ask_question_with_rag(str(request.user.id), question)
+            answer = await asyncio.wait_for(
+                aask_question_with_rag(str(user.id), question),
+                timeout=settings.LLM_TIMEOUT_SECONDS,
+            )
+            await sync_to_async(store_registry.touch)(user.id)
         except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                e = "request timed out"
             logger.error(f"RAG Error: {e}")
             answer = f"⚠️ RAG Error: {e}"
         return JsonResponse({'answer': answer})
 
     # GET → render chat interface
-    return render(request, 'ask_doubt.html')
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    return await sync_to_async(render)(request, 'ask_doubt.html')
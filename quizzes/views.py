@@ -1,10 +1,18 @@
+import asyncio
 import json
 import os
 import random
-import google.generativeai as genai
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
 
+from study_assistant import compaction, metrics
+from study_assistant.admission import admission_controlled
+from study_assistant.lazy import lazy_import
+
+genai = lazy_import("google.generativeai")
+
 # --- Load multiple API keys from .env ---
 API_KEYS = [
     os.getenv("GOOGLE_API_KEY_1"),
@@ -20,7 +28,7 @@ API_KEYS = [
 API_KEYS = [k for k in API_KEYS if k]
 
 def get_gemini_model():
-    """Pick a random API key to distribute load and create a model."""
+    """Pick a random API key to distribute load."""
     if not API_KEYS:
         raise ValueError("No Gemini API keys configured.")
     api_key = random.choice(API_KEYS)
@@ -28,15 +36,18 @@ def get_gemini_model():
     return genai.GenerativeModel("gemini-1.5-flash")
 
 
-def generate_quiz(request):
+@admission_controlled("quizzes", methods=("GET", "POST"))
+async def generate_quiz(request):
     """Generate a quiz from the session notes using Gemini."""
-    notes = request.session.get("generated_notes", "")
+    notes = await request.session.aget("generated_notes", "")
     if not notes:
         return redirect('upload_notes')  # Redirect if no notes exist
+    # The notes are HTML; tags and attributes would only cost prompt tokens.
+    compacted = await sync_to_async(compaction.compact_html, thread_sensitive=False)(notes, source="quizzes")
 
     prompt = f"""
 You are an AI quiz generator.
-Generate 10 multiple-choice questions (MCQs) from the following HTML study notes.
+Generate 10 multiple-choice questions (MCQs) from the following study notes.
 Return output strictly in valid JSON list format like this:
 [
   {{
@@ -47,12 +58,17 @@ Return output strictly in valid JSON list format like this:
 ]
 
 Study Notes:
-{notes}
+{compacted.text}
     """
 
+    arender = sync_to_async(render)
     try:
         model = get_gemini_model()
-        response = model.generate_content(prompt)
+        with metrics.llm_call("quizzes") as call:
+            response = await asyncio.wait_for(
+                model.generate_content_async(prompt), timeout=settings.LLM_TIMEOUT_SECONDS
+            )
+            call.response = response
         raw_output = response.text.strip()
 
         # Clean accidental markdown fences
@@ -63,12 +79,14 @@ Study Notes:
         questions = json.loads(raw_output)
 
         # Store questions in session
-        request.session["quiz_questions"] = questions
+        await request.session.aset("quiz_questions", questions)
 
-        return render(request, "quiz.html", {"questions": questions})
+        return await arender(request, "quiz.html", {"questions": questions})
 
     except Exception as e:
-        return render(request, "quiz.html", {
+        if isinstance(e, asyncio.TimeoutError):
+            e = "the AI took too long to respond."
+        return await arender(request, "quiz.html", {
             "questions": [],
             "error": f"Quiz generation failed: {e}"
         })
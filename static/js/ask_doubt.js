@@ -0,0 +1,121 @@
+const config = document.currentScript.dataset;
+
+const chat = document.getElementById('chat');
+const form = document.getElementById('askForm');
+const textarea = document.getElementById('question');
+const sendBtn = document.getElementById('sendBtn');
+const jump = document.getElementById('jump');
+
+function csrf(){ return document.querySelector('input[name="csrfmiddlewaretoken"]').value; }
+function now(){ return new Date().toLocaleTimeString([], {hour:'2-digit', minute:'2-digit'}); }
+function atBottom(){ return chat.scrollHeight - chat.scrollTop - chat.clientHeight < 10; }
+function scrollToBottom(){ chat.scrollTop = chat.scrollHeight; }
+
+// Auto-resize textarea
+function autosize(){
+  textarea.style.height = 'auto';
+  textarea.style.height = Math.min(textarea.scrollHeight, 140) + 'px';
+}
+textarea.addEventListener('input', autosize);
+autosize();
+
+// Show "jump to bottom" when user scrolls up and new content arrives
+chat.addEventListener('scroll', () => {
+  if (atBottom()) jump.style.display = 'none';
+});
+jump.addEventListener('click', () => { scrollToBottom(); jump.style.display = 'none'; });
+
+function addMsg(role, text, isTyping=false){
+  const wrap = document.createElement('div');
+  wrap.className = 'msg ' + (role === 'user' ? 'user' : 'ai');
+
+  const bubble = document.createElement('div');
+  bubble.className = 'bubble';
+
+  const content = document.createElement('div');
+  content.className = isTyping ? 'typing' : '';
+  if (isTyping){
+    content.innerHTML = '<span></span><span></span><span></span>';
+  } else {
+    content.textContent = text;
+  }
+  bubble.appendChild(content);
+
+  const meta = document.createElement('div');
+  meta.className = 'meta'; meta.textContent = now();
+  bubble.appendChild(meta);
+
+  // Tools only for AI answers (copy)
+  if (!isTyping && role === 'ai'){
+    const tools = document.createElement('div');
+    tools.className = 'tools';
+    const copyBtn = document.createElement('button');
+    copyBtn.type = 'button'; copyBtn.className = 'tool'; copyBtn.textContent = 'Copy';
+    copyBtn.addEventListener('click', async () => {
+      try { await navigator.clipboard.writeText(text); copyBtn.textContent = 'Copied ✓'; setTimeout(()=>copyBtn.textContent='Copy', 1000); }
+      catch { copyBtn.textContent = 'Failed'; setTimeout(()=>copyBtn.textContent='Copy', 1000); }
+    });
+    tools.appendChild(copyBtn);
+    bubble.appendChild(tools);
+  }
+
+  wrap.appendChild(bubble);
+  chat.appendChild(wrap);
+  if (atBottom()) scrollToBottom(); else jump.style.display = 'block';
+  return {wrap, bubble, content};
+}
+
+form.addEventListener('submit', async (e) => {
+  e.preventDefault();
+  const q = textarea.value.trim();
+  if (!q) return;
+
+  // User message
+  addMsg('user', q);
+  textarea.value=''; autosize();
+
+  // Typing placeholder
+  const typing = addMsg('ai', '', true);
+  sendBtn.disabled = true;
+
+  try{
+    const res = await fetch(config.askUrl, {
+      method: 'POST',
+      headers: {'Content-Type':'application/x-www-form-urlencoded','X-CSRFToken': csrf()},
+      body: new URLSearchParams({question: q})
+    });
+
+    const data = await res.json();
+    const answer = data && data.answer ? data.answer : "⚠️ I couldn't find an answer in your notes.";
+    // swap typing with real text
+    typing.content.className = ''; typing.content.textContent = answer;
+    // add copy tool
+    const tools = document.createElement('div');
+    tools.className = 'tools';
+    const copyBtn = document.createElement('button');
+    copyBtn.type = 'button'; copyBtn.className = 'tool'; copyBtn.textContent = 'Copy';
+    copyBtn.addEventListener('click', async () => {
+      try { await navigator.clipboard.writeText(answer); copyBtn.textContent = 'Copied ✓'; setTimeout(()=>copyBtn.textContent='Copy', 1000); }
+      catch { copyBtn.textContent = 'Failed'; setTimeout(()=>copyBtn.textContent='Copy', 1000); }
+    });
+    tools.appendChild(copyBtn);
+    typing.bubble.appendChild(tools);
+
+  } catch (err){
+    typing.content.className=''; typing.content.textContent = "⚠️ Network error. Please try again.";
+  } finally {
+    sendBtn.disabled = false;
+    if (!atBottom()) jump.style.display = 'block'; else scrollToBottom();
+  }
+});
+
+// Enter to send, Shift+Enter for newline
+textarea.addEventListener('keydown', (e) => {
+  if (e.key === 'Enter' && !e.shiftKey){
+    e.preventDefault();
+    form.dispatchEvent(new Event('submit', {cancelable:true}));
+  }
+});
+
+// Inject times on initial AI message
+document.querySelectorAll('[data-time]').forEach(el => el.textContent = now());
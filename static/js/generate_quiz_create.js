@@ -0,0 +1,58 @@
+const config = document.currentScript.dataset;
+
+// --- Elements
+const drop = document.getElementById('drop');
+const fileInput = document.getElementById('fileInput');
+const bar = document.getElementById('bar');
+const barLabel = document.getElementById('barLabel');
+
+// --- Click to open file chooser
+drop.addEventListener('click', () => fileInput.click());
+
+// --- Drag & drop handlers
+;['dragenter','dragover'].forEach(evt =>
+  drop.addEventListener(evt, e => { e.preventDefault(); e.stopPropagation(); drop.classList.add('drag'); })
+);
+;['dragleave','drop'].forEach(evt =>
+  drop.addEventListener(evt, e => { e.preventDefault(); e.stopPropagation(); drop.classList.remove('drag'); })
+);
+drop.addEventListener('drop', e => {
+  const f = e.dataTransfer.files && e.dataTransfer.files[0];
+  if (f) fileInput.files = e.dataTransfer.files;
+  fakeProgress();
+});
+
+// --- When chosen via dialog
+fileInput.addEventListener('change', fakeProgress);
+
+// --- Simple fake progress for UX (real progress needs XHR upload)
+function fakeProgress(){
+  let p=0; bar.style.width='0%'; barLabel.textContent='0%';
+  const t=setInterval(()=>{ p+=7+Math.random()*9; if(p>=100){p=100;clearInterval(t)}
+    bar.style.width=p.toFixed(0)+'%'; barLabel.textContent=p.toFixed(0)+'%';
+  },80);
+}
+
+// --- Submit state
+function startGen(form){
+  const btn = document.getElementById('submitBtn');
+  const loading = document.getElementById('loading');
+  btn.disabled = true; btn.textContent = 'Generating…';
+  loading.style.display = 'block';
+
+  // Questions are stored as they stream in; show how many are ready.
+  const id = (window.crypto && crypto.randomUUID) ? crypto.randomUUID()
+           : Date.now().toString(36) + Math.random().toString(36).slice(2);
+  document.getElementById('generationId').value = id;
+  const url = config.progressUrl.replace('GENID', id);
+  setInterval(async () => {
+    try {
+      const res = await fetch(url, { headers: { 'Accept': 'application/json' } });
+      const data = await res.json();
+      if (data.target) {
+        loading.textContent = `Generating with Gemini… ${data.ready} / ${data.target} questions ready ⏳`;
+      }
+    } catch (e) { /* keep waiting */ }
+  }, 1500);
+  return true;
+}
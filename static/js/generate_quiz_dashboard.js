@@ -0,0 +1,95 @@
+const config = document.currentScript.dataset;
+
+function qs(id){return document.getElementById(id)}
+function copyCode() {
+  const v = qs('room').textContent.trim();
+  if (navigator.clipboard && window.isSecureContext) {
+    navigator.clipboard.writeText(v);
+  } else {
+    // fallback for non-secure contexts
+    const ta = document.createElement('textarea');
+    ta.value = v; document.body.appendChild(ta); ta.select();
+    try { document.execCommand('copy'); } catch(e) {}
+    document.body.removeChild(ta);
+  }
+}
+
+const statusUrl = config.statusUrl;
+let inflight = false;
+let keepPolling = true;
+
+function showAbort(title, msg){
+  const o = qs('abort-overlay');
+  if (!o) return;
+  qs('abort-title').textContent = title || 'Quiz ended';
+  qs('abort-msg').textContent = msg || 'The creator has left. This quiz was aborted.';
+  o.style.display = 'flex';
+}
+
+function formatTime(iso) {
+  try { return new Date(iso).toLocaleTimeString([], {hour:'2-digit', minute:'2-digit', second:'2-digit'}); }
+  catch { return '--:--:--'; }
+}
+
+function renderParticipants(listEl, participants) {
+  listEl.innerHTML = '';
+  (participants || []).forEach(p => {
+    const card = document.createElement('div');
+    card.className = 'p';
+    const initials = (p.name || '?').trim().charAt(0).toUpperCase();
+    card.innerHTML = `
+      <div class="top">
+        <div class="avatar">${initials}</div>
+        <div>
+          <div class="name">${p.name}${p.is_creator ? ' <span class="pill">Creator</span>' : ''}</div>
+          <div class="meta">Joined: ${p.joined_at ? formatTime(p.joined_at) : '--:--:--'}</div>
+        </div>
+      </div>
+    `;
+    listEl.appendChild(card);
+  });
+
+  if ((participants || []).length === 0) {
+    const empty = document.createElement('div');
+    empty.className = 'meta';
+    empty.textContent = 'No one has joined yet. Share the room code.';
+    listEl.appendChild(empty);
+  }
+}
+
+function poll() {
+  if (!keepPolling || inflight) return;
+  inflight = true;
+
+  fetch(statusUrl, {credentials: 'same-origin'})
+    .then(r => r.json())
+    .then(data => {
+      if (data.quiz_aborted) {
+        showAbort('Quiz ended', 'The creator has left. This quiz was aborted.');
+        keepPolling = false;
+        if (data.redirect) setTimeout(() => { window.location = data.redirect; }, 1200);
+        return;
+      }
+
+      if (data.quiz_started && data.quiz_url) {
+        keepPolling = false;
+        window.location.replace(data.quiz_url);
+        return;
+      }
+
+      const list = qs('participant-list');
+      const count = qs('p-count');
+      if (list) {
+        renderParticipants(list, data.participants || []);
+        if (count) count.textContent = (data.participants || []).length;
+      }
+    })
+    .catch(() => { /* ignore transient errors */ })
+    .finally(() => {
+      inflight = false;
+      if (keepPolling) setTimeout(poll, 1000);
+    });
+}
+
+// Kick off polling
+poll();
@@ -0,0 +1,59 @@
+(function(){
+  const boxes = Array.from(document.querySelectorAll('.code-box'));
+  const hidden = document.getElementById('room_code');
+  const form = document.getElementById('joinForm');
+
+  // Keep only digits in a box
+  function clean(v){ return (v || '').replace(/\D/g,'').slice(0,1); }
+
+  // Combine boxes -> hidden
+  function syncHidden(){
+    hidden.value = boxes.map(b => b.value || '').join('');
+  }
+
+  // Auto-advance / backspace behavior
+  boxes.forEach((box, idx) => {
+    box.addEventListener('input', (e) => {
+      box.value = clean(box.value);
+      // paste handling: if more than one char pasted, distribute
+      const data = (e.data || '').replace(/\D/g,'');
+      if (data && data.length > 1) {
+        // distribute across boxes starting at idx
+        let k = 0;
+        for (let i = idx; i < boxes.length && k < data.length; i++, k++) {
+          boxes[i].value = data[k];
+        }
+      }
+      // move forward if filled
+      if (box.value && idx < boxes.length - 1) boxes[idx+1].focus();
+      syncHidden();
+    });
+
+    box.addEventListener('keydown', (e) => {
+      const key = e.key;
+      if (key === 'Backspace' && !box.value && idx > 0) {
+        boxes[idx-1].focus();
+        boxes[idx-1].value = '';
+        e.preventDefault();
+        syncHidden();
+      }
+      // allow left/right navigation
+      if (key === 'ArrowLeft' && idx > 0) { boxes[idx-1].focus(); e.preventDefault(); }
+      if (key === 'ArrowRight' && idx < boxes.length-1) { boxes[idx+1].focus(); e.preventDefault(); }
+    });
+  });
+
+  // On submit: validate length
+  form.addEventListener('submit', (e) => {
+    syncHidden();
+    if (hidden.value.length !== 6) {
+      e.preventDefault();
+      // focus first empty box
+      const empty = boxes.find(b => !b.value);
+      (empty || boxes[0]).focus();
+    }
+  });
+
+  // Focus first box on load
+  if (boxes[0]) boxes[0].focus();
+})();
@@ -0,0 +1,73 @@
+const config = document.currentScript.dataset;
+
+// ====== TIMER ======
+let remaining = Number(config.remaining);
+const tEl = document.getElementById('t');
+const form = document.getElementById('quizForm');
+const overlay = document.getElementById('submitting');
+let allowSubmit = false;
+
+function fmt(s){
+  s = Math.max(0, s|0);
+  const m = String(Math.floor(s/60)).padStart(2,'0');
+  const ss = String(s%60).padStart(2,'0');
+  return `${m}:${ss}`;
+}
+function autoSubmit(){
+  if (overlay) overlay.style.display = 'flex';
+  allowSubmit = true;
+  setTimeout(() => form.submit(), 200);
+}
+function tick(){
+  tEl.textContent = fmt(remaining);
+  if (remaining <= 0){ autoSubmit(); return; }
+  remaining--; setTimeout(tick, 1000);
+}
+tick();
+
+// ====== BLOCK MANUAL SUBMIT / ENTER ======
+form.addEventListener('submit', (e)=>{ if (!allowSubmit) e.preventDefault(); });
+form.addEventListener('keydown', (e)=>{ if (e.key === 'Enter') e.preventDefault(); });
+
+// ====== PROGRESS BAR ======
+const radios = Array.from(form.querySelectorAll('input[type=radio]'));
+const pbar = document.getElementById('pbar');
+const groups = [...new Set(radios.map(r => r.name))];
+function recalcProgress(){
+  const answered = groups.filter(name => form.querySelector(`input[name="${name}"]:checked`)).length;
+  const pct = Math.round((answered / groups.length) * 100);
+  pbar.style.width = pct + '%';
+}
+radios.forEach(r => r.addEventListener('change', recalcProgress));
+recalcProgress();
+
+// ====== KEYBOARD SHORTCUTS (A/B/C/D) ======
+const keyMap = { 'a':'A', 'b':'B', 'c':'C', 'd':'D' };
+document.addEventListener('keydown', (e)=>{
+  const key = e.key.toLowerCase();
+  if (!(key in keyMap)) return;
+
+  // find the nearest visible question in viewport and mark that option
+  const qs = Array.from(document.querySelectorAll('.q'));
+  const y = window.scrollY;
+  const viewportMiddle = y + window.innerHeight * 0.35;
+  let nearest = qs[0], best = Infinity;
+  qs.forEach(q => {
+    const rect = q.getBoundingClientRect();
+    const mid = rect.top + window.scrollY + rect.height/2;
+    const d = Math.abs(mid - viewportMiddle);
+    if (d < best){ best = d; nearest = q; }
+  });
+
+  const letter = keyMap[key];
+  const input = nearest.querySelector(`input[type="radio"][value="${letter}"]`);
+  if (input){
+    input.checked = true;
+    input.dispatchEvent(new Event('change', {bubbles:true}));
+  }
+});
+
+// Safety: if the page becomes visible again after timeout, submit immediately
+document.addEventListener('visibilitychange', () => {
+  if (document.visibilityState === 'visible' && remaining <= 0) autoSubmit();
+});
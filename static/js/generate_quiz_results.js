@@ -0,0 +1,67 @@
+const config = document.currentScript.dataset;
+
+const resultsUrl = config.resultsUrl;
+const tbody = document.getElementById("results-body");
+let version = config.version;
+let total = Number(config.total);
+
+function updateStatsFromDOM(){
+  const rows = Array.from(tbody.querySelectorAll("tr"));
+  const dataRows = rows.filter(r => !r.querySelector(".meta"));
+  const scores = dataRows.map(r => {
+    const pill = r.querySelector(".pill");
+    return pill ? Number(pill.textContent.trim()) : 0;
+  }).filter(n => !isNaN(n));
+  const top = scores.length ? Math.max(...scores) : "—";
+  const meRow = tbody.querySelector(".me");
+  const myRank = meRow ? meRow.querySelector(".rank-pill").textContent.replace('#','') : "—";
+
+  document.getElementById("stat-participants").textContent = total || "—";
+  document.getElementById("stat-top").textContent = top;
+  document.getElementById("stat-rank").textContent = myRank;
+}
+
+function appendRow(r) {
+  const row = document.createElement("tr");
+  if (r.is_me) row.classList.add("me");
+  row.innerHTML = `
+    <td><span class="rank-pill">#${r.rank}</span></td>
+    <td>${r.name}</td>
+    <td><span class="pill">${r.score}</span></td>
+    <td>${r.time_taken || "—"}</td>
+  `;
+  tbody.appendChild(row);
+}
+
+function updateResults() {
+  fetch(`${resultsUrl}?v=${encodeURIComponent(version)}`, {credentials: 'same-origin'})
+    .then(r => r.json())
+    .then(data => {
+      if (data.unchanged) return;
+      version = data.version;
+      total = data.total || 0;
+      tbody.innerHTML = "";
+      if (!data.results || data.results.length === 0) {
+        const row = document.createElement("tr");
+        row.innerHTML = `<td colspan="4" class="meta">No results yet.</td>`;
+        tbody.appendChild(row);
+        updateStatsFromDOM();
+        return;
+      }
+
+      data.results.forEach(appendRow);
+      if (data.neighbors && data.neighbors.length) {
+        const gap = document.createElement("tr");
+        gap.innerHTML = `<td colspan="4" class="meta">…</td>`;
+        tbody.appendChild(gap);
+        data.neighbors.forEach(appendRow);
+      }
+
+      updateStatsFromDOM();
+    })
+    .catch(err => console.error("Error updating results:", err));
+}
+
+// initial stats + polling every 2s (server answers "unchanged" until a new submit lands)
+updateStatsFromDOM();
+setInterval(updateResults, 2000);
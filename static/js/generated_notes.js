@@ -0,0 +1,68 @@
+// Render Notes
+let rawHTML = JSON.parse(document.getElementById('notes-data').textContent).trim();
+if (rawHTML.startsWith("```")) {
+  rawHTML = rawHTML.replace(/^```[a-zA-Z]*\n?/, '').replace(/```$/, '');
+}
+const container = document.getElementById('notes-container');
+container.innerHTML = rawHTML;
+
+// Word animation
+const elements = container.querySelectorAll('*');
+let delay = 0;
+elements.forEach(el => {
+  if (el.childNodes.length === 1 && el.childNodes[0].nodeType === 3) {
+    const text = el.innerText;
+    el.innerHTML = '';
+    text.split(/(\s+)/).forEach(word => {
+      const span = document.createElement('span');
+      span.textContent = word;
+      span.className = 'word';
+      el.appendChild(span);
+      setTimeout(() => span.classList.add('visible'), delay);
+      delay += 30;
+    });
+  }
+});
+
+// Download as PDF
+document.getElementById('download-btn').addEventListener('click', function (e) {
+  e.preventDefault();
+  const JsPdfCtor = (window.jspdf && window.jspdf.jsPDF) ? window.jspdf.jsPDF : window.jsPDF;
+  if (!JsPdfCtor) {
+    alert('PDF library failed to load. Please refresh the page and try again.');
+    return;
+  }
+
+  const doc = new JsPdfCtor({ unit: 'pt', format: 'a4' });
+  const marginLeft = 40, marginTop = 60, lineHeight = 18;
+  const pageH = doc.internal.pageSize.height;
+  const maxW = doc.internal.pageSize.width - marginLeft * 2;
+
+  const text = (container.innerText || container.textContent || '').trim();
+  const lines = doc.splitTextToSize(text, maxW);
+
+  let y = marginTop;
+  doc.setFont('helvetica','normal');
+  doc.setFontSize(11);
+
+  lines.forEach(line => {
+    if (y > pageH - 40) {
+      doc.addPage();
+      y = marginTop;
+    }
+    doc.text(line, marginLeft, y);
+    y += lineHeight;
+  });
+
+  const fname = this.dataset.filename || 'AI_Notes.pdf';
+  doc.save(fname);
+});
+
+// Show loading when quiz starts
+function startQuizLoading(){
+  const quizBtn = document.getElementById('quiz-btn');
+  const loadingText = document.getElementById('quiz-loading');
+  quizBtn.disabled = true;
+  quizBtn.textContent = 'Generating Quiz...';
+  loadingText.style.display = 'block';
+}
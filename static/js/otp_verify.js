@@ -0,0 +1,58 @@
+(function(){
+  const grid = document.getElementById('otp-grid');
+  const inputs = Array.from(grid.querySelectorAll('.otp-input'));
+  const hidden = document.getElementById('otp-hidden');
+  const form = document.getElementById('otp-form');
+
+  // Focus first box on load
+  inputs[0].focus();
+
+  // Keep only digits, auto-advance
+  inputs.forEach((inp, idx) => {
+    inp.addEventListener('input', (e) => {
+      const v = e.target.value.replace(/\D/g,'');
+      e.target.value = v.slice(0,1);
+      if (v && idx < inputs.length - 1) inputs[idx+1].focus();
+      updateHidden();
+    });
+
+    // Backspace: move left if empty
+    inp.addEventListener('keydown', (e) => {
+      if (e.key === 'Backspace' && !inp.value && idx > 0) {
+        inputs[idx-1].focus();
+      }
+      // Arrow navigation
+      if (e.key === 'ArrowLeft' && idx > 0) { inputs[idx-1].focus(); e.preventDefault(); }
+      if (e.key === 'ArrowRight' && idx < inputs.length - 1) { inputs[idx+1].focus(); e.preventDefault(); }
+    });
+
+    // Paste full code anywhere
+    inp.addEventListener('paste', (e) => {
+      const data = (e.clipboardData || window.clipboardData).getData('text') || '';
+      if (!data) return;
+      const digits = data.replace(/\D/g,'').slice(0,6).split('');
+      if (!digits.length) return;
+      e.preventDefault();
+      inputs.forEach((box, i) => { box.value = digits[i] || ''; });
+      updateHidden();
+      // focus next empty or last
+      const next = inputs.find(b => !b.value) || inputs[inputs.length - 1];
+      next.focus();
+    });
+  });
+
+  function updateHidden(){
+    hidden.value = inputs.map(i => i.value || '').join('');
+  }
+
+  // Validate before submit (optional client-side)
+  form.addEventListener('submit', (e) => {
+    updateHidden();
+    if (hidden.value.length !== 6) {
+      e.preventDefault();
+      // Simple visual cue: focus first empty
+      const firstEmpty = inputs.find(i => !i.value);
+      if (firstEmpty) firstEmpty.focus();
+    }
+  });
+})();
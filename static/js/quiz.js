@@ -0,0 +1,67 @@
+// Elements
+const form = document.getElementById('quizForm');
+const submitBtn = document.getElementById('submitBtn');
+const pbar = document.getElementById('pbar');
+const ptext = document.getElementById('ptext');
+
+// Collect radio groups
+const radios = Array.from(form.querySelectorAll('input[type=radio]'));
+const groupNames = [...new Set(radios.map(r => r.name))];
+
+function recalcProgress(){
+  const answered = groupNames.filter(name => form.querySelector(`input[name="${name}"]:checked`)).length;
+  const pct = Math.round((answered / groupNames.length) * 100);
+  pbar.style.width = pct + '%';
+  ptext.textContent = `${pct}% answered`;
+  // remove unanswered highlight on change
+  form.querySelectorAll('.q.unanswered').forEach(q => {
+    const has = !!q.querySelector('input[type=radio]:checked');
+    if (has) q.classList.remove('unanswered');
+  });
+}
+radios.forEach(r => r.addEventListener('change', recalcProgress));
+recalcProgress();
+
+// Smooth scroll to first unanswered
+function scrollToFirstUnanswered(){
+  for (const name of groupNames){
+    if (!form.querySelector(`input[name="${name}"]:checked`)){
+      const qIdx = parseInt(name.replace(/^q/, ''), 10);
+      const qEl = form.querySelector(`.q[data-q="${qIdx}"]`);
+      if (qEl){
+        qEl.classList.add('unanswered');
+        qEl.scrollIntoView({behavior:'smooth', block:'center'});
+      }
+      return false;
+    }
+  }
+  return true;
+}
+
+// Submit handler
+submitBtn.addEventListener('click', () => {
+  if (!scrollToFirstUnanswered()) return;
+  form.submit();
+});
+
+// Keyboard shortcuts: numbers 1–9 select option in the nearest question
+document.addEventListener('keydown', (e) => {
+  if (!/^[1-9]$/.test(e.key)) return;
+  const idx = parseInt(e.key, 10) - 1;
+
+  // find the question nearest to mid viewport
+  const qs = Array.from(document.querySelectorAll('.q'));
+  const viewportMiddle = window.scrollY + window.innerHeight * 0.35;
+  let nearest = qs[0], best = Infinity;
+  qs.forEach(q => {
+    const rect = q.getBoundingClientRect();
+    const mid = rect.top + window.scrollY + rect.height/2;
+    const d = Math.abs(mid - viewportMiddle);
+    if (d < best){ best = d; nearest = q; }
+  });
+
+  const radiosInQ = nearest.querySelectorAll('input[type=radio]');
+  if (idx >= radiosInQ.length) return;
+  radiosInQ[idx].checked = true;
+  radiosInQ[idx].dispatchEvent(new Event('change', {bubbles:true}));
+});
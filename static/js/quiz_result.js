@@ -0,0 +1,17 @@
+(function(){
+  const summary = document.getElementById('summary');
+  const okEl = document.getElementById('okCount');
+  const badEl = document.getElementById('badCount');
+  const barFill = document.getElementById('barFill');
+
+  const score = parseInt(summary.dataset.score || '0', 10);
+  const total = parseInt(summary.dataset.total || '0', 10);
+  const pct = total ? Math.round((score / total) * 100) : 0;
+
+  const wrong = Math.max(0, total - score);
+  okEl.textContent = score;
+  badEl.textContent = wrong;
+
+  // Fill progress bar
+  if (barFill) barFill.style.width = pct + '%';
+})();
@@ -0,0 +1,23 @@
+// Basic strength meter for password1
+const pw = document.getElementById('id_password1');
+const meter = document.getElementById('pw-meter');
+const hint = document.getElementById('pw-hint');
+
+function strengthScore(v){
+  let s = 0;
+  if (v.length >= 8) s++;
+  if (/[A-Z]/.test(v)) s++;
+  if (/[a-z]/.test(v)) s++;
+  if (/\d/.test(v)) s++;
+  if (/[^A-Za-z0-9]/.test(v)) s++;
+  return Math.min(s, 5);
+}
+function strengthLabel(s){
+  return ['Very weak','Weak','Okay','Good','Strong','Excellent'][s] || '—';
+}
+pw.addEventListener('input', () => {
+  const s = strengthScore(pw.value);
+  const pct = (s/5)*100;
+  meter.style.width = pct + '%';
+  hint.textContent = 'Strength: ' + strengthLabel(s);
+});
@@ -0,0 +1,18 @@
+const submitBtn = document.getElementById('submitBtn');
+const resetBtn = document.getElementById('resetBtn');
+const loadingRow = document.getElementById('loadingRow');
+
+function startLoading(){
+  submitBtn.disabled = true;
+  submitBtn.textContent = 'Generating…';
+  if (loadingRow) loadingRow.style.visibility = 'visible';
+  return true;
+}
+
+if (resetBtn){
+  resetBtn.addEventListener('click', () => {
+    submitBtn.disabled = false;
+    submitBtn.textContent = 'Generate Notes';
+    if (loadingRow) loadingRow.style.visibility = 'hidden';
+  });
+}
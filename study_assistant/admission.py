@@ -0,0 +1,291 @@
+"""
+Admission control for the LLM-backed endpoints.
+
+Every view decorated with @admission_controlled passes three checks before it
+runs:
+
+  1. a per-user rate limit, LLM_USER_RATE_LIMIT requests per
+     LLM_USER_RATE_WINDOW seconds, counted in the shared cache so it holds
+     across all workers. Redis counts atomically across hosts. The file cache
+     has no atomic incr, so there the count is taken under a host-wide file
+     lock; other non-Redis caches (locmem) only hold the limit per process.
+  2. a per-worker slot: at most LLM_MAX_CONCURRENCY admitted requests run at
+     once, and at most LLM_USER_CONCURRENCY of them for any one user
+  3. otherwise a bounded wait queue. Each user has their own queue of at most
+     LLM_USER_QUEUE requests, the total is capped at LLM_QUEUE_SIZE, and freed
+     slots go round-robin across users, so one user with a deep backlog can't
+     starve the others. A request that isn't admitted within
+     LLM_QUEUE_TIMEOUT seconds gives up.
+
+A request that fails a check gets 429 (the user's own limits) or 503 (the
+worker is saturated) with a Retry-After estimate, before any LLM work starts.
+Queue depth, in-flight count, wait time and outcomes go to /metrics.
+"""
+import asyncio
+import functools
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.http import JsonResponse
+from django.shortcuts import render
+
+from . import metrics
+
+try:
+    import fcntl
+except ImportError:     # Windows: the file cache limit is best effort
+    fcntl = None
+
+SERVICE_TIME_ALPHA = 0.2    # weight of the newest request in the service-time average
+MAX_RETRY_AFTER = 300
+
+
+class Rejected(Exception):
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = max(1, min(MAX_RETRY_AFTER, math.ceil(retry_after)))
+
+
+class _Waiter:
+    __slots__ = ("loop", "future", "granted")
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionController:
+    """
+    Slots and fair queues for one worker. State sits behind a thread lock and
+    waiters are woken on their own event loop, so it also works under WSGI,
+    where each request runs its async view on a separate loop.
+    """
+
+    def __init__(self, capacity, per_user, user_queue, max_queue):
+        self.capacity = capacity
+        self.per_user = per_user
+        self.user_queue = user_queue
+        self.max_queue = max_queue
+        self.service_time = 5.0     # running average of admitted request duration, seconds
+        self._lock = threading.Lock()
+        self._active = 0
+        self._running = {}          # user -> admitted requests
+        self._queues = OrderedDict()  # user -> deque of waiters; iteration order is the round-robin order
+        self._queued = 0
+
+    def _can_run(self, user):
+        return self._active < self.capacity and self._running.get(user, 0) < self.per_user
+
+    def _start(self, user):
+        self._active += 1
+        self._running[user] = self._running.get(user, 0) + 1
+
+    def _dispatch(self):
+        """Hand free slots to waiting users, round-robin. Returns the waiters to wake."""
+        woken = []
+        while self._active < self.capacity:
+            user = next((u for u in self._queues if self._running.get(u, 0) < self.per_user), None)
+            if user is None:
+                break
+            queue = self._queues[user]
+            waiter = queue.popleft()
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            self._queued -= 1
+            self._start(user)
+            waiter.granted = True
+            woken.append(waiter)
+        return woken
+
+    def _report(self):
+        metrics.set_gauge("study_llm_queue_depth", self._queued)
+        metrics.set_gauge("study_llm_in_flight", self._active)
+
+    async def acquire(self, user, timeout):
+        """Wait for a slot for `user`; raises Rejected instead of queueing past the limits."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._can_run(user):
+                self._start(user)
+                self._report()
+                return
+            queue = self._queues.get(user, ())
+            if len(queue) >= self.user_queue:
+                raise Rejected(429, "user_queue_full", self.service_time * (len(queue) + 1) / self.per_user)
+            if self._queued >= self.max_queue:
+                raise Rejected(503, "queue_full", self.service_time * (self._queued + 1) / self.capacity)
+            waiter = _Waiter(loop)
+            self._queues.setdefault(user, deque()).append(waiter)
+            self._queued += 1
+            self._report()
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except BaseException:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    queue = self._queues.get(user)
+                    queue.remove(waiter)
+                    if not queue:
+                        del self._queues[user]
+                    self._queued -= 1
+                    self._report()
+            if granted:
+                # Admitted just as we gave up: pass the slot on.
+                self.release(user)
+            raise
+
+    def release(self, user, elapsed=None):
+        with self._lock:
+            self._active -= 1
+            self._running[user] -= 1
+            if not self._running[user]:
+                del self._running[user]
+            if elapsed is not None:
+                self.service_time += SERVICE_TIME_ALPHA * (elapsed - self.service_time)
+            woken = self._dispatch()
+            self._report()
+        for waiter in woken:
+            waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get_controller():
+    """This worker's controller for the current settings."""
+    key = (settings.LLM_MAX_CONCURRENCY, settings.LLM_USER_CONCURRENCY,
+           settings.LLM_USER_QUEUE, settings.LLM_QUEUE_SIZE)
+    with _controllers_lock:
+        if key not in _controllers:
+            _controllers[key] = AdmissionController(*key)
+        return _controllers[key]
+
+
+async def check_rate(user):
+    """Count one request against `user`'s fixed rate window in the shared cache."""
+    limit, window = settings.LLM_USER_RATE_LIMIT, settings.LLM_USER_RATE_WINDOW
+    if not limit:
+        return
+    now = time.time()
+    bucket = int(now // window)
+    key = f"llm:rate:{user}:{bucket}"
+    backend = caches["default"]
+    if isinstance(backend, FileBasedCache):
+        count = await sync_to_async(_count_locked, thread_sensitive=False)(backend, key, window)
+    else:
+        await cache.aadd(key, 0, window + 1)
+        try:
+            count = await cache.aincr(key)
+        except ValueError:      # evicted between add and incr
+            count = 1
+    if count > limit:
+        raise Rejected(429, "rate_limited", (bucket + 1) * window - now)
+
+
+@contextmanager
+def _file_cache_lock():
+    """
+    FileBasedCache.incr reads the file and writes a new one, so two workers
+    can read the same count and both get in. The cache lives on one host,
+    so a lock on RATE_LIMIT_LOCK_FILE serializes every worker's add + incr.
+    """
+    if fcntl is None:
+        yield
+        return
+    path = settings.RATE_LIMIT_LOCK_FILE
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _count_locked(backend, key, window):
+    with _file_cache_lock():
+        backend.add(key, 0, window + 1)
+        try:
+            return backend.incr(key)
+        except ValueError:
+            return 1
+
+
+async def _user_key(request):
+    user = await request.auser()
+    if user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+REJECT_MESSAGES = {
+    429: "You have too many AI requests in progress. Please wait a moment and try again.",
+    503: "The AI assistant is busy right now. Please try again shortly.",
+}
+
+
+async def _rejection(request, rejected, json_key):
+    message = REJECT_MESSAGES[rejected.status]
+    if json_key:
+        response = JsonResponse({json_key: f"⏳ {message}", "retry_after": rejected.retry_after},
+                                status=rejected.status)
+    else:
+        response = await sync_to_async(render)(request, "llm_busy.html", {
+            "message": message, "retry_after": rejected.retry_after,
+        }, status=rejected.status)
+    response["Retry-After"] = str(rejected.retry_after)
+    return response
+
+
+def admission_controlled(endpoint, methods=("POST",), json_key=None):
+    """
+    Admit an async LLM-backed view through this worker's controller.
+    `methods` are the requests that reach the LLM; `json_key` makes rejections
+    a JSON body with the message under that key instead of an HTML page.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if not settings.LLM_ADMISSION_ENABLED or request.method not in methods:
+                return await view(request, *args, **kwargs)
+            user = await _user_key(request)
+            controller = get_controller()
+            queued_at = time.monotonic()
+            try:
+                await check_rate(user)
+                await controller.acquire(user, settings.LLM_QUEUE_TIMEOUT)
+            except Rejected as rejected:
+                metrics.inc("study_llm_admissions_total", endpoint=endpoint, outcome=rejected.reason)
+                return await _rejection(request, rejected, json_key)
+            except asyncio.TimeoutError:
+                metrics.inc("study_llm_admissions_total", endpoint=endpoint, outcome="timeout")
+                return await _rejection(request, Rejected(503, "timeout", controller.service_time), json_key)
+            started = time.monotonic()
+            metrics.observe("study_llm_queue_wait_seconds", started - queued_at, endpoint=endpoint)
+            metrics.inc("study_llm_admissions_total", endpoint=endpoint, outcome="admitted")
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                controller.release(user, time.monotonic() - started)
+        return wrapper
+    return decorator
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'study_assistant.settings')
 
 application = get_asgi_application()
+
+# Imported once the app registry is ready.
+from users import outbox  # noqa: E402
+
+outbox.drain_on_first_request()
@@ -0,0 +1,159 @@
+"""
+Prompt compaction: shrink notes before they go into an LLM prompt.
+
+  html_to_text(html)           HTML to compact structured text: "# Heading"
+                               lines, "- item" bullets, "a | b" table rows and
+                               plain paragraphs; scripts, styles, tags and
+                               attributes are dropped
+  strip_page_furniture(pages)  drop running headers, footers and page numbers,
+                               i.e. lines at the top or bottom of a page that
+                               repeat on most pages
+  collapse_whitespace(text)    trim lines, collapse runs of spaces and of blank lines
+
+compact_html(), compact_pages() and compact_text() chain these for each kind
+of input and return a Compacted with the estimated prompt tokens before and
+after. The totals are counted per source in study_prompt_tokens_total, so
+/metrics shows what each prompt saves.
+"""
+import logging
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+
+from study_assistant import metrics
+from study_assistant.lazy import lazy_import
+
+bs4 = lazy_import("bs4")
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4          # rough average for English text with Gemini's tokenizer
+EDGE_LINES = 3               # lines at the top and bottom of a page checked for furniture
+FURNITURE_RATIO = 0.5        # share of pages a line must repeat on to count as furniture
+_PAGE_NUMBER = re.compile(r"^[-–—\s]*(page\s+)?\d{1,4}(\s*(/|of)\s*\d{1,4})?[-–—\s]*$", re.IGNORECASE)
+_DROP_TAGS = ("script", "style", "head", "noscript", "svg", "template")
+_BLOCK_TAGS = ("p", "div", "section", "article", "header", "footer", "blockquote", "pre",
+               "table", "dl", "dt", "dd", "figure", "figcaption", "hr")
+_LIST_ITEM = re.compile(r"^( *)(-|\d+\.) ")
+
+
+@dataclass
+class Compacted:
+    text: str
+    tokens_before: int
+    tokens_after: int
+
+    @property
+    def tokens_saved(self):
+        return self.tokens_before - self.tokens_after
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def collapse_whitespace(text, keep_list_indent=False):
+    lines, blank = [], False
+    for line in text.splitlines():
+        indent = _LIST_ITEM.match(line) if keep_list_indent else None
+        line = (indent.group(1) if indent else "") + re.sub("[ \t\u00a0\u200b]+", " ", line).strip()
+        if not line:
+            blank = bool(lines)
+            continue
+        if blank:
+            lines.append("")
+            blank = False
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def html_to_text(html):
+    soup = bs4.BeautifulSoup(html, "html.parser")
+    for tag in soup(_DROP_TAGS):
+        tag.decompose()
+    for comment in soup.find_all(string=lambda s: isinstance(s, bs4.Comment)):
+        comment.extract()
+    # Source formatting inside the markup is not content; structure is re-added below.
+    for string in soup.find_all(string=True):
+        if string.find_parent("pre") is None:
+            string.replace_with(re.sub(r"\s+", " ", string))
+
+    for br in soup.find_all("br"):
+        br.replace_with("\n")
+    for level in range(1, 7):
+        for heading in soup.find_all(f"h{level}"):
+            heading.insert_before(f"\n\n{'#' * level} ")
+            heading.insert_after("\n")
+    for item in soup.find_all("li"):
+        depth = len(item.find_parents(["ul", "ol"])) - 1
+        parent = item.find_parent(["ul", "ol"])
+        if parent is not None and parent.name == "ol":
+            marker = f"{len(item.find_previous_siblings('li')) + 1}."
+        else:
+            marker = "-"
+        item.insert_before(f"\n{'  ' * max(depth, 0)}{marker} ")
+    for lst in soup.find_all(["ul", "ol"]):
+        if lst.find_parent("li") is None:
+            lst.insert_before("\n")
+            lst.insert_after("\n")
+    for cell in soup.find_all(["td", "th"]):
+        if cell.find_previous_sibling(["td", "th"]) is not None:
+            cell.insert_before(" | ")
+    for row in soup.find_all("tr"):
+        row.insert_before("\n")
+    for block in soup.find_all(_BLOCK_TAGS):
+        block.insert_before("\n")
+        block.insert_after("\n")
+    return collapse_whitespace(soup.get_text(), keep_list_indent=True)
+
+
+def _furniture_key(line):
+    # A number at either end of a running head is usually the page number
+    # ("12  CHAPTER 1. INTRODUCTION"), so it doesn't make the line unique.
+    line = " ".join(line.lower().split())
+    return re.sub(r"^\d+\b|\b\d+$", "#", line)
+
+
+def strip_page_furniture(pages):
+    """Remove running headers/footers and page numbers from per-page text; returns the pages."""
+    split = [[line for line in page.splitlines() if line.strip()] for page in pages]
+    seen = Counter()
+    for lines in split:
+        seen.update({_furniture_key(line) for line in lines[:EDGE_LINES] + lines[-EDGE_LINES:]})
+    threshold = max(2, math.ceil(FURNITURE_RATIO * len(split)))
+    furniture = {key for key, count in seen.items() if count >= threshold} if len(split) >= 2 else set()
+
+    cleaned = []
+    for lines in split:
+        edge = set(range(min(EDGE_LINES, len(lines)))) | set(range(max(0, len(lines) - EDGE_LINES), len(lines)))
+        cleaned.append("\n".join(
+            line for i, line in enumerate(lines)
+            if not (i in edge and (_furniture_key(line) in furniture or _PAGE_NUMBER.match(line)))
+        ))
+    return cleaned
+
+
+def _report(source, raw, text):
+    result = Compacted(text, estimate_tokens(raw), estimate_tokens(text))
+    metrics.inc("study_prompt_tokens_total", result.tokens_before, source=source, stage="raw")
+    metrics.inc("study_prompt_tokens_total", result.tokens_after, source=source, stage="compacted")
+    logger.debug("Compacted %s prompt input: %d -> %d tokens", source, result.tokens_before, result.tokens_after)
+    return result
+
+
+def compact_html(html, source):
+    with metrics.timer("compact"):
+        return _report(source, html, html_to_text(html))
+
+
+def compact_pages(pages, source):
+    with metrics.timer("compact"):
+        pages = list(pages)
+        text = "\n\n".join(collapse_whitespace(p) for p in strip_page_furniture(pages))
+        return _report(source, "\n".join(pages), collapse_whitespace(text))
+
+
+def compact_text(text, source):
+    with metrics.timer("compact"):
+        return _report(source, text, collapse_whitespace(text))
@@ -0,0 +1,49 @@
+"""
+Deferred imports for heavy optional libraries.
+
+    fitz = lazy_import("fitz")
+    ...
+    fitz.open(...)          # PyMuPDF is imported here, on first attribute access
+
+Module-level `import fitz`, `google.generativeai`, langchain/FAISS and
+reportlab together cost seconds, and every worker boot, migration and
+management command paid for them through URL resolution. With lazy_import the
+cost moves to the first request that actually needs the library.
+"""
+import importlib
+import threading
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Stands in for a module until one of its attributes is used."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+        self.__dict__["_lazy_lock"] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            with self.__dict__["_lazy_lock"]:
+                module = self.__dict__["_lazy_module"]
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_lazy_module"] is not None else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+def lazy_import(name):
+    """Return a proxy that imports `name` the first time an attribute is read."""
+    return LazyModule(name)
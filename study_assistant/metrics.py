@@ -0,0 +1,445 @@
+"""
+Lightweight in-process metrics.
+
+Counters, gauges and histograms live in a per-process registry. Each worker writes a
+snapshot of its registry to METRICS_DIR/<pid>-<token>.json (at most once per
+FLUSH_INTERVAL, from a background thread the request middleware wakes, so no
+file I/O happens on the request path), and the /metrics view sums every
+snapshot in the directory, so one scrape covers all gunicorn/uvicorn workers on
+the host. Snapshots of processes that have exited are folded into
+METRICS_DIR/retired.json, so their counts survive worker restarts; idle
+workers keep their snapshot however long ago they last wrote it.
+
+/metrics answers staff users, and scrapers that send
+"Authorization: Bearer <METRICS_TOKEN>"; everyone else gets 403.
+
+Instrumentation helpers:
+
+  timer(stage)       time a pipeline stage (extraction, embedding, index I/O...)
+  llm_call(source)   time one LLM call and count its outcome and tokens
+  DB queries         counted per request by a wrapper installed on every connection
+
+Stage and DB timings are also collected per request and sent back in a
+Server-Timing header by ServerTimingMiddleware (study_assistant/middleware.py)
+when SERVER_TIMING is on.
+"""
+import asyncio
+import atexit
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager, suppress
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks; concurrent scrapes may fold a snapshot twice
+    fcntl = None
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+FLUSH_INTERVAL = 1.0          # seconds between snapshot writes per process
+RETIRED_FILE = "retired.json"  # summed counters and histograms of exited processes
+
+HELP = {
+    "study_stage_seconds": ("histogram", "Time spent in a pipeline stage."),
+    "study_llm_calls_total": ("counter", "LLM API calls by source and outcome."),
+    "study_llm_call_seconds": ("histogram", "LLM API call latency by source."),
+    "study_llm_tokens_total": ("counter", "LLM tokens by source and kind (prompt/completion)."),
+    "study_db_queries_total": ("counter", "Database queries by view."),
+    "study_db_query_seconds_total": ("counter", "Time spent in database queries by view."),
+    "study_http_requests_total": ("counter", "HTTP requests by view and status class."),
+    "study_http_request_seconds": ("histogram", "HTTP request latency by view."),
+    "study_llm_admissions_total": ("counter", "LLM endpoint requests by endpoint and admission outcome."),
+    "study_llm_queue_wait_seconds": ("histogram", "Time LLM endpoint requests waited for admission."),
+    "study_llm_queue_depth": ("gauge", "LLM endpoint requests waiting for admission."),
+    "study_llm_in_flight": ("gauge", "LLM endpoint requests admitted and running."),
+    "study_prompt_tokens_total": ("counter", "Estimated prompt input tokens by source, before (raw) and after compaction."),
+    "study_question_bank_questions_total": ("counter", "Live-quiz questions by origin (bank or generated)."),
+}
+
+_lock = threading.Lock()
+_counters = {}      # (name, labels) -> value
+_gauges = {}        # (name, labels) -> current value; summed across processes like counters
+_histograms = {}    # (name, labels) -> [bucket counts..., sum, count]
+_token = secrets.token_hex(4)
+_flush_wanted = threading.Event()
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        _gauges[key] = value
+
+
+def observe(name, seconds, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * len(BUCKETS) + [0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist[i] += 1
+        hist[-2] += seconds
+        hist[-1] += 1
+
+
+# -----------------------------
+# Per-request collection (Server-Timing)
+# -----------------------------
+class RequestTimings:
+    def __init__(self):
+        self.stages = {}        # stage -> [total seconds, count]
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage, seconds):
+        with self._lock:
+            entry = self.stages.setdefault(stage, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def add_query(self, seconds):
+        with self._lock:
+            self.db_queries += 1
+            self.db_seconds += seconds
+
+    def header(self, total_seconds):
+        parts = []
+        for stage, (seconds, count) in self.stages.items():
+            desc = f';desc="{count} calls"' if count > 1 else ""
+            parts.append(f"{stage};dur={seconds * 1000:.1f}{desc}")
+        if self.db_queries:
+            parts.append(f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_queries} queries"')
+        parts.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(parts)
+
+
+# Context variables follow sync_to_async and executor hops, so stages timed in
+# worker threads still land on the request that started them.
+current_request = ContextVar("metrics_request", default=None)
+
+
+@contextmanager
+def timer(stage, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        observe("study_stage_seconds", elapsed, stage=stage, **labels)
+        timings = current_request.get()
+        if timings is not None:
+            timings.add_stage(stage, elapsed)
+
+
+# -----------------------------
+# LLM calls
+# -----------------------------
+class _LLMCall:
+    response = None     # set by the caller so token usage can be read from it
+
+
+@contextmanager
+def llm_call(source, stage="llm"):
+    """
+    Time one LLM call. Assign the response (or last streamed chunk) to the
+    yielded object's `.response` to record its token usage.
+
+    Calls are not labelled by API key: genai.configure() sets the key
+    process-wide, so another request can swap it before this call goes out.
+    """
+    call = _LLMCall()
+    outcome = "ok"
+    started = time.perf_counter()
+    try:
+        with timer(stage, source=source):
+            yield call
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        raise
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        observe("study_llm_call_seconds", time.perf_counter() - started, source=source)
+        inc("study_llm_calls_total", source=source, outcome=outcome)
+        usage = getattr(call.response, "usage_metadata", None)
+        if usage is not None:
+            inc("study_llm_tokens_total", getattr(usage, "prompt_token_count", 0) or 0,
+                source=source, kind="prompt")
+            inc("study_llm_tokens_total", getattr(usage, "candidates_token_count", 0) or 0,
+                source=source, kind="completion")
+
+
+# -----------------------------
+# DB queries
+# -----------------------------
+def _count_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        timings = current_request.get()
+        if timings is not None:
+            timings.add_query(elapsed)
+        else:
+            # Outside a request (write-behind flusher, commands): count directly.
+            inc("study_db_queries_total", view="-")
+            inc("study_db_query_seconds_total", elapsed, view="-")
+
+
+def _install_query_counter(sender, connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+connection_created.connect(_install_query_counter, dispatch_uid="study_assistant.metrics")
+
+
+def watch_connections():
+    """Cover connections this thread opened before the signal handler was connected."""
+    for conn in connections.all(initialized_only=True):
+        _install_query_counter(None, conn)
+
+
+def record_request(view, status, seconds, timings):
+    inc("study_http_requests_total", view=view, status=f"{status // 100}xx")
+    observe("study_http_request_seconds", seconds, view=view)
+    if timings.db_queries:
+        inc("study_db_queries_total", timings.db_queries, view=view)
+        inc("study_db_query_seconds_total", timings.db_seconds, view=view)
+
+
+# -----------------------------
+# Cross-process snapshots
+# -----------------------------
+def _metrics_dir():
+    return settings.METRICS_DIR
+
+
+def _snapshot():
+    with _lock:
+        return {
+            "counters": [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            "gauges": [[name, list(labels), value] for (name, labels), value in _gauges.items()],
+            "histograms": [[name, list(labels), list(hist)] for (name, labels), hist in _histograms.items()],
+        }
+
+
+def _write_json(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fh:
+        json.dump(data, fh)
+    os.replace(tmp, path)
+
+
+def _write_snapshot():
+    directory = _metrics_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        _write_json(os.path.join(directory, f"{os.getpid()}-{_token}.json"), _snapshot())
+    except OSError:
+        pass
+
+
+def _flush_loop():
+    while True:
+        _flush_wanted.wait()
+        _flush_wanted.clear()
+        _write_snapshot()
+        time.sleep(FLUSH_INTERVAL)
+
+
+def _ensure_flusher():
+    global _flusher_pid
+    # Threads don't survive a fork (gunicorn --preload), so track the owner pid.
+    if _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid != os.getpid():
+            threading.Thread(target=_flush_loop, name="metrics-flusher", daemon=True).start()
+            _flusher_pid = os.getpid()
+
+
+def flush(force=False):
+    """
+    Write this process's registry to its snapshot file: right away if forced,
+    otherwise within FLUSH_INTERVAL from the background flusher. The unforced
+    call never blocks, so it is safe on the event loop.
+    """
+    if force:
+        _write_snapshot()
+        return
+    _ensure_flusher()
+    _flush_wanted.set()
+
+
+atexit.register(flush, force=True)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:     # exists, owned by someone else
+        return True
+    return True
+
+
+def _snapshot_pid(name):
+    pid, sep, _ = name.partition("-")
+    return int(pid) if sep and pid.isdigit() else None
+
+
+@contextmanager
+def _dir_lock(directory):
+    """Serialize collectors, so a dead process's snapshot is folded exactly once."""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(directory, exist_ok=True)
+    fd = os.open(os.path.join(directory, ".lock"), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _read_json(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _add(counters, histograms, data, gauges=True):
+    for metric, labels, value in data["counters"] + (data.get("gauges", []) if gauges else []):
+        key = (metric, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0) + value
+    for metric, labels, hist in data["histograms"]:
+        key = (metric, tuple(map(tuple, labels)))
+        total = histograms.get(key)
+        histograms[key] = hist if total is None else [a + b for a, b in zip(total, hist)]
+
+
+def _as_snapshot(counters, histograms):
+    return {
+        "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+        "histograms": [[name, list(labels), hist] for (name, labels), hist in histograms.items()],
+    }
+
+
+def _fold_retired(directory, dead):
+    """Add the counters and histograms of exited processes to RETIRED_FILE; their gauges end with them."""
+    retired_path = os.path.join(directory, RETIRED_FILE)
+    counters, histograms = {}, {}
+    retired = _read_json(retired_path)
+    if retired is not None:
+        _add(counters, histograms, retired)
+    for path in dead:
+        data = _read_json(path)
+        if data is not None:
+            _add(counters, histograms, data, gauges=False)
+    _write_json(retired_path, _as_snapshot(counters, histograms))
+    for path in dead:
+        with suppress(FileNotFoundError):
+            os.remove(path)
+
+
+def _collect():
+    """Sum the retired totals and every live process snapshot in METRICS_DIR."""
+    counters, histograms = {}, {}
+    directory = _metrics_dir()
+    with _dir_lock(directory):
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            names = []
+        snapshots = {os.path.join(directory, n): _snapshot_pid(n)
+                     for n in names if n.endswith(".json") and n != RETIRED_FILE}
+        dead = [path for path, pid in snapshots.items() if pid is not None and not _pid_alive(pid)]
+        if dead:
+            try:
+                _fold_retired(directory, dead)
+            except OSError:
+                dead = []   # couldn't fold them; count them as they are this time
+        for path in [os.path.join(directory, RETIRED_FILE)] + list(snapshots):
+            if path in dead:
+                continue
+            data = _read_json(path)
+            if data is not None:
+                _add(counters, histograms, data)
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def render_prometheus():
+    counters, histograms = _collect()
+    by_name = {}
+    for (name, labels), value in counters.items():
+        by_name.setdefault(name, []).append(f"{name}{_fmt_labels(labels)} {value}")
+    for (name, labels), hist in histograms.items():
+        lines = by_name.setdefault(name, [])
+        for bound, count in zip(BUCKETS, hist):
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', le)])} {count}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {hist[-2]}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {hist[-1]}")
+
+    out = []
+    for name in sorted(by_name):
+        kind, text = HELP.get(name, ("untyped", name))
+        out.append(f"# HELP {name} {text}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(sorted(by_name[name]))
+    return "\n".join(out) + "\n"
+
+
+def _may_scrape(request):
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token and secrets.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+def metrics_view(request):
+    """Prometheus text exposition, summed across this host's workers."""
+    if not _may_scrape(request):
+        return HttpResponseForbidden()
+    flush(force=True)
+    return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,74 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import metrics
+
+
+def _finish(request, response, timings, started):
+    elapsed = time.perf_counter() - started
+    match = getattr(request, "resolver_match", None)
+    view = (match.url_name or match.view_name) if match else "unmatched"
+    metrics.record_request(view, response.status_code, elapsed, timings)
+    if getattr(settings, "SERVER_TIMING", False):
+        response["Server-Timing"] = timings.header(elapsed)
+    metrics.flush()
+    return response
+
+
+@sync_and_async_middleware
+def ServerTimingMiddleware(get_response):
+    """
+    Collects per-request stage and DB timings (see study_assistant.metrics),
+    records request metrics and, with SERVER_TIMING on, adds a Server-Timing
+    header to the response.
+    """
+    metrics.watch_connections()
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            timings = metrics.RequestTimings()
+            token = metrics.current_request.set(timings)
+            started = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                metrics.current_request.reset(token)
+            return _finish(request, response, timings, started)
+    else:
+        def middleware(request):
+            timings = metrics.RequestTimings()
+            token = metrics.current_request.set(timings)
+            started = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                metrics.current_request.reset(token)
+            return _finish(request, response, timings, started)
+    return middleware
+
+
+@sync_and_async_middleware
+def StaticFilesMiddleware(get_response):
+    """
+    WhiteNoise, minus its sync-only __call__. One sync-only middleware makes
+    Django run the whole chain, async views included, on the single thread
+    ASGI keeps for sync code, which serializes every request. This serves
+    static files the same way and hands everything else straight on.
+    """
+    whitenoise = WhiteNoiseMiddleware(get_response)
+    if not iscoroutinefunction(get_response):
+        return whitenoise
+
+    async def middleware(request):
+        if whitenoise.autorefresh:
+            # DEBUG: looks the file up on disk and in the finders on every request.
+            static_file = await sync_to_async(whitenoise.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = whitenoise.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(whitenoise.serve, thread_sensitive=False)(static_file, request)
+        return await get_response(request)
+    return middleware
@@ -0,0 +1,276 @@
+"""
+Sampled request profiling (off by default, PROFILING_ENABLED).
+
+ProfilingMiddleware runs cProfile on a random PROFILING_SAMPLE_RATE share of
+requests. With PROFILING_SLOW_MS set it profiles every request instead and keeps
+the report only for requests that were sampled or slower than the threshold,
+which costs cProfile overhead on all traffic, so use it for short windows.
+On the views listed in PROFILING_TRACEMALLOC_VIEWS (the RAG views by default),
+a profiled request also gets tracemalloc snapshots before and after, and the
+report lists allocation growth by file and line.
+
+cProfile only sees the thread it runs in. Work that async views push to worker
+threads is covered by decorating the offloaded function with @profiled, which
+profiles it in its own thread and merges the stats into the request's report.
+For async views, the event-loop profile also includes any other coroutines that
+ran on the loop meanwhile.
+
+Reports are text files in PROFILING_DIR (newest PROFILING_KEEP kept), browsable
+by staff at /profiles/.
+"""
+import cProfile
+import functools
+import io
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse
+from django.shortcuts import render
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+from django.utils.decorators import sync_and_async_middleware
+
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+_NAME_RE = re.compile(r"^[\w.-]+\.txt$")
+
+_tracemalloc_lock = threading.Lock()
+current_session = ContextVar("profiling_session", default=None)
+
+
+class ProfileSession:
+    """cProfile runs for one request, one per thread it touched."""
+
+    def __init__(self):
+        self.profiles = []
+        self._lock = threading.Lock()
+
+    def add(self, profile):
+        with self._lock:
+            self.profiles.append(profile)
+
+    def stats_text(self):
+        out = io.StringIO()
+        with self._lock:
+            profiles = list(self.profiles)
+        if not profiles:
+            return "(no profile collected)\n"
+        stats = pstats.Stats(profiles[0], stream=out)
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        return out.getvalue()
+
+
+def profiled(func):
+    """
+    Profile `func` in whatever thread it runs in, on behalf of the request
+    being profiled. A no-op when no request is profiled or the thread already
+    has a profiler running.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        session = current_session.get()
+        if session is None or sys.getprofile() is not None:
+            return func(*args, **kwargs)
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            session.add(profile)
+    return wrapper
+
+
+# -----------------------------
+# Middleware
+# -----------------------------
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        # Before the URL resolver has run; only profiled requests pay for this.
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return "unmatched"
+    return match.url_name or match.view_name
+
+
+class _RequestProfile:
+    def __init__(self, request, sampled):
+        self.request = request
+        self.sampled = sampled
+        self.session = ProfileSession()
+        self.profile = None
+        self.token = None
+        self.snapshot = None
+        self.traced = False
+        self.started_tracing = False
+        self.started = None
+
+    def start(self):
+        self.token = current_session.set(self.session)
+        self.start_tracemalloc()
+        if sys.getprofile() is None:
+            # Another request on this thread (the event loop) may hold the profiler.
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        self.started = time.perf_counter()
+
+    def start_tracemalloc(self):
+        if _view_name(self.request) not in settings.PROFILING_TRACEMALLOC_VIEWS:
+            return
+        if not _tracemalloc_lock.acquire(blocking=False):
+            return
+        self.traced = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(settings.PROFILING_TRACEMALLOC_FRAMES)
+            self.started_tracing = True
+        self.snapshot = tracemalloc.take_snapshot()
+
+    def finish(self, response):
+        elapsed = time.perf_counter() - self.started
+        if self.profile is not None:
+            self.profile.disable()
+            self.session.add(self.profile)
+        current_session.reset(self.token)
+
+        allocations = None
+        if self.traced:
+            try:
+                after = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                allocations = (self.snapshot, after, peak)
+                if self.started_tracing:
+                    tracemalloc.stop()
+            finally:
+                _tracemalloc_lock.release()
+
+        slow_ms = settings.PROFILING_SLOW_MS
+        slow = bool(slow_ms) and elapsed * 1000 >= slow_ms
+        if self.sampled or slow:
+            _write_report(self.request, response, elapsed, "slow" if slow else "sampled",
+                          self.session, allocations)
+
+
+def _should_profile():
+    """(profile this request?, was it picked by sampling?)"""
+    sampled = random.random() < settings.PROFILING_SAMPLE_RATE
+    return sampled or bool(settings.PROFILING_SLOW_MS), sampled
+
+
+@sync_and_async_middleware
+def ProfilingMiddleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not settings.PROFILING_ENABLED:
+                return await get_response(request)
+            profile, sampled = _should_profile()
+            if not profile:
+                return await get_response(request)
+            run = _RequestProfile(request, sampled)
+            run.start()
+            response = None
+            try:
+                response = await get_response(request)
+                return response
+            finally:
+                run.finish(response)
+    else:
+        def middleware(request):
+            if not settings.PROFILING_ENABLED:
+                return get_response(request)
+            profile, sampled = _should_profile()
+            if not profile:
+                return get_response(request)
+            run = _RequestProfile(request, sampled)
+            run.start()
+            response = None
+            try:
+                response = get_response(request)
+                return response
+            finally:
+                run.finish(response)
+    return middleware
+
+
+# -----------------------------
+# Reports
+# -----------------------------
+def _write_report(request, response, elapsed, reason, session, allocations):
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    view = _view_name(request)
+    stamp = timezone.now().strftime("%Y%m%d-%H%M%S-%f")
+    slug = re.sub(r"[^\w.-]", "_", view)
+    name = f"{stamp}-{slug}-{elapsed * 1000:.0f}ms.txt"
+
+    lines = [
+        f"{request.method} {request.get_full_path()}",
+        f"view: {view}",
+        f"status: {getattr(response, 'status_code', 'error')}",
+        f"duration: {elapsed * 1000:.1f} ms",
+        f"reason: {reason}",
+        f"pid: {os.getpid()}",
+        "",
+        "== cProfile (cumulative) ==",
+        session.stats_text(),
+    ]
+    if allocations is not None:
+        before, after, peak = allocations
+        lines.append(f"== tracemalloc: allocation growth by line (peak traced {peak / 1e6:.1f} MB) ==")
+        for stat in after.compare_to(before, "lineno")[:TOP_ALLOCATIONS]:
+            lines.append(str(stat))
+        lines.append("")
+
+    with open(os.path.join(directory, name), "w") as fh:
+        fh.write("\n".join(lines))
+    _prune(directory)
+
+
+def _prune(directory):
+    names = sorted(n for n in os.listdir(directory) if _NAME_RE.match(n))
+    for stale in names[:-settings.PROFILING_KEEP]:
+        try:
+            os.remove(os.path.join(directory, stale))
+        except OSError:
+            pass
+
+
+@staff_member_required
+def profiles_view(request):
+    directory = settings.PROFILING_DIR
+    try:
+        names = sorted((n for n in os.listdir(directory) if _NAME_RE.match(n)), reverse=True)
+    except FileNotFoundError:
+        names = []
+    return render(request, "profiles.html", {
+        "profiles": names,
+        "enabled": settings.PROFILING_ENABLED,
+        "sample_rate": settings.PROFILING_SAMPLE_RATE,
+        "slow_ms": settings.PROFILING_SLOW_MS,
+    })
+
+
+@staff_member_required
+def profile_detail_view(request, name):
+    if not _NAME_RE.match(name):
+        raise Http404
+    path = os.path.join(settings.PROFILING_DIR, name)
+    try:
+        with open(path) as fh:
+            body = fh.read()
+    except FileNotFoundError:
+        raise Http404
+    return HttpResponse(body, content_type="text/plain; charset=utf-8")
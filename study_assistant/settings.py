@@ -4,6 +4,7 @@ Django settings for study_assistant project.
 
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 import dj_database_url
 
@@ -35,6 +36,10 @@ INSTALLED_APPS = [
 # --- Middleware ---
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    # Serves /static/ before the timing/profiling middleware see the request.
+    "study_assistant.middleware.StaticFilesMiddleware",   # WhiteNoise, async-capable
+    "study_assistant.middleware.ServerTimingMiddleware",
+    "study_assistant.profiling.ProfilingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -46,17 +51,24 @@ MIDDLEWARE = [
 ROOT_URLCONF = "study_assistant.urls"
 
 # --- Templates ---
+# Compiled templates are cached per process outside DEBUG; in DEBUG edits show up on reload.
+TEMPLATE_LOADERS = [
+    "django.template.loaders.filesystem.Loader",
+    "django.template.loaders.app_directories.Loader",
+]
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
-        "APP_DIRS": True,
         "OPTIONS": {
             "context_processors": [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
             ],
+            "loaders": TEMPLATE_LOADERS if DEBUG else [
+                ("django.template.loaders.cached.Loader", TEMPLATE_LOADERS),
+            ],
         },
     },
 ]
@@ -92,9 +104,38 @@ TIME_ZONE = "UTC"
 USE_I18N = True
 USE_TZ = True
 
+# --- Cache ---
+# Shared by all workers: room state, leaderboards, generation progress, template
+# fragments. Redis when REDIS_URL is set, otherwise files under CACHE_DIR (one
+# host). Hot keys are also held briefly in-process, see study_assistant/tiered_cache.py.
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL},
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.getenv("CACHE_DIR", os.path.join(tempfile.gettempdir(), "study_assistant_cache")),
+            "OPTIONS": {"MAX_ENTRIES": 20000},
+        },
+    }
+
 # --- Static Files ---
 STATIC_URL = "static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"  # For deployment (collectstatic)
+STATICFILES_DIRS = [BASE_DIR / "static"]
+# In production collectstatic writes content-hashed copies plus .gz/.br
+# (Brotli when installed) and WhiteNoise serves those with immutable,
+# far-future cache headers. DEBUG serves the unhashed files directly.
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage" if DEBUG
+        else "whitenoise.storage.CompressedManifestStaticFilesStorage",
+    },
+}
 
 # --- Default Primary Key ---
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
@@ -103,17 +144,112 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 AUTH_USER_MODEL = "users.CustomUser"
 
 # --- Email Settings ---
-EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
-EMAIL_HOST = "smtp.gmail.com"
-EMAIL_PORT = 587
-EMAIL_USE_TLS = True
+# Set EMAIL_BACKEND=django.core.mail.backends.console.EmailBackend to print mail locally.
+EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", "django.core.mail.backends.smtp.EmailBackend")
+EMAIL_HOST = os.getenv("EMAIL_HOST", "smtp.gmail.com")
+EMAIL_PORT = int(os.getenv("EMAIL_PORT", "587"))
+EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS", "True") == "True"
 EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
+EMAIL_TIMEOUT = 20
+
+# --- Email Outbox ---
+# OTP mail is queued in the database and sent by users/outbox.py, off the request path.
+# With EMAIL_OUTBOX_BACKGROUND each web worker drains it from a background thread;
+# otherwise run `manage.py send_outbox --loop` (or from cron). Sent and failed rows
+# are deleted after RETENTION_DAYS; their body (the OTP) is cleared right away.
+EMAIL_OUTBOX_BACKGROUND = os.getenv("EMAIL_OUTBOX_BACKGROUND", "True") == "True"
+EMAIL_OUTBOX_BATCH = int(os.getenv("EMAIL_OUTBOX_BATCH", "50"))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "5"))
+EMAIL_OUTBOX_RETRY_BASE = float(os.getenv("EMAIL_OUTBOX_RETRY_BASE", "30"))  # seconds, doubled per attempt
+EMAIL_OUTBOX_RETENTION_DAYS = int(os.getenv("EMAIL_OUTBOX_RETENTION_DAYS", "7"))
 
 # --- Login/Logout Redirects ---
 LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/login/"
 
-
-
-
+# --- AI / LLM ---
+# Upper bound for a single Gemini call made from the async views.
+LLM_TIMEOUT_SECONDS = int(os.getenv("LLM_TIMEOUT_SECONDS", "90"))
+# Live-quiz generation is split into batches of this many questions,
+# with at most QUIZ_GENERATION_CONCURRENCY batches in flight.
+QUIZ_GENERATION_BATCH_SIZE = int(os.getenv("QUIZ_GENERATION_BATCH_SIZE", "10"))
+QUIZ_GENERATION_CONCURRENCY = int(os.getenv("QUIZ_GENERATION_CONCURRENCY", "5"))
+# Admission control in front of the LLM-backed views (study_assistant/admission.py).
+# Slots and queues are per worker; the rate limit is shared through the cache. It is
+# strict across hosts only with REDIS_URL; the file cache makes it strict per host.
+LLM_ADMISSION_ENABLED = os.getenv("LLM_ADMISSION_ENABLED", "True") == "True"
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_USER_CONCURRENCY = int(os.getenv("LLM_USER_CONCURRENCY", "2"))
+LLM_USER_QUEUE = int(os.getenv("LLM_USER_QUEUE", "2"))
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "32"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+LLM_USER_RATE_LIMIT = int(os.getenv("LLM_USER_RATE_LIMIT", "20"))   # requests per window, 0 disables
+LLM_USER_RATE_WINDOW = int(os.getenv("LLM_USER_RATE_WINDOW", "60"))
+# Without Redis, workers take this lock file around each rate-limit count.
+RATE_LIMIT_LOCK_FILE = os.getenv("RATE_LIMIT_LOCK_FILE", os.path.join(tempfile.gettempdir(), "study_assistant_ratelimit.lock"))
+# Generated questions are banked per creator and reused when they upload notes
+# whose embedding matches earlier ones at least this closely (generate_quiz/question_bank.py).
+QUESTION_BANK_ENABLED = os.getenv("QUESTION_BANK_ENABLED", "True") == "True"
+QUESTION_BANK_SOURCE_SIMILARITY = float(os.getenv("QUESTION_BANK_SOURCE_SIMILARITY", "0.9"))
+QUESTION_BANK_DUPLICATE_SIMILARITY = float(os.getenv("QUESTION_BANK_DUPLICATE_SIMILARITY", "0.92"))
+
+# --- Live Quiz Rooms ---
+# Batch quiz submissions through a write-behind buffer (group commit); set to
+# "False" to write each submission inline in the request.
+QUIZ_RESULT_WRITE_BEHIND = os.getenv("QUIZ_RESULT_WRITE_BEHIND", "True") == "True"
+# Room codes of quizzes that finished longer ago than this are returned to the pool
+# (manage.py reclaim_room_codes, or automatically once fresh codes run out).
+ROOM_CODE_RETENTION_DAYS = int(os.getenv("ROOM_CODE_RETENTION_DAYS", "30"))
+# Secret key of the permutation fresh room codes are drawn from (defaults to SECRET_KEY).
+# Changing it only reorders codes not handed out yet; codes in use are skipped.
+ROOM_CODE_KEY = os.getenv("ROOM_CODE_KEY", "")
+
+# --- Metrics ---
+# Each worker process snapshots its counters here; /metrics sums them all.
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "study_assistant_metrics"))
+# /metrics is served to staff users, and to scrapers sending "Authorization: Bearer <token>"
+# when this is set; everyone else gets 403.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Add per-stage Server-Timing headers to responses. Off by default: the header
+# shows anyone, not just staff, how long each stage and DB call took.
+SERVER_TIMING = os.getenv("SERVER_TIMING", "False") == "True"
+
+# --- Profiling ---
+# Sampled cProfile/tracemalloc reports (study_assistant/profiling.py); staff can
+# browse them at /profiles/. Off by default.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "False") == "True"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0.01"))
+# When > 0, profile every request and also keep reports for any slower than this.
+PROFILING_SLOW_MS = int(os.getenv("PROFILING_SLOW_MS", "0"))
+PROFILING_DIR = os.getenv("PROFILING_DIR", os.path.join(tempfile.gettempdir(), "study_assistant_profiles"))
+PROFILING_KEEP = int(os.getenv("PROFILING_KEEP", "200"))
+# Views whose profiled requests also get tracemalloc before/after snapshots.
+PROFILING_TRACEMALLOC_VIEWS = ["generated_notes", "ask_doubt"]
+PROFILING_TRACEMALLOC_FRAMES = 1
+
+# --- Embeddings ---
+# Model variant used to embed notes (notes/embedding_backends.py): "fp32", "int8"
+# (dynamically quantized, faster on CPU) or "onnx" (needs optimum[onnxruntime]).
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "fp32")
+# Unix socket of the shared embedding sidecar (manage.py embedding_server).
+# Empty: each worker loads its own copy of the model.
+EMBEDDING_SERVICE_SOCKET = os.getenv("EMBEDDING_SERVICE_SOCKET", "")
+# Sidecar micro-batching: wait up to this long for more requests, up to this many texts.
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "64"))
+
+# --- Vector stores ---
+# Per-user FAISS stores (notes/store_registry.py). Stores not queried for TTL_DAYS
+# are removed, then least recently used ones while the total exceeds MAX_BYTES
+# (0 disables either rule). GC runs from `manage.py gc_vectorstores` and, at most
+# every GC_INTERVAL seconds, in the background after a notes upload (0: only from
+# the command). VECTORSTORE_DIR should be dedicated to the stores: GC only deletes
+# stores of unknown users in a directory it created itself.
+VECTORSTORE_DIR = os.getenv("VECTORSTORE_DIR", os.path.join(tempfile.gettempdir(), "study_assistant_vectorstores"))
+# Where stores were written before VECTORSTORE_DIR existed. GC moves those of known
+# users into VECTORSTORE_DIR and deletes the rest; empty disables the pass.
+VECTORSTORE_LEGACY_DIR = os.getenv("VECTORSTORE_LEGACY_DIR", "/tmp")
+VECTORSTORE_TTL_DAYS = int(os.getenv("VECTORSTORE_TTL_DAYS", "30"))
+VECTORSTORE_MAX_BYTES = int(os.getenv("VECTORSTORE_MAX_BYTES", str(2 * 1024 ** 3)))
+VECTORSTORE_GC_INTERVAL = int(os.getenv("VECTORSTORE_GC_INTERVAL", "3600"))
@@ -0,0 +1,332 @@
+import asyncio
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.cache import cache
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from users.models import CustomUser
+
+from . import compaction, metrics, profiling
+from .admission import AdmissionController, Rejected, check_rate
+from .tiered_cache import TieredCache
+
+MANIFEST_STORAGES = {
+    **settings.STORAGES,
+    "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
+}
+
+
+class StaticAssetTests(SimpleTestCase):
+    def test_templates_have_no_inline_css_or_js(self):
+        for path in (settings.BASE_DIR / "templates").glob("*.html"):
+            html = path.read_text()
+            self.assertNotIn("<style", html, path.name)
+            self.assertIsNone(re.search(r"<script>", html), path.name)
+
+    def test_collectstatic_writes_hashed_precompressed_bundles(self):
+        root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        with override_settings(STATIC_ROOT=root, STORAGES=MANIFEST_STORAGES):
+            call_command("collectstatic", interactive=False, verbosity=0)
+            hashed = staticfiles_storage.stored_name("css/base.css")
+
+        self.assertRegex(hashed, r"^css/base\.[0-9a-f]{12}\.css$")
+        self.assertTrue((root / hashed).exists())
+        self.assertTrue((root / (hashed + ".gz")).exists())
+        manifest = json.loads((root / "staticfiles.json").read_text())
+        self.assertIn("js/generate_quiz_results.js", manifest["paths"])
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class TieredCacheTests(SimpleTestCase):
+    """Two TieredCache instances over one L2 stand in for two workers."""
+
+    def test_writes_reach_other_workers_within_local_ttl(self):
+        a, b = TieredCache(local_ttl=0.05), TieredCache(local_ttl=0.05)
+        a.set("room", "lobby", 60)
+        self.assertEqual(b.get("room"), "lobby")
+        a.set("room", "running", 60)
+        self.assertEqual(a.get("room"), "running")   # own writes are immediate
+        self.assertEqual(b.get("room"), "lobby")     # b trusts its L1 copy briefly
+        time.sleep(0.06)
+        self.assertEqual(b.get("room"), "running")
+
+    def test_bump_moves_every_worker_to_a_new_version(self):
+        a, b = TieredCache(local_ttl=0.05), TieredCache(local_ttl=0.05)
+        before = b.version("quiz:1:questions", 60)
+        self.assertEqual(a.version("quiz:1:questions", 60), before)
+        after = a.bump("quiz:1:questions", 60)
+        self.assertNotEqual(after, before)
+        time.sleep(0.06)
+        self.assertEqual(b.version("quiz:1:questions", 60), after)
+
+    def test_local_tier_is_bounded(self):
+        tier = TieredCache(local_ttl=60, local_max=3)
+        for i in range(10):
+            tier.set(f"k{i}", i, 60)
+        self.assertEqual(list(tier._local), ["k7", "k8", "k9"])
+        self.assertEqual(tier.get("k0"), 0)   # still served from L2
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    def test_freed_slots_go_round_robin_across_users(self):
+        async def scenario():
+            controller = AdmissionController(capacity=2, per_user=2, user_queue=2, max_queue=10)
+            await controller.acquire("a", 1)
+            await controller.acquire("a", 1)
+            admitted = []
+
+            async def wait(user, name):
+                await controller.acquire(user, 1)
+                admitted.append(name)
+
+            tasks = [asyncio.create_task(wait("a", "a1"))]
+            await asyncio.sleep(0)
+            tasks.append(asyncio.create_task(wait("a", "a2")))
+            await asyncio.sleep(0)
+            tasks.append(asyncio.create_task(wait("b", "b1")))
+            await asyncio.sleep(0)
+            for _ in tasks:
+                controller.release("a")
+                await asyncio.sleep(0.01)
+            await asyncio.gather(*tasks)
+            return admitted
+
+        # Plain FIFO would admit a1, a2, b1: user a's backlog would starve b.
+        self.assertEqual(asyncio.run(scenario()), ["a1", "b1", "a2"])
+
+    def test_full_queues_reject_with_retry_after(self):
+        async def scenario():
+            controller = AdmissionController(capacity=1, per_user=1, user_queue=1, max_queue=2)
+            await controller.acquire("a", 1)
+            waiting = [asyncio.create_task(controller.acquire("a", 1)),
+                       asyncio.create_task(controller.acquire("b", 1))]
+            await asyncio.sleep(0)
+            errors = []
+            for user in ("a", "c"):
+                try:
+                    await controller.acquire(user, 1)
+                except Rejected as e:
+                    errors.append((e.status, e.reason, e.retry_after >= 1))
+            for task in waiting:
+                task.cancel()
+            await asyncio.gather(*waiting, return_exceptions=True)
+            return errors, controller._queued
+
+        errors, queued = asyncio.run(scenario())
+        self.assertEqual(errors, [(429, "user_queue_full", True), (503, "queue_full", True)])
+        self.assertEqual(queued, 0)
+
+    def test_timed_out_waiter_leaves_the_queue(self):
+        async def scenario():
+            controller = AdmissionController(capacity=1, per_user=1, user_queue=2, max_queue=2)
+            await controller.acquire("a", 1)
+            with self.assertRaises(asyncio.TimeoutError):
+                await controller.acquire("b", 0.01)
+            controller.release("a")
+            return controller._queued, controller._active
+
+        self.assertEqual(asyncio.run(scenario()), (0, 0))
+
+
+class RateLimitTests(SimpleTestCase):
+    def test_file_cache_limit_holds_under_concurrent_requests(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        file_cache = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                                  "LOCATION": location}}
+
+        async def burst():
+            return await asyncio.gather(*(check_rate("user:1") for _ in range(20)), return_exceptions=True)
+
+        lock_file = os.path.join(location, "locks", "ratelimit.lock")
+        with override_settings(CACHES=file_cache, LLM_USER_RATE_LIMIT=5, LLM_USER_RATE_WINDOW=10 ** 9,
+                               RATE_LIMIT_LOCK_FILE=lock_file):
+            results = asyncio.run(burst())
+        self.assertTrue(os.path.exists(lock_file))
+        rejected = [r for r in results if isinstance(r, Rejected)]
+        self.assertEqual(len(rejected), 15)
+        self.assertEqual(results.count(None), 5)
+
+
+@override_settings(LLM_USER_RATE_LIMIT=2, LLM_USER_RATE_WINDOW=60)
+class AdmissionViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.vector_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.vector_dir, ignore_errors=True)
+        self.client.force_login(CustomUser.objects.create_user("hammer"))
+
+    def test_rate_limited_user_gets_429_with_retry_after(self):
+        url = reverse("ask_doubt")
+        with override_settings(VECTORSTORE_DIR=self.vector_dir, VECTORSTORE_LEGACY_DIR=""):
+            responses = [self.client.post(url, {"question": "why?"}) for _ in range(3)]
+        self.assertEqual([r.status_code for r in responses], [200, 200, 429])
+        self.assertTrue(1 <= int(responses[2]["Retry-After"]) <= 60)
+        self.assertIn("answer", responses[2].json())
+
+        # Another user has their own budget.
+        self.client.force_login(CustomUser.objects.create_user("patient"))
+        with override_settings(VECTORSTORE_DIR=self.vector_dir, VECTORSTORE_LEGACY_DIR=""):
+            self.assertEqual(self.client.post(url, {"question": "why?"}).status_code, 200)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        override = override_settings(METRICS_DIR=self.dir, METRICS_TOKEN="")
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _snapshot(self, name, count, age=0):
+        path = os.path.join(self.dir, name)
+        with open(path, "w") as fh:
+            json.dump({"counters": [["study_test_total", [], count]],
+                       "gauges": [["study_test_gauge", [], 1]], "histograms": []}, fh)
+        os.utime(path, (time.time() - age, time.time() - age))
+        return path
+
+    def test_access_is_denied_by_default(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.client.force_login(CustomUser.objects.create_user("student"))
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.client.force_login(CustomUser.objects.create_user("ops", is_staff=True))
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+    def test_bearer_token_when_configured(self):
+        with override_settings(METRICS_TOKEN="s3cret"):
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200)
+
+    def test_server_timing_header_only_when_enabled(self):
+        self.assertNotIn("Server-Timing", self.client.get("/metrics"))
+        with override_settings(SERVER_TIMING=True):
+            self.assertIn("total;dur=", self.client.get("/metrics")["Server-Timing"])
+
+    def test_idle_workers_keep_and_exited_workers_fold_their_counts(self):
+        idle = self._snapshot(f"{os.getpid()}-idle.json", 5, age=2 * 24 * 3600)
+        dead = self._snapshot("999999999-dead.json", 7)
+        counters, _ = metrics._collect()
+        self.assertEqual(counters[("study_test_total", ())], 12)
+        self.assertEqual(counters[("study_test_gauge", ())], 1)   # the dead worker's gauge is gone
+        self.assertTrue(os.path.exists(idle))
+        self.assertFalse(os.path.exists(dead))
+
+        # The folded total persists across scrapes and keeps growing.
+        self._snapshot("999999998-dead.json", 3)
+        counters, _ = metrics._collect()
+        self.assertEqual(counters[("study_test_total", ())], 15)
+
+    def test_unforced_flush_writes_in_the_background(self):
+        metrics.inc("study_test_total")
+        metrics.flush()
+        path = os.path.join(self.dir, f"{os.getpid()}-{metrics._token}.json")
+        deadline = time.monotonic() + 5
+        while not os.path.exists(path) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(os.path.exists(path))
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        override = override_settings(PROFILING_DIR=self.dir, PROFILING_SAMPLE_RATE=1.0, PROFILING_SLOW_MS=0)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _reports(self):
+        return [n for n in os.listdir(self.dir) if n.endswith(".txt")]
+
+    def test_reports_are_staff_only(self):
+        with open(os.path.join(self.dir, "20260101-000000-000000-metrics-1ms.txt"), "w") as fh:
+            fh.write("report")
+        detail = reverse("profile_detail", args=["20260101-000000-000000-metrics-1ms.txt"])
+        for user in (None, CustomUser.objects.create_user("student")):
+            if user is not None:
+                self.client.force_login(user)
+            for url in (reverse("profiles"), detail):
+                self.assertIn(self.client.get(url).status_code, (302, 403))
+        self.client.force_login(CustomUser.objects.create_user("ops", is_staff=True))
+        self.assertEqual(self.client.get(reverse("profiles")).status_code, 200)
+        self.assertEqual(self.client.get(detail).content, b"report")
+
+    def test_detail_rejects_names_outside_the_profile_dir(self):
+        fd, secret = tempfile.mkstemp(suffix=".txt", dir=os.path.dirname(self.dir))
+        os.close(fd)
+        self.addCleanup(os.remove, secret)
+        outside = "../" + os.path.basename(secret)
+        request = RequestFactory().get("/profiles/x")
+        request.user = CustomUser.objects.create_user("ops", is_staff=True)
+        for name in (outside, secret, "..", "report.py"):
+            with self.assertRaises(Http404):
+                profiling.profile_detail_view(request, name)
+        self.client.force_login(request.user)
+        self.assertEqual(self.client.get("/profiles/" + outside.replace("/", "%2F")).status_code, 404)
+
+    def test_middleware_writes_reports_only_when_enabled(self):
+        with override_settings(PROFILING_ENABLED=False):
+            self.client.get("/metrics")
+        self.assertEqual(self._reports(), [])
+
+        with override_settings(PROFILING_ENABLED=True):
+            self.client.get("/metrics")
+        reports = self._reports()
+        self.assertEqual(len(reports), 1)
+        with open(os.path.join(self.dir, reports[0])) as fh:
+            body = fh.read()
+        self.assertIn("GET /metrics", body)
+        self.assertIn("reason: sampled", body)
+
+        with override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0.0):
+            self.client.get("/metrics")
+        self.assertEqual(len(self._reports()), 1)
+
+
+class CompactionTests(SimpleTestCase):
+    def test_html_becomes_compact_structured_text(self):
+        html = """
+            <html><head><style>h2 { color: red }</style></head><body>
+            <h2 class="title" style="margin:0">Thermo   dynamics</h2>
+            <p>The first law
+               states <strong>energy</strong> is conserved.</p>
+            <ul><li>Closed system<ul><li>no mass transfer</li></ul></li><li>Open system</li></ul>
+            <table><tr><th>Law</th><th>Statement</th></tr><tr><td>Zeroth</td><td>Equilibrium</td></tr></table>
+            <!-- draft --><script>track()</script></body></html>
+        """
+        self.assertEqual(compaction.html_to_text(html), (
+            "## Thermo dynamics\n\n"
+            "The first law states energy is conserved.\n\n"
+            "- Closed system\n  - no mass transfer\n- Open system\n\n"
+            "Law | Statement\nZeroth | Equilibrium"
+        ))
+
+    def test_repeated_page_furniture_is_removed(self):
+        pages = [
+            f"Physics 101 - Lecture Notes\n{n * 2}  CHAPTER 1. INTRODUCTION\nSection {n}: Entropy\n"
+            f"Entropy of part {n} increases.\nHeat flows from hot to cold in case {n}.\n"
+            f"Page {n} of 4\nConfidential - do not distribute"
+            for n in range(1, 5)
+        ]
+        cleaned = compaction.strip_page_furniture(pages)
+        self.assertEqual(cleaned[1], "Section 2: Entropy\nEntropy of part 2 increases.\nHeat flows from hot to cold in case 2.")
+        # A single page has nothing to compare against; only bare page numbers go.
+        self.assertEqual(compaction.strip_page_furniture(["Header\nBody\n7"]), ["Header\nBody"])
+
+    def test_compaction_reports_tokens_saved(self):
+        result = compaction.compact_html("<div class='note' id='n1'>\n\n  <p>Short   note</p>\n</div>", source="test")
+        self.assertEqual(result.text, "Short note")
+        self.assertGreater(result.tokens_saved, 0)
+        self.assertEqual(result.tokens_after, compaction.estimate_tokens("Short note"))
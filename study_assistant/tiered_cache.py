@@ -0,0 +1,107 @@
+"""
+Two-tier cache: a small per-process L1 in front of the shared Django cache.
+
+L2 is settings.CACHES[alias] (Redis when REDIS_URL is set, else a file cache),
+shared by every worker on the host. L1 is a bounded LRU dict in this process
+whose entries expire after `local_ttl` seconds, so a hot key costs one L2 read
+per worker per `local_ttl` and a write becomes visible to the other workers
+within that bound. The writing worker sees its own writes immediately.
+
+Values that can change should live under versioned keys:
+
+    version = tier.version("quiz:1:questions", ttl)      # short-TTL L1 read
+    key = f"quiz:1:questions:{version}"                  # immutable value
+    ...
+    tier.bump("quiz:1:questions", ttl)                   # invalidate everywhere
+
+The value under a versioned key never changes, so it can sit in a long-TTL L1
+(its own TieredCache) while invalidation only has to propagate the version.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+_MISSING = object()
+
+
+class TieredCache:
+    def __init__(self, alias="default", local_ttl=1.0, local_max=1024):
+        self.alias = alias
+        self.local_ttl = local_ttl
+        self.local_max = local_max
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        # Looked up per call so override_settings(CACHES=...) takes effect.
+        return caches[self.alias]
+
+    # -----------------------------
+    # L1
+    # -----------------------------
+    def _get_local(self, key):
+        with self._lock:
+            hit = self._local.get(key)
+            if hit is None:
+                return _MISSING
+            if hit[0] <= time.monotonic():
+                del self._local[key]
+                return _MISSING
+            self._local.move_to_end(key)
+            return hit[1]
+
+    def _set_local(self, key, value):
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.local_ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_max:
+                self._local.popitem(last=False)
+
+    def forget_local(self, key):
+        with self._lock:
+            self._local.pop(key, None)
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+    # -----------------------------
+    # Cache API
+    # -----------------------------
+    def get(self, key, default=None):
+        value = self._get_local(key)
+        if value is not _MISSING:
+            return value
+        value = self.shared.get(key, _MISSING)
+        if value is _MISSING:
+            return default
+        self._set_local(key, value)
+        return value
+
+    def set(self, key, value, timeout):
+        self.shared.set(key, value, timeout)
+        self._set_local(key, value)
+
+    def delete(self, key):
+        self.shared.delete(key)
+        self.forget_local(key)
+
+    def version(self, name, timeout):
+        """Current version of `name`; a fresh one is minted if L2 lost it."""
+        key = f"{name}:version"
+        version = self.get(key)
+        if version is None:
+            version = time.time_ns()
+            if not self.shared.add(key, version, timeout):
+                version = self.shared.get(key, version)
+            self._set_local(key, version)
+        return version
+
+    def bump(self, name, timeout):
+        """Move `name` to a new version; other workers follow within local_ttl."""
+        version = time.time_ns()
+        self.set(f"{name}:version", version, timeout)
+        return version
@@ -5,6 +5,9 @@ from django.views.generic import TemplateView
 from django.conf import settings
 from django.conf.urls.static import static
 
+from .metrics import metrics_view
+from .profiling import profile_detail_view, profiles_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('users.urls')),
@@ -12,6 +15,9 @@ urlpatterns = [
     path('notes/', include('notes.urls')),
     path('quizzes/', include('quizzes.urls')),
     path('generate-quiz/', include('generate_quiz.urls')),
+    path('metrics', metrics_view, name='metrics'),
+    path('profiles/', profiles_view, name='profiles'),
+    path('profiles/<str:name>', profile_detail_view, name='profile_detail'),
 ]
 
 if settings.DEBUG:
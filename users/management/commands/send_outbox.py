@@ -0,0 +1,39 @@
+"""
+Send queued outbox email (users/outbox.py) and purge sent and failed rows
+older than EMAIL_OUTBOX_RETENTION_DAYS. Useful with
+EMAIL_OUTBOX_BACKGROUND=False, or from cron to pick up retries:
+
+    python manage.py send_outbox
+    python manage.py send_outbox --loop --interval 5 --batch 100
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from users.outbox import purge, send_all_due
+
+
+class Command(BaseCommand):
+    help = "Send due emails from the outbox over one SMTP connection per batch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=None,
+                            help="Emails per SMTP connection (default: EMAIL_OUTBOX_BATCH).")
+        parser.add_argument("--loop", action="store_true", help="Keep polling instead of exiting.")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds between polls with --loop.")
+        parser.add_argument("--retention-days", type=int, default=None,
+                            help="Delete sent/failed rows older than this (default: EMAIL_OUTBOX_RETENTION_DAYS).")
+
+    def handle(self, *args, **opts):
+        retention = timedelta(days=opts["retention_days"]) if opts["retention_days"] is not None else None
+        purged = purge(retention)
+        if purged:
+            self.stdout.write(f"Purged {purged} old email(s).")
+        while True:
+            sent, failed = send_all_due(opts["batch"])
+            if sent or failed or not opts["loop"]:
+                self.stdout.write(self.style.SUCCESS(f"Sent {sent} email(s), {failed} failed."))
+            if not opts["loop"]:
+                return
+            time.sleep(opts["interval"])
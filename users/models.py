@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 class CustomUser(AbstractUser):
     is_verified = models.BooleanField(default=False)
@@ -9,3 +10,30 @@ class CustomUser(AbstractUser):
         return self.username
 
 
+class OutboxEmail(models.Model):
+    """An email waiting to be sent by the outbox sender (users/outbox.py)."""
+    PENDING, SENT, FAILED = "pending", "sent", "failed"
+
+    to = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(
+        max_length=10,
+        choices=[(PENDING, "Pending"), (SENT, "Sent"), (FAILED, "Failed")],
+        default=PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Due time for pending mail; while a sender holds the row it is the lease expiry.
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} → {self.to} ({self.status})"
@@ -0,0 +1,219 @@
+"""
+Database-backed outbox for transactional email (signup OTPs).
+
+Views call enqueue(), which inserts an OutboxEmail row and returns at once, so
+request latency no longer depends on the SMTP server. send_due() drains due
+rows in batches over one SMTP connection that stays open for the whole batch:
+
+  - rows are claimed with a single UPDATE that stamps a claim token and a
+    lease (CLAIM_LEASE), so several workers can drain the same outbox without
+    sending a message twice; a sender that dies mid-batch only delays its rows
+  - a failed send is retried with exponential backoff (EMAIL_OUTBOX_RETRY_BASE
+    seconds, doubling, capped at MAX_BACKOFF) up to EMAIL_OUTBOX_MAX_ATTEMPTS,
+    then marked failed; a dropped connection is reopened once per message
+  - the body (it holds the OTP) is cleared once a row is sent or given up on,
+    and purge() deletes sent and failed rows after EMAIL_OUTBOX_RETENTION_DAYS
+
+Two drivers call send_due(): a background thread in each web worker
+(EMAIL_OUTBOX_BACKGROUND), woken when an enqueue commits and polling every
+IDLE_POLL seconds for retries; and `manage.py send_outbox` for cron or a
+dedicated process. Both also purge old rows. The ASGI/WSGI entry points call
+drain_on_first_request(), so a restarted worker starts its thread, and sends
+whatever was left pending, on its first request rather than its first enqueue.
+"""
+import logging
+import os
+import random
+import smtplib
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.signals import request_started
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+CLAIM_LEASE = timedelta(minutes=5)
+MAX_BACKOFF = timedelta(hours=1)
+IDLE_POLL = 60.0   # seconds the background sender sleeps when nothing is due
+PURGE_INTERVAL = 3600.0   # seconds between purges by the background sender
+
+
+def enqueue(to, subject, body):
+    """Queue one email; it is sent after the current transaction commits."""
+    email = OutboxEmail.objects.create(to=to, subject=subject, body=body)
+    if settings.EMAIL_OUTBOX_BACKGROUND:
+        transaction.on_commit(_sender.wake)
+    return email
+
+
+def _backoff(attempts):
+    delay = timedelta(seconds=settings.EMAIL_OUTBOX_RETRY_BASE * 2 ** (attempts - 1))
+    return min(delay, MAX_BACKOFF) * random.uniform(0.8, 1.2)
+
+
+def _claim(batch_size):
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    due = (
+        OutboxEmail.objects.filter(status=OutboxEmail.PENDING, next_attempt_at__lte=now)
+        .order_by("next_attempt_at").values_list("pk", flat=True)[:batch_size]
+    )
+    # The status/due filter is re-checked inside the UPDATE, so a row another
+    # sender claimed in the meantime is left alone.
+    OutboxEmail.objects.filter(
+        pk__in=list(due), status=OutboxEmail.PENDING, next_attempt_at__lte=now,
+    ).update(claim=token, next_attempt_at=now + CLAIM_LEASE)
+    return list(OutboxEmail.objects.filter(claim=token).order_by("pk"))
+
+
+def _send_one(connection, email):
+    message = EmailMessage(
+        subject=email.subject, body=email.body,
+        from_email=settings.EMAIL_HOST_USER, to=[email.to], connection=connection,
+    )
+    try:
+        connection.send_messages([message])
+    except smtplib.SMTPServerDisconnected:
+        # The server dropped an idle or long-lived connection; reconnect once.
+        connection.close()
+        connection.open()
+        connection.send_messages([message])
+
+
+def _record_failure(email, error):
+    email.claim = ""
+    email.attempts += 1
+    email.last_error = f"{type(error).__name__}: {error}"[:2000]
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = OutboxEmail.FAILED
+        email.body = ""
+        logger.error("Giving up on email %s to %s: %s", email.pk, email.to, email.last_error)
+    else:
+        email.next_attempt_at = timezone.now() + _backoff(email.attempts)
+
+
+def send_due(batch_size=None):
+    """Send one batch of due emails over a single connection. Returns (sent, failed)."""
+    batch = _claim(batch_size or settings.EMAIL_OUTBOX_BATCH)
+    if not batch:
+        return 0, 0
+
+    sent = failed = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+        for email in batch:
+            try:
+                _send_one(connection, email)
+            except Exception as e:
+                _record_failure(email, e)
+                failed += 1
+            else:
+                email.claim = ""
+                email.attempts += 1
+                email.status = OutboxEmail.SENT
+                email.sent_at = timezone.now()
+                email.body = ""   # the OTP has no business outliving delivery
+                sent += 1
+    except Exception as e:
+        # Lost the server entirely: every row not yet handled is retried later.
+        logger.warning("Email outbox could not reach the mail server: %s", e)
+        for email in batch:
+            if email.claim:
+                _record_failure(email, e)
+                failed += 1
+    finally:
+        try:
+            connection.close()
+        finally:
+            OutboxEmail.objects.bulk_update(
+                batch, ["status", "attempts", "next_attempt_at", "claim", "last_error", "sent_at", "body"],
+            )
+    return sent, failed
+
+
+def send_all_due(batch_size=None):
+    """Drain everything due right now. Returns (sent, failed)."""
+    total_sent = total_failed = 0
+    while True:
+        sent, failed = send_due(batch_size)
+        total_sent += sent
+        total_failed += failed
+        if not sent and not failed:
+            return total_sent, total_failed
+
+
+def purge(retention=None):
+    """Delete sent and failed rows older than `retention` (default EMAIL_OUTBOX_RETENTION_DAYS). Returns the count."""
+    if retention is None:
+        retention = timedelta(days=settings.EMAIL_OUTBOX_RETENTION_DAYS)
+    deleted, _ = OutboxEmail.objects.filter(
+        status__in=(OutboxEmail.SENT, OutboxEmail.FAILED),
+        created_at__lt=timezone.now() - retention,
+    ).delete()
+    return deleted
+
+
+class OutboxSender:
+    """Per-process background thread that drains the outbox when woken."""
+
+    def __init__(self):
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+
+    def wake(self):
+        self._ensure_thread()
+        self._wake.set()
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+
+    def _ensure_thread(self):
+        # Threads don't survive a fork (gunicorn --preload), so track the owner pid.
+        with self._lock:
+            if self.running():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="email-outbox-sender", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(IDLE_POLL)
+            self._wake.clear()
+            close_old_connections()
+            try:
+                send_all_due()
+                if time.monotonic() - self._purged_at >= PURGE_INTERVAL:
+                    purge()
+                    self._purged_at = time.monotonic()
+            except Exception:
+                logger.exception("Email outbox sender failed")
+
+
+_sender = OutboxSender()
+
+
+def _start_sender(**kwargs):
+    if settings.EMAIL_OUTBOX_BACKGROUND and not _sender.running():
+        _sender.wake()
+
+
+def drain_on_first_request():
+    """
+    Start this worker's sender with its first request. Called from the server
+    entry points only, after any fork, so tests and management commands don't
+    get a background thread.
+    """
+    request_started.connect(_start_sender, dispatch_uid="users.outbox.start_sender")
@@ -1,3 +1,128 @@
-from django.test import TestCase
+import smtplib
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.signals import request_started
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import outbox
+from .models import OutboxEmail
+
+
+class CountingBackend(EmailBackend):
+    """locmem backend that counts connections and can be told to fail sends."""
+    opened = 0
+    fail_for = set()
+
+    def open(self):
+        CountingBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        if any(to in self.fail_for for m in messages for to in m.to):
+            raise smtplib.SMTPRecipientsRefused({})
+        return super().send_messages(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND="users.tests.CountingBackend",
+    EMAIL_OUTBOX_BACKGROUND=False,
+    EMAIL_OUTBOX_MAX_ATTEMPTS=3,
+    EMAIL_OUTBOX_RETRY_BASE=30,
+)
+class OutboxTests(TestCase):
+    def setUp(self):
+        CountingBackend.opened = 0
+        CountingBackend.fail_for = set()
+
+    def test_signup_queues_otp_without_sending(self):
+        response = self.client.post(reverse("signup"), {
+            "username": "alice", "email": "alice@example.com",
+            "password1": "a-long-Passw0rd", "password2": "a-long-Passw0rd",
+        })
+        self.assertRedirects(response, reverse("verify_otp"))
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutboxEmail.objects.get()
+        self.assertEqual(queued.to, "alice@example.com")
+        self.assertIn(self.client.session["signup_otp"], queued.body)
+
+        self.assertEqual(outbox.send_all_due(), (1, 0))
+        self.assertEqual(mail.outbox[0].to, ["alice@example.com"])
+
+    def test_batch_shares_one_connection(self):
+        for i in range(5):
+            outbox.enqueue(f"user{i}@example.com", "OTP", "123456")
+        self.assertEqual(outbox.send_due(batch_size=10), (5, 0))
+        self.assertEqual(CountingBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(OutboxEmail.objects.exclude(status=OutboxEmail.SENT).exists())
+        self.assertEqual(outbox.send_due(), (0, 0))
+
+    def test_failure_is_retried_with_backoff_then_given_up(self):
+        CountingBackend.fail_for = {"bad@example.com"}
+        outbox.enqueue("bad@example.com", "OTP", "1")
+        outbox.enqueue("good@example.com", "OTP", "2")
+
+        self.assertEqual(outbox.send_due(), (1, 1))
+        bad = OutboxEmail.objects.get(to="bad@example.com")
+        self.assertEqual((bad.status, bad.attempts, bad.claim), (OutboxEmail.PENDING, 1, ""))
+        self.assertGreater(bad.next_attempt_at, timezone.now() + timedelta(seconds=20))
+        self.assertIn("SMTPRecipientsRefused", bad.last_error)
+        # Not due yet, so nothing is claimed.
+        self.assertEqual(outbox.send_due(), (0, 0))
+
+        for attempt in (2, 3):
+            OutboxEmail.objects.filter(pk=bad.pk).update(next_attempt_at=timezone.now())
+            self.assertEqual(outbox.send_due(), (0, 1))
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), (OutboxEmail.FAILED, 3))
+        OutboxEmail.objects.filter(pk=bad.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.send_due(), (0, 0))
+
+    def test_claimed_rows_are_skipped_until_the_lease_expires(self):
+        email = outbox.enqueue("a@example.com", "OTP", "1")
+        self.assertEqual(len(outbox._claim(10)), 1)
+        self.assertEqual(outbox._claim(10), [])
+        OutboxEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.send_due(), (1, 0))
+
+    def test_body_is_cleared_once_sent_or_given_up(self):
+        CountingBackend.fail_for = {"bad@example.com"}
+        outbox.enqueue("good@example.com", "OTP", "Your code is 123456")
+        outbox.enqueue("bad@example.com", "OTP", "Your code is 654321")
+        with self.settings(EMAIL_OUTBOX_MAX_ATTEMPTS=1):
+            self.assertEqual(outbox.send_due(), (1, 1))
+        self.assertIn("123456", mail.outbox[0].body)
+        self.assertEqual(
+            dict(OutboxEmail.objects.values_list("status", "body")),
+            {OutboxEmail.SENT: "", OutboxEmail.FAILED: ""},
+        )
+
+    def test_purge_deletes_old_finished_rows_only(self):
+        old = timezone.now() - timedelta(days=30)
+        for status in (OutboxEmail.SENT, OutboxEmail.FAILED, OutboxEmail.PENDING):
+            email = OutboxEmail.objects.create(to=f"{status}@example.com", subject="OTP", body="", status=status)
+            OutboxEmail.objects.filter(pk=email.pk).update(created_at=old)
+        OutboxEmail.objects.create(to="recent@example.com", subject="OTP", body="", status=OutboxEmail.SENT)
+        with self.settings(EMAIL_OUTBOX_RETENTION_DAYS=7):
+            self.assertEqual(outbox.purge(), 2)
+        self.assertEqual(
+            sorted(OutboxEmail.objects.values_list("to", flat=True)),
+            ["pending@example.com", "recent@example.com"],
+        )
+
+    def test_first_request_starts_the_sender(self):
+        outbox.drain_on_first_request()
+        self.addCleanup(request_started.disconnect, dispatch_uid="users.outbox.start_sender")
+        with mock.patch.object(outbox._sender, "running", return_value=False), \
+                mock.patch.object(outbox._sender, "wake") as wake:
+            with self.settings(EMAIL_OUTBOX_BACKGROUND=True):
+                self.client.get(reverse("login"))
+            self.assertTrue(wake.called)
+            wake.reset_mock()
+            self.client.get(reverse("login"))   # EMAIL_OUTBOX_BACKGROUND=False
+            wake.assert_not_called()
@@ -2,8 +2,7 @@ import random
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, logout
 from django.contrib.auth.views import LoginView
-from django.core.mail import send_mail
-from django.conf import settings
+from . import outbox
 from .models import CustomUser
 from .forms import SignUpForm, OTPForm
 from django.contrib.auth.decorators import login_required
@@ -26,12 +25,11 @@ def signup_view(request):
             otp = str(random.randint(100000, 999999))
             request.session['signup_otp'] = otp
 
-            # Send OTP email
-            send_mail(
+            # Queue the OTP email; the outbox sender delivers it off the request path
+            outbox.enqueue(
+                to=form.cleaned_data['email'],
                 subject="Your StudyAssistant OTP",
-                message=f"Your OTP is {otp}",
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[form.cleaned_data['email']],
+                body=f"Your OTP is {otp}",
             )
 
             return redirect('verify_otp')